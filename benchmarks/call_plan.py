@@ -0,0 +1,46 @@
+"""
+Per-call dispatch overhead: introspecting the RPC function on every call (what `__get_result` used to do) against
+calling through the `CallPlan` built at registration time.
+"""
+from common import per_call, setup_django
+
+setup_django()
+
+from channels_jsonrpc.jsonrpcconsumer import CallPlan, getfullargspec, keywords_args  # noqa: E402
+
+
+def method(a, b, **kwargs):
+    return a
+
+
+def get_result(method, params, original_msg):
+    func_args = getattr(getfullargspec(method), keywords_args)
+
+    if func_args and "kwargs" in func_args:
+        if isinstance(params, list):
+            result = method(*params, original_message=original_msg)
+        else:
+            result = method(original_message=original_msg, **params)
+    else:
+        if isinstance(params, list):
+            result = method(*params)
+        else:
+            result = method(**params)
+
+    return result
+
+
+def main():
+    plan = CallPlan(method)
+    params = [1, 2]
+    baseline = per_call(lambda: method(1, 2, original_message=None))
+    before = per_call(lambda: get_result(method, params, None))
+    after = per_call(lambda: plan(params, None))
+
+    print("direct call:           %.3f us" % baseline)
+    print("getfullargspec/call:   %.3f us (+%.3f us)" % (before, before - baseline))
+    print("CallPlan:              %.3f us (+%.3f us)" % (after, after - baseline))
+
+
+if __name__ == '__main__':
+    main()
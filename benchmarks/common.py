@@ -0,0 +1,38 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks run against the example project settings (in-memory channel layer), run them from the repository
+root, e.g.::
+
+    python benchmarks/call_plan.py
+"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """
+    Make the package and the example project importable and configure Django
+    :return: None
+    """
+    for path in (ROOT, os.path.join(ROOT, 'example')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_example.settings')
+
+    import django
+    django.setup()
+
+
+def per_call(stmt, number=100000, repeat=5):
+    """
+    Time a callable
+    :param callable stmt: code to time
+    :param int number: calls per measurement
+    :param int repeat: number of measurements
+    :return: best time per call, in microseconds
+    """
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number * 1e6
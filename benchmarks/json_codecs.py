@@ -0,0 +1,43 @@
+"""
+Encoding and decoding cost of the JSON codecs available to the consumers, on representative JSON-RPC frames.
+Codecs that aren't installed are skipped.
+"""
+from datetime import datetime
+
+from common import per_call, setup_django
+
+setup_django()
+
+from django.core.serializers.json import DjangoJSONEncoder  # noqa: E402
+
+from channels_jsonrpc.jsoncodecs import codecs, get_codec, preferred_codecs  # noqa: E402
+from channels_jsonrpc.jsonrpcconsumer import JsonRpcConsumer  # noqa: E402
+
+payloads = {
+    'small call': (JsonRpcConsumer.json_rpc_frame(_id=1, method='ping', params={'value': 12}), None),
+    'rows x1000': (JsonRpcConsumer.json_rpc_frame(_id=1, result=[
+        {'id': i, 'name': 'row %s' % i, 'price': i * 1.5, 'tags': ['a', 'b'], 'active': True}
+        for i in range(1000)]), None),
+    'numbers x10000': (JsonRpcConsumer.json_rpc_frame(_id=1, result=[i * 0.25 for i in range(10000)]), None),
+    'dates x1000 (DjangoJSONEncoder)': (JsonRpcConsumer.json_rpc_frame(_id=1, result=[
+        {'id': i, 'at': datetime(2017, 1, 1, 12, 0, i % 60)} for i in range(1000)]), DjangoJSONEncoder),
+}
+
+
+def main():
+    available = [name for name in preferred_codecs if codecs[name].is_available()]
+    print("%-34s %-10s %12s %12s %12s" % ('payload', 'codec', 'dumps (us)', 'bytes (us)', 'loads (us)'))
+    for label, (payload, encoder_class) in payloads.items():
+        for name in available:
+            codec = get_codec(name, encoder_class)
+            encoded = codec.dumps_bytes(payload)
+            number = max(10, 20000 // max(1, len(encoded) // 100))
+            dumps = per_call(lambda: codec.dumps(payload), number=number)
+            dumps_bytes = per_call(lambda: codec.dumps_bytes(payload), number=number)
+            source = encoded if codec.accepts_bytes else encoded.decode('utf-8')
+            loads = per_call(lambda: codec.loads(source), number=number)
+            print("%-34s %-10s %12.1f %12.1f %12.1f" % (label, name, dumps, dumps_bytes, loads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Per-call overhead of the params validators compiled by `rpc_method(params_schema=...)`, against calling without
+validation.
+"""
+from common import per_call, setup_django
+
+setup_django()
+
+from channels_jsonrpc.jsonrpcconsumer import CallPlan  # noqa: E402
+from channels_jsonrpc.validation import compile_params_validator  # noqa: E402
+
+
+def method(name, count=1, tags=None):
+    return name
+
+
+SCHEMA = {
+    'name': {'type': 'string', 'minLength': 1},
+    'count': {'type': 'integer', 'minimum': 0},
+    'tags': {'type': 'array', 'items': {'type': 'string'}},
+}
+
+
+def main():
+    plan = CallPlan(method)
+    arity = compile_params_validator(plan)
+    schema = compile_params_validator(plan, SCHEMA)
+    positional = ['report', 3, ['a', 'b']]
+    named = {'name': 'report', 'count': 3, 'tags': ['a', 'b']}
+
+    for label, params in (('list params', positional), ('dict params', named)):
+        baseline = per_call(lambda: plan(params, None))
+        with_arity = per_call(lambda: (arity(params), plan(params, None)))
+        with_schema = per_call(lambda: (schema(params), plan(params, None)))
+        print("%s:" % label)
+        print("  no validation:       %.3f us" % baseline)
+        print("  signature only:      %.3f us (+%.3f us)" % (with_arity, with_arity - baseline))
+        print("  params_schema:       %.3f us (+%.3f us)" % (with_schema, with_schema - baseline))
+
+
+if __name__ == '__main__':
+    main()
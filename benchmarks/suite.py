@@ -0,0 +1,265 @@
+"""
+Load generation for the consumers, through the in-memory channel layer and `HttpClient`: each scenario sends a
+request, lets the consumer handle it and reads the response, as the functional tests do. The results (requests per
+second, p50/p99 latency, memory allocated per request) are printed as JSON, e.g.::
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --baseline before.json
+
+With `--baseline`, the scenarios whose throughput dropped by more than `--threshold` are reported and the script
+exits with status 1.
+"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime
+from timeit import default_timer as timer
+
+from common import setup_django
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+setup_django()
+
+import channels  # noqa: E402
+import django  # noqa: E402
+from channels import Group  # noqa: E402
+from channels.tests import HttpClient  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from django_example.consumer import DjangoJsonRpcWebsocketConsumerTest, MyJsonRpcWebsocketConsumerTest  # noqa: E402
+
+Consumer = MyJsonRpcWebsocketConsumerTest
+
+ROWS = [{'id': i, 'name': 'row %s' % i, 'price': i * 1.5, 'tags': ['a', 'b'], 'active': True} for i in range(1000)]
+DATES = [{'id': i, 'at': datetime(2017, 1, 1, 12, 0, i % 60)} for i in range(100)]
+
+
+@Consumer.rpc_method('bench.add')
+def add(a, b):
+    return a + b
+
+
+@Consumer.rpc_method('bench.rows')
+def rows(count):
+    return ROWS[:count]
+
+
+@Consumer.rpc_notification('bench.event')
+def event(value):
+    pass
+
+
+@DjangoJsonRpcWebsocketConsumerTest.rpc_method('bench.dates')
+def dates():
+    return DATES
+
+
+def request(method, params, _id=1):
+    frame = {'jsonrpc': '2.0', 'method': method, 'params': params}
+    if _id is not None:
+        frame['id'] = _id
+    return frame
+
+
+def websocket(frame, path='/'):
+    """
+    Scenario sending a frame in a WebSocket message and reading the response
+    """
+    client = HttpClient()
+    text = json.dumps(frame)
+    expects_response = not isinstance(frame, dict) or 'id' in frame
+
+    def run():
+        client.send_and_consume(u'websocket.receive', text=text, path=path)
+        if expects_response and client.receive(json=False) is None:
+            raise AssertionError('no response to %s' % text)
+    return run
+
+
+def http(frame):
+    """
+    Scenario POSTing a frame and reading the response
+    """
+    client = HttpClient()
+    body = json.dumps(frame).encode('utf-8')
+
+    def run():
+        client.send_and_consume(u'http.request', {'method': 'POST', 'body': body}, path='/')
+        if client.receive(json=False) is None:
+            raise AssertionError('no response to %s' % body)
+    return run
+
+
+def group_fan_out(size):
+    """
+    Scenario notifying a group of `size` WebSocket clients, each reading the notification
+    """
+    clients = [HttpClient() for _ in range(size)]
+    group_name = 'bench_fan_out_%s' % size
+    for client in clients:
+        Group(group_name).add(client.reply_channel)
+
+    def run():
+        Consumer.notify_group(group_name, 'bench.update', {'values': [1, 2, 3]})
+        for client in clients:
+            if client.receive(json=False) is None:
+                raise AssertionError('notification not received')
+    return run
+
+
+SCENARIOS = [
+    ('websocket call', lambda: websocket(request('bench.add', [1, 2]))),
+    ('websocket notification', lambda: websocket(request('bench.event', [1], _id=None))),
+    ('websocket batch x10', lambda: websocket([request('bench.add', [i, i], _id=i) for i in range(10)])),
+    ('websocket large result', lambda: websocket(request('bench.rows', [1000]))),
+    ('websocket large params', lambda: websocket(request('bench.add', [list(range(5000)), [1]]))),
+    ('websocket method not found', lambda: websocket(request('bench.missing', []))),
+    ('websocket invalid params', lambda: websocket(request('bench.add', [1, 2, 3]))),
+    ('websocket custom encoder', lambda: websocket(request('bench.dates', []), path='/django/')),
+    ('http call', lambda: http(request('bench.add', [1, 2]))),
+    ('http batch x10', lambda: http([request('bench.add', [i, i], _id=i) for i in range(10)])),
+    ('http large result', lambda: http(request('bench.rows', [1000]))),
+    ('group fan-out x100', lambda: group_fan_out(100)),
+]
+
+
+def percentile(values, fraction):
+    """
+    :param list values: sorted values
+    :param float fraction: between 0 and 1
+    :return: value below which `fraction` of the values are
+    """
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def measure_allocations(run, number):
+    """
+    Memory allocated by requests, traced with tracemalloc
+    :return: (mean peak of the memory allocated during a request, mean memory retained per request), in bytes, or
+             (None, None) without tracemalloc
+    """
+    if tracemalloc is None or not hasattr(tracemalloc, 'reset_peak'):
+        return None, None
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        peaks = 0
+        for _ in range(number):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            run()
+            peaks += tracemalloc.get_traced_memory()[1] - current
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return peaks // number, retained // number
+
+
+def run_scenario(factory, number, warmup):
+    """
+    Run a scenario
+    :param factory: function returning the callable sending one request
+    :param int number: number of measured requests
+    :param int warmup: number of requests sent before measuring
+    :return: dict
+    """
+    run = factory()
+    for _ in range(warmup):
+        run()
+
+    latencies = []
+    start = timer()
+    for _ in range(number):
+        request_start = timer()
+        run()
+        latencies.append(timer() - request_start)
+    elapsed = timer() - start
+
+    latencies.sort()
+    alloc_peak, retained = measure_allocations(run, max(1, number // 10))
+    return {
+        'requests': number,
+        'rps': round(number / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1e3, 4),
+        'p99_ms': round(percentile(latencies, 0.99) * 1e3, 4),
+        'alloc_peak_bytes': alloc_peak,
+        'retained_bytes': retained,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare the throughput of the scenarios with a baseline
+    :return: list of the names of the scenarios that regressed
+    """
+    regressions = []
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        change = result['rps'] / previous['rps'] - 1
+        result['rps_change'] = round(change, 3)
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=2000, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=200, help='requests sent before measuring')
+    parser.add_argument('-k', '--scenario', action='append', help='run the scenarios containing this text')
+    parser.add_argument('-o', '--output', help='write the results to this file')
+    parser.add_argument('--baseline', help='results to compare the throughput with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='throughput drop reported as a regression')
+    args = parser.parse_args(argv)
+
+    # the clients' sessions are stored in a throwaway database, as in the tests
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run_scenarios(args)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results['regressions'] = regressions
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return 1 if regressions else 0
+
+
+def run_scenarios(args):
+    """
+    Run the scenarios selected by the command line arguments
+    :return: dict
+    """
+    results = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'channels': channels.__version__,
+        'scenarios': {},
+    }
+    for name, factory in SCENARIOS:
+        if args.scenario and not any(text in name for text in args.scenario):
+            continue
+        scale = 10 if 'large' in name or 'fan-out' in name else 1
+        results['scenarios'][name] = run_scenario(factory, max(1, args.number // scale), args.warmup // scale)
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(main())
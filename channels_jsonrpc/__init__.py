@@ -1 +1,6 @@
-from .jsonrpcconsumer import JsonRpcConsumer, JsonRpcConsumerTest, JsonRpcException
+import sys
+
+from .jsonrpcconsumer import JsonRpcConsumer, JsonRpcConsumerTest, JsonRpcException, PreparedNotification
+
+if sys.version_info >= (3, 5):
+    from .asyncconsumer import AsyncJsonRpcConsumer
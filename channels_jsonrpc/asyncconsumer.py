@@ -0,0 +1,506 @@
+"""
+asyncio variant of JsonRpcConsumer (Python 3.5+).
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from timeit import default_timer as timer
+
+from channels.exceptions import RequestAborted, RequestTimeout
+from channels.handler import AsgiRequest
+from django.http import HttpResponse
+
+from .cache import NOT_CACHED
+from .executors import call_in_process
+from .jsonrpcconsumer import EncodedResult, Iterator, JsonRpcConsumer, JsonRpcException, StreamedResult, \
+    _call_sync, _executors_lock
+from .timeouts import CallTimeout, Deadline
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Returns the event loop shared by the consumers of the process. It runs forever in a daemon thread.
+    :return: asyncio.AbstractEventLoop
+    """
+    global _event_loop
+    if _event_loop is None:
+        with _event_loop_lock:
+            if _event_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='channels-jsonrpc-event-loop')
+                thread.daemon = True
+                thread.start()
+                _event_loop = loop
+    return _event_loop
+
+
+def run_coroutine(coro, loop=None, timeout=None):
+    """
+    Run a coroutine on an event loop running in another thread and wait for its result
+    :param coro: coroutine
+    :param loop: event loop, defaults to the shared one
+    :param float timeout: number of seconds after which the coroutine is cancelled, None for no limit
+    :return: result of the coroutine
+    :raise CallTimeout: if the coroutine was cancelled
+    """
+    if timeout is None:
+        return asyncio.run_coroutine_threadsafe(coro, loop or get_event_loop()).result()
+    return asyncio.run_coroutine_threadsafe(_wait_for(coro, timeout), loop or get_event_loop()).result()
+
+
+async def _wait_for(coro, timeout):
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        raise CallTimeout(timeout)
+
+
+async def coalesce(coalescer, key, coro_func, loop):
+    """
+    Execute a call on an event loop, or wait for the identical call being executed (see Coalescer.call())
+    :param channels_jsonrpc.coalescing.Coalescer coalescer: coalescer of the RPC method
+    :param str key: key of the call
+    :param coro_func: function returning the coroutine executing the call
+    :param loop: event loop processing the calls
+    :return: result of the coroutine
+    """
+    task = coalescer.tasks.get(key)
+    if task is None:
+        if coalescer.backend is None:
+            coalescer.executions += 1
+            task = asyncio.ensure_future(coro_func(), loop=loop)
+        else:
+            task = asyncio.ensure_future(_coalesce_shared(coalescer, key, coro_func, loop), loop=loop)
+        coalescer.tasks[key] = task
+        task.add_done_callback(lambda _task: coalescer.tasks.pop(key, None))
+    else:
+        coalescer.coalesced += 1
+    # a call giving up doesn't cancel the execution the others wait for
+    return await asyncio.shield(task)
+
+
+async def _coalesce_shared(coalescer, key, coro_func, loop):
+    """
+    Execute a call, or wait for its result from another worker. The cache is accessed from the default executor.
+    """
+    backend = coalescer.backend
+    # a waiting worker whose leader failed tries once to execute the call itself
+    for _attempt in range(2):
+        token, leader = await loop.run_in_executor(None, backend.acquire, key)
+        if leader:
+            coalescer.executions += 1
+            try:
+                result = await coro_func()
+            except Exception:
+                await loop.run_in_executor(None, backend.release, key, token)
+                raise
+            await loop.run_in_executor(None, backend.publish, key, token, result)
+            return result
+
+        result = await loop.run_in_executor(None, backend.wait, key, token)
+        if result is not NOT_CACHED:
+            coalescer.coalesced += 1
+            return result
+    coalescer.executions += 1
+    return await coro_func()
+
+
+async def idempotent_call(store, key, coro_func, loop):
+    """
+    Returns the stored result of a call, or executes it once on an event loop (see IdempotencyStore.call())
+    :param channels_jsonrpc.idempotency.IdempotencyStore store: idempotency store of the RPC method
+    :param str key: idempotency key
+    :param coro_func: function returning the coroutine computing the encoded result of the call
+    :param loop: event loop processing the calls
+    :return: encoded result
+    """
+    encoded_result = store.get(key)
+    if encoded_result is not NOT_CACHED:
+        store.replays += 1
+        return encoded_result
+
+    async def execute_once():
+        encoded_result = store.get(key)
+        if encoded_result is not NOT_CACHED:
+            store.replays += 1
+            return encoded_result
+        encoded_result = await coro_func()
+        store.set(key, encoded_result)
+        return encoded_result
+
+    return await coalesce(store.coalescer, key, execute_once, loop)
+
+
+class AsyncJsonRpcConsumer(JsonRpcConsumer):
+    """
+    Variant of JsonRpcConsumer processing the requests on an asyncio event loop.
+
+    RPC methods can be coroutine functions (`async def`), they are awaited. Synchronous RPC methods are run in an
+    executor so they don't block the loop. The handlers return as soon as the request is scheduled: requests sent
+    one after the other on a socket are processed concurrently, and answered as soon as they are done.
+
+    As the requests are processed after the handler returns, changes made to `original_message.channel_session`
+    are not saved.
+    """
+
+    # Event loop processing the requests. Defaults to a loop shared by the process, running in its own thread
+    event_loop = None
+
+    # Executor running the synchronous RPC methods. Defaults to a thread pool of `sync_max_workers` threads
+    sync_executor = None
+    sync_max_workers = None
+    _sync_executor = None
+
+    # Futures of the requests being processed, changed from the event loop thread: use _pending_lock
+    pending = set()
+    _pending_lock = threading.Lock()
+
+    @classmethod
+    def get_event_loop(cls):
+        """
+        Returns the event loop processing the requests
+        :return: asyncio.AbstractEventLoop
+        """
+        return cls.event_loop or get_event_loop()
+
+    @classmethod
+    def _get_sync_executor(cls):
+        """
+        Returns the executor running synchronous RPC methods
+        :return: concurrent.futures.Executor
+        """
+        if cls.sync_executor is not None:
+            return cls.sync_executor
+
+        executor = cls.__dict__.get('_sync_executor')
+        if executor is None:
+            with _executors_lock:
+                executor = cls.__dict__.get('_sync_executor')
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=cls.sync_max_workers or 4)
+                    cls._sync_executor = executor
+        return executor
+
+    @classmethod
+    def wait_pending(cls, timeout=None):
+        """
+        Wait until the requests being processed are answered. Mostly useful in tests.
+        :param float timeout: maximum number of seconds to wait
+        :return: None
+        """
+        with cls._pending_lock:
+            pending = list(cls.pending)
+        wait(pending, timeout)
+
+    @classmethod
+    def _submit(cls, coro):
+        """
+        Schedule the processing of a request on the event loop
+        :param coro: coroutine processing the request
+        :return: concurrent.futures.Future
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, cls.get_event_loop())
+        with cls._pending_lock:
+            cls.pending.add(future)
+        future.add_done_callback(cls._request_done)
+        return future
+
+    @classmethod
+    def _request_done(cls, future):
+        with cls._pending_lock:
+            cls.pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Error while processing a request', exc_info=future.exception())
+
+    def http_handler(self, message):
+        """
+        Called on HTTP request
+        :param message: message received
+        :return:
+        """
+        # Get Django HttpRequest object from ASGI Message
+        request = AsgiRequest(message)
+
+        # CORS
+        response = self._get_cors_handler().process_request(request)
+        if isinstance(response, HttpResponse):
+            self._send_http_response(request, response, message)
+            return
+
+        request_metrics = self._get_request_metrics()
+        result = self._check_rate_limit(message, request_metrics)
+        if result is not None:
+            self._send_http_response(request, self._http_response(result, False, request), message)
+            return
+
+        if not self._reads_http_body():
+            self._submit(self._http_receive(request, message, request_metrics))
+            return
+
+        # the body is read here, the calls of a streamed batch are scheduled on the loop as they are received
+        loop = self.get_event_loop()
+
+        def handle_call(data):
+            return asyncio.run_coroutine_threadsafe(self._handle_call(data, message, request_metrics), loop)
+
+        try:
+            content, calls = self._read_http_body(request, handle_call, request_metrics)
+        except JsonRpcException as e:
+            result = e.as_dict()
+            if request_metrics is not None:
+                request_metrics.target.record_error(result)
+            self._send_http_response(request, self._http_response(result, False, request), message)
+        except RequestAborted:
+            pass
+        except RequestTimeout:
+            self._send_http_response(request, HttpResponse(status=408), message)
+        else:
+            self._submit(self._http_receive(request, message, request_metrics, content, calls))
+
+    async def _http_receive(self, request, message, request_metrics=None, content=None, calls=None):
+        if calls is not None:
+            responses = await asyncio.gather(*[asyncio.wrap_future(call) for call in calls])
+            result, is_notification = self._batch_response(responses)
+        else:
+            if content is None:
+                content = self._get_http_content(request)
+            result, is_notification = await self._handle(content, message, request_metrics)
+        if request_metrics is None:
+            response = self._http_response(result, is_notification, request)
+        else:
+            start = timer()
+            response = self._http_response(result, is_notification, request)
+            if not response.streaming:
+                request_metrics.encoded(timer() - start, len(response.content))
+        if response.streaming:
+            # the items are produced by a synchronous iterator
+            await self.get_event_loop().run_in_executor(self._get_sync_executor(), self._send_http_response,
+                                                        request, response, message)
+        else:
+            self._send_http_response(request, response, message)
+
+    def raw_receive(self, message, **kwargs):
+        """
+        Called when receiving a message.
+        :param message: message received
+        :param kwargs:
+        :return:
+        """
+        content, binary_codec = self._get_frame_content(message)
+        request_metrics = self._get_request_metrics()
+        result = self._check_rate_limit(message, request_metrics)
+        if result is not None:
+            message.reply_channel.send(self._encode_websocket(result, binary_codec))
+            return
+        self._submit(self._receive(content, message, request_metrics, binary_codec))
+
+    async def _receive(self, content, message, request_metrics=None, binary_codec=None):
+        result, is_notification = await self._handle(content, message, request_metrics, binary_codec)
+
+        # Send responce back only if it is a call, not notification
+        if isinstance(result, StreamedResult):
+            # the items are produced by a synchronous iterator
+            await self.get_event_loop().run_in_executor(self._get_sync_executor(), self._send_streamed_result,
+                                                        result, message, binary_codec)
+        elif not is_notification:
+            if request_metrics is None:
+                frame = self._encode_websocket(result, binary_codec)
+            else:
+                start = timer()
+                frame = self._encode_websocket(result, binary_codec)
+                request_metrics.encoded(timer() - start, len(frame['text'] if 'text' in frame else frame['bytes']))
+            message.reply_channel.send(frame)
+
+    async def _handle(self, content, message, request_metrics=None, codec=None):
+        """
+        Handle
+        :param content:
+        :param message:
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :param codec: codec decoding the content, defaults to the JSON codec
+        :return: tuple (result, is_notification)
+        """
+        if not content:
+            result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+            if request_metrics is not None:
+                request_metrics.target.record_error(result)
+            return result, False
+
+        start = timer() if request_metrics is not None else None
+        try:
+            data = (codec or self._get_codec()).loads(content)
+        except ValueError:
+            # json could not decoded
+            result = self.error(None, self.PARSE_ERROR, self.errors[self.PARSE_ERROR])
+            if request_metrics is not None:
+                request_metrics.parsed(None, timer() - start, len(content))
+                request_metrics.target.record_error(result)
+            return result, False
+
+        if request_metrics is not None:
+            request_metrics.parsed(data, timer() - start, len(content))
+        if isinstance(data, list):
+            return await self._handle_batch(data, message, request_metrics)
+        return await self._handle_call(data, message, request_metrics)
+
+    async def _handle_batch(self, data, message, request_metrics=None):
+        """
+        Handle a batch of calls. They are all processed concurrently.
+        :param list data: decoded request objects
+        :param message: original message
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (list of responses, is_notification)
+        """
+        if not data:
+            result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+            if request_metrics is not None:
+                request_metrics.target.record_error(result)
+            return result, False
+
+        responses = await asyncio.gather(*[self._handle_call(call, message, request_metrics) for call in data])
+        return self._batch_response(responses)
+
+    async def _handle_call(self, data, message, request_metrics=None):
+        """
+        Handle a single call or notification
+        :param data: decoded request object
+        :param message: original message
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (result, is_notification)
+        """
+        is_notification = False
+        if not isinstance(data, dict):
+            result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+            if request_metrics is not None:
+                request_metrics.consumer.unknown.record_error(result)
+            return result, is_notification
+
+        start = timer() if request_metrics is not None else None
+        try:
+            if data.get('method') is not None and data.get('id') is None:
+                is_notification = True
+            method, params = self._get_method(data, message, is_notification)
+            options = method.options
+            if options['cache'] is not None or options['coalesce'] is not None or options['idempotency'] is not None:
+                result = await self._shared_call(method, params, message, data)
+            else:
+                result = await self._call(method, params, message, data.get('id'))
+                result = self._pack_result(data, params, result, is_notification)
+        except JsonRpcException as e:
+            result = e.as_dict()
+            self._log_call(data, data.get('params', []), error=result['error'])
+        except Exception as e:
+            result = self._application_error(data, e)
+            self._log_call(data, data.get('params', []), error=result['error'])
+
+        if request_metrics is not None:
+            request_metrics.consumer.method(data.get('method')).record_call(timer() - start, result)
+        return result, is_notification
+
+    async def _shared_call(self, method, params, message, data):
+        """
+        Call an RPC method whose encoded result is cached, shared by identical concurrent calls or stored by
+        idempotency key
+        :param method: RPC method
+        :param params: params of the call
+        :param message: original message
+        :param dict data: request
+        :return: EncodedFrame
+        """
+        idempotency = method.options['idempotency']
+        idempotency_key = idempotency.make_key(data, message) if idempotency is not None else None
+        try:
+            if idempotency_key is None:
+                encoded_result = await self._encoded_result(method, params, message, data)
+            else:
+                encoded_result = await idempotent_call(
+                    idempotency, idempotency_key, lambda: self._encoded_result(method, params, message, data),
+                    self.get_event_loop())
+        except JsonRpcException as e:
+            raise self._own_error(e, data.get('id'))
+        self._log_call(data, params, encoded_result)
+        return self._encode_frame(data.get('id'), encoded_result)
+
+    async def _encoded_result(self, method, params, message, data):
+        """
+        Returns the encoded result of a call, from the result cache of the method, or shared with the identical calls
+        being executed
+        :param method: RPC method
+        :param params: params of the call
+        :param message: original message
+        :param dict data: request
+        :return: EncodedResult
+        """
+        result_cache = method.options['cache']
+        if result_cache is not None:
+            key = result_cache.make_key(params, message)
+            encoded_result = result_cache.get(key)
+            if encoded_result is not NOT_CACHED:
+                return encoded_result
+
+        async def execute():
+            result = await self._call(method, params, message, data.get('id'))
+            if isinstance(result, Iterator):
+                result = list(result)
+            return EncodedResult(self._encode(result))
+
+        coalescer = method.options['coalesce']
+        if coalescer is None:
+            encoded_result = await execute()
+        else:
+            encoded_result = await coalesce(coalescer, coalescer.make_key(params, message), execute,
+                                            self.get_event_loop())
+
+        if result_cache is not None:
+            result_cache.set(key, encoded_result)
+        return encoded_result
+
+    async def _call(self, method, params, original_msg, rpc_id=None):
+        """
+        Call an RPC method: coroutine functions are awaited, other functions run in the sync executor, or in the
+        process pool
+        :param method: RPC method
+        :param params: params of the call
+        :param original_msg: original message
+        :param rpc_id: id of the call
+        :return: result of the method
+        """
+        call_plan = method.call_plan
+        timeout = self._get_timeout(method)
+        deadline = None
+        if call_plan.is_coroutine:
+            if timeout is None:
+                return await call_plan(params, original_msg)
+            # cancelled when the timeout expires
+            future = call_plan(params, original_msg)
+        elif method.options['executor'] == 'process':
+            # the loop keeps handling the other requests while the pool computes the result
+            future = asyncio.wrap_future(self._get_process_executor().submit(call_in_process, call_plan.func, params),
+                                         loop=self.get_event_loop())
+        else:
+            deadline = Deadline(timeout) if timeout is not None else None
+            future = self.get_event_loop().run_in_executor(self._get_sync_executor(), _call_sync, call_plan,
+                                                           params, original_msg, deadline)
+            if timeout is None:
+                return await future
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if timeout is None:
+                raise
+            if deadline is not None:
+                deadline.cancelled = True
+                if not deadline.started:
+                    # all the threads of the sync executor were busy, the call never started
+                    raise self._busy_error(rpc_id)
+            raise self._timeout_error(rpc_id, timeout)
+        except CallTimeout:
+            raise self._timeout_error(rpc_id, timeout)
@@ -0,0 +1,123 @@
+"""
+Codecs of the binary WebSocket frames, selected through `JsonRpcConsumer.binary_codec`.
+
+Binary frames carry the same JSON-RPC objects as text frames, encoded with MessagePack (`msgpack`) or CBOR
+(`cbor2`). The frames are decoded from a memoryview of the message, without copying them.
+"""
+import abc
+import logging
+
+import six
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BinaryCodec(object):
+    """
+    Abstract base class of the binary codecs, which implement `loads()` and `dumps()`. The `default()` method of
+    `encoder_class` is used as a hook for the types they can't serialize, as the JSON codecs do.
+    """
+    name = None
+
+    def __init__(self, encoder_class=None):
+        self.encoder_class = encoder_class
+        self.default = encoder_class().default if encoder_class is not None else None
+
+    @classmethod
+    def is_available(cls):
+        return False
+
+    @abc.abstractmethod
+    def loads(self, data):
+        """
+        Decode a frame
+        :param data: bytes, or any object supporting the buffer protocol (e.g. memoryview)
+        :return: decoded object
+        :raise ValueError: if the frame can't be decoded
+        """
+
+    @abc.abstractmethod
+    def dumps(self, obj):
+        """
+        Encode an object
+        :param obj: object to encode
+        :return: bytes
+        :raise TypeError: if the object can't be encoded
+        """
+
+
+class MsgpackCodec(BinaryCodec):
+    name = 'msgpack'
+
+    @classmethod
+    def is_available(cls):
+        return msgpack is not None
+
+    def loads(self, data):
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except ValueError:
+            raise
+        except Exception as e:
+            # e.g. maps with unhashable keys
+            raise ValueError(str(e))
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, default=self.default, use_bin_type=True)
+
+
+class CborCodec(BinaryCodec):
+    name = 'cbor'
+
+    @classmethod
+    def is_available(cls):
+        return cbor2 is not None
+
+    def loads(self, data):
+        try:
+            return cbor2.loads(data)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(str(e))
+
+    def dumps(self, obj):
+        if self.default is None:
+            return cbor2.dumps(obj)
+        return cbor2.dumps(obj, default=self._default)
+
+    def _default(self, encoder, value):
+        encoder.encode(self.default(value))
+
+
+codecs = dict((codec.name, codec) for codec in (MsgpackCodec, CborCodec))
+
+
+def get_binary_codec(codec, encoder_class=None):
+    """
+    Returns a binary codec instance
+    :param codec: codec name ('msgpack' or 'cbor'), or a BinaryCodec subclass
+    :param encoder_class: json.JSONEncoder subclass
+    :return: BinaryCodec, None if the codec isn't installed
+    """
+    if isinstance(codec, type) and issubclass(codec, BinaryCodec):
+        return codec(encoder_class)
+
+    codec_class = codecs.get(codec)
+    if codec_class is None or not codec_class.is_available():
+        logger.warning("Binary codec '%s' is not available, binary frames are not accepted" % codec)
+        return None
+
+    return codec_class(encoder_class)
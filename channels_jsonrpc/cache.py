@@ -0,0 +1,244 @@
+"""
+Result cache of the RPC methods declared with `rpc_method(cache=...)`.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from six import string_types
+
+# Returned by the backends on cache misses, as None is a valid result
+NOT_CACHED = object()
+
+
+class LocalCacheBackend(object):
+    """
+    In-process LRU cache, with optional expiration of the entries
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._entries[key]
+            except KeyError:
+                return NOT_CACHED
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return NOT_CACHED
+            # most recently used entries are at the end
+            self._entries[key] = self._entries.pop(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            if self.maxsize is not None and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend(object):
+    """
+    Stores the results in a cache of Django's cache framework, shared by the workers using it.
+
+    As Django caches can't delete keys by prefix, clearing the backend bumps a generation number stored in the cache
+    and part of the keys, so each lookup costs an additional cache access.
+    """
+
+    def __init__(self, namespace, alias='default'):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _key(self, key):
+        generation = self.cache.get(self._generation_key, 0)
+        return 'jsonrpc:%s:%s:%s' % (self.namespace, generation,
+                                     hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    @property
+    def _generation_key(self):
+        return 'jsonrpc:%s:generation' % self.namespace
+
+    def get(self, key):
+        return self.cache.get(self._key(key), NOT_CACHED)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(self._key(key), value, ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        try:
+            self.cache.incr(self._generation_key)
+        except ValueError:
+            self.cache.set(self._generation_key, 1, None)
+
+
+class ResultCache(object):
+    """
+    Cache of the results of an RPC method, keyed on its params (and on the user, if `per_user`)
+    """
+
+    def __init__(self, maxsize=128, ttl=None, per_user=None, backend=None, alias='default'):
+        """
+        :param int maxsize: maximum number of results kept by the local backend, None for no limit
+        :param float ttl: number of seconds results are kept, None to keep them until evicted
+        :param bool per_user: scope the results to the user (or connection) of original_message. By default, only the
+            results of the functions taking original_message are
+        :param backend: 'local' (default), 'django', or a backend instance
+        :param str alias: Django cache alias, for the 'django' backend
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.per_user = per_user
+        self.name = None
+        self.hits = 0
+        self.misses = 0
+        self._backend = backend
+        self._alias = alias
+
+    def bind(self, name, consumer_class=None, takes_original_message=False):
+        """
+        Bind the cache to the RPC method it caches
+        :param str name: RPC name of the method
+        :param consumer_class: consumer class the method is registered on, whose path is part of the keys of the
+            shared backends
+        :param bool takes_original_message: if the function takes original_message, its results may depend on the
+            user: they are scoped to it unless `per_user` is False
+        :return: self
+        """
+        self.name = name
+        if self.per_user is None:
+            self.per_user = takes_original_message
+        if self._backend is None or self._backend == 'local':
+            self.backend = LocalCacheBackend(self.maxsize)
+        elif self._backend == 'django':
+            self.backend = DjangoCacheBackend(make_namespace(name, consumer_class), self._alias)
+        else:
+            self.backend = self._backend
+        return self
+
+    @classmethod
+    def from_option(cls, option):
+        """
+        Build a cache from the `cache` option of rpc_method()
+        :param option: True, a TTL in seconds, a dict of ResultCache arguments or a ResultCache
+        :return: ResultCache, or None if caching is disabled
+        """
+        if option is None or option is False:
+            return None
+        if isinstance(option, ResultCache):
+            return option
+        if option is True:
+            return cls()
+        if isinstance(option, dict):
+            return cls(**option)
+        return cls(ttl=option)
+
+    def make_key(self, params, original_message=None):
+        """
+        Returns the cache key of a call
+        :param params: params of the call
+        :param original_message: original message, used if `per_user`
+        :return: str
+        """
+        return make_call_key(params, original_message if self.per_user else None)
+
+    def get(self, key):
+        result = self.backend.get(key)
+        if result is NOT_CACHED:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, key, result):
+        self.backend.set(key, result, self.ttl)
+
+    def invalidate(self, params=None, original_message=None):
+        """
+        Invalidate the result of a call, or all the results if no params are given
+        :param params: params of the call
+        :param original_message: original message of the call, or its scope ('user:<pk>'), if the cache is per user
+        :return: None
+        """
+        if params is None:
+            self.backend.clear()
+        else:
+            self.backend.delete(self.make_key(params, original_message))
+
+    def stats(self):
+        """
+        Returns the hit and miss counters
+        :return: dict
+        """
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def make_namespace(name, consumer_class=None):
+    """
+    Returns the namespace of the entries of an RPC method in the shared backends, so the methods with the same name
+    on different consumer classes don't share them
+    :param str name: RPC name of the method, None for the namespace of the consumer class itself
+    :param consumer_class: consumer class the method is registered on
+    :return: str, e.g. 'myapp.consumers.BillingConsumer:charge'
+    """
+    if consumer_class is None:
+        return name
+    path = '%s.%s' % (consumer_class.__module__, getattr(consumer_class, '__qualname__', consumer_class.__name__))
+    if name is None:
+        return path
+    return '%s:%s' % (path, name)
+
+
+def make_call_key(params, original_message=None):
+    """
+    Returns a key identifying the params of a call, scoped to its user or connection if original_message is given
+    :param params: params of the call
+    :param original_message: original message of the call, or its scope
+    :return: str
+    """
+    key = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    if original_message is not None:
+        key = '%s|%s' % (get_scope(original_message), key)
+    return key
+
+
+def get_scope(original_message):
+    """
+    Returns the scope of a call: its authenticated user, or else its reply channel
+    :param original_message: original message of the call
+    :return: str
+    """
+    if original_message is None:
+        return ''
+    if isinstance(original_message, string_types):
+        return original_message
+    user = getattr(original_message, 'user', None)
+    if getattr(user, 'pk', None) is not None:
+        return 'user:%s' % user.pk
+    return 'channel:%s' % original_message.reply_channel.name
@@ -0,0 +1,252 @@
+"""
+Request coalescing (single-flight) of the RPC methods declared with `rpc_method(coalesce=...)`.
+
+Identical calls (same method and params) arriving while one of them is being executed wait for its result instead
+of running the method again. Nothing is kept once the execution is over: the next call runs the method again.
+
+Calls are coalesced between the threads of a worker, and between the requests processed on the event loop of
+AsyncJsonRpcConsumer. With the 'django' backend, they are also coalesced between workers: the first one takes a lock
+in a cache of Django's cache framework and publishes the encoded result there, the others poll for it.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from .cache import NOT_CACHED, make_call_key, make_namespace
+
+
+class Flight(object):
+    """
+    Execution shared by identical calls of a worker
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class DjangoFlightBackend(object):
+    """
+    Coalesces calls between workers through a cache of Django's cache framework. The cache must support atomic
+    `add()` (e.g. Redis, memcached or the database cache).
+
+    If the worker executing a call fails, the lock is released without a result and a waiting worker executes the
+    call itself.
+    """
+
+    def __init__(self, namespace, alias='default', lock_timeout=30, poll_interval=0.01):
+        """
+        :param str namespace: prefix of the cache keys
+        :param str alias: Django cache alias
+        :param float lock_timeout: number of seconds after which a lock is considered abandoned
+        :param float poll_interval: number of seconds between two checks of the result
+        """
+        self.namespace = namespace
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _lock_key(self, key):
+        return 'jsonrpc:flight:%s:%s' % (self.namespace, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def acquire(self, key):
+        """
+        Take the lock of a call, or find the execution holding it
+        :param str key: key of the call
+        :return: tuple (token of the execution, True if this worker executes the call)
+        """
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+        if self.cache.add(lock_key, token, self.lock_timeout):
+            return token, True
+        current = self.cache.get(lock_key)
+        if current is None:
+            # released in between
+            return self.acquire(key)
+        return current, False
+
+    def publish(self, key, token, result):
+        """
+        Publish the result of an execution and release its lock
+        :param str key: key of the call
+        :param str token: token of the execution
+        :param result: picklable result
+        :return: None
+        """
+        # the result is only kept for the workers already waiting for it
+        self.cache.set('%s:%s' % (self._lock_key(key), token), result, self.lock_timeout)
+        self.release(key, token)
+
+    def release(self, key, token):
+        lock_key = self._lock_key(key)
+        if self.cache.get(lock_key) == token:
+            self.cache.delete(lock_key)
+
+    def wait(self, key, token):
+        """
+        Wait for the result of an execution of another worker
+        :param str key: key of the call
+        :param str token: token of the execution
+        :return: result, NOT_CACHED if the execution failed or its lock expired
+        """
+        lock_key = self._lock_key(key)
+        result_key = '%s:%s' % (lock_key, token)
+        while True:
+            result = self.cache.get(result_key, NOT_CACHED)
+            if result is not NOT_CACHED:
+                return result
+            if self.cache.get(lock_key) != token:
+                # published just before the release, or failed
+                return self.cache.get(result_key, NOT_CACHED)
+            time.sleep(self.poll_interval)
+
+
+class Coalescer(object):
+    """
+    Shares the execution of identical concurrent calls of an RPC method
+    """
+
+    def __init__(self, per_user=None, backend=None, alias='default', lock_timeout=30, poll_interval=0.01):
+        """
+        :param bool per_user: only coalesce the calls of a same user (or connection). By default, only the calls of the
+            functions taking original_message are
+        :param backend: 'local' (default) to coalesce the calls of a worker, 'django' to coalesce them between
+            workers too, or a backend instance
+        :param str alias: Django cache alias, for the 'django' backend
+        :param float lock_timeout: number of seconds after which a worker executing a call is considered gone, for
+            the 'django' backend
+        :param float poll_interval: number of seconds between two checks of the result, for the 'django' backend
+        """
+        self.per_user = per_user
+        self.name = None
+        self.executions = 0
+        self.coalesced = 0
+        self.backend = None
+        self._backend = backend
+        self._alias = alias
+        self._lock_timeout = lock_timeout
+        self._poll_interval = poll_interval
+        self._flights = {}
+        # executions running on an event loop, by key (see AsyncJsonRpcConsumer)
+        self.tasks = {}
+        self._lock = threading.Lock()
+
+    def bind(self, name, consumer_class=None, takes_original_message=False):
+        """
+        Bind the coalescer to the RPC method it coalesces the calls of
+        :param str name: RPC name of the method
+        :param consumer_class: consumer class the method is registered on, whose path is part of the keys of the
+            'django' backend
+        :param bool takes_original_message: if the function takes original_message, its results may depend on the
+            user: only the calls of a same user are coalesced unless `per_user` is False
+        :return: self
+        """
+        self.name = name
+        if self.per_user is None:
+            self.per_user = takes_original_message
+        if self._backend == 'django':
+            self.backend = DjangoFlightBackend(make_namespace(name, consumer_class), self._alias, self._lock_timeout,
+                                               self._poll_interval)
+        elif self._backend is not None and self._backend != 'local':
+            self.backend = self._backend
+        return self
+
+    @classmethod
+    def from_option(cls, option):
+        """
+        Build a coalescer from the `coalesce` option of rpc_method()
+        :param option: True, 'local', 'django', a dict of Coalescer arguments or a Coalescer
+        :return: Coalescer, or None if calls aren't coalesced
+        """
+        if option is None or option is False:
+            return None
+        if isinstance(option, Coalescer):
+            return option
+        if option is True:
+            return cls()
+        if isinstance(option, dict):
+            return cls(**option)
+        return cls(backend=option)
+
+    def make_key(self, params, original_message=None):
+        """
+        Returns the key of a call: calls with the same key are coalesced
+        :param params: params of the call
+        :param original_message: original message, used if `per_user`
+        :return: str
+        """
+        return make_call_key(params, original_message if self.per_user else None)
+
+    def call(self, key, func):
+        """
+        Execute a call, or wait for the result of the identical call being executed
+        :param str key: key of the call
+        :param func: function executing the call, its result is shared
+        :return: result of func
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            self.coalesced += 1
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            if self.backend is None:
+                self.executions += 1
+                flight.result = func()
+            else:
+                flight.result = self._call_shared(key, func)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def _call_shared(self, key, func):
+        """
+        Execute a call, or wait for its result from another worker
+        """
+        # a waiting worker whose leader failed tries once to execute the call itself
+        for _attempt in range(2):
+            token, leader = self.backend.acquire(key)
+            if leader:
+                self.executions += 1
+                try:
+                    result = func()
+                except Exception:
+                    self.backend.release(key, token)
+                    raise
+                self.backend.publish(key, token, result)
+                return result
+
+            result = self.backend.wait(key, token)
+            if result is not NOT_CACHED:
+                self.coalesced += 1
+                return result
+        self.executions += 1
+        return func()
+
+    def stats(self):
+        """
+        Returns the number of executions and of calls that waited for one
+        :return: dict
+        """
+        return {'executions': self.executions, 'coalesced': self.coalesced}
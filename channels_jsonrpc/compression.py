@@ -0,0 +1,108 @@
+"""
+Compression of the large responses and notifications.
+
+Over HTTP, the encoding is negotiated with the `Accept-Encoding` header of the request: `gzip` is always available,
+`br` and `zstd` when `brotli` and `zstandard` are installed.
+
+On WebSockets, frames above `websocket_compression_min_size` bytes are sent in a gzip envelope: a binary frame
+holding the gzip compressed frame. Clients recognize it by the gzip magic number (0x1f 0x8b), which neither JSON,
+MessagePack nor CBOR JSON-RPC objects start with.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Magic number starting gzip data
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor().compress(data)
+
+
+# Compression functions of the available encodings
+compressors = {'gzip': _gzip}
+if brotli is not None:
+    compressors['br'] = brotli.compress
+if zstandard is not None:
+    compressors['zstd'] = _zstd
+
+# Order in which the encodings are preferred, when the client accepts several
+preferred_encodings = ('zstd', 'br', 'gzip')
+
+
+def available_encodings(encodings=True):
+    """
+    Returns the installed encodings, in order of preference
+    :param encodings: True for all of them, else an iterable of encodings to restrict them to
+    :return: tuple
+    """
+    if encodings is True:
+        encodings = preferred_encodings
+    return tuple(encoding for encoding in encodings if encoding in compressors)
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header
+    :param str header: value of the header
+    :return: dict of the quality of each encoding
+    """
+    accepted = {}
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        encoding = parts[0].strip().lower()
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[encoding] = quality
+    return accepted
+
+
+def negotiate(header, encodings):
+    """
+    Choose the encoding of a response
+    :param str header: Accept-Encoding header of the request
+    :param tuple encodings: encodings the response can be compressed with, in order of preference
+    :return: str, None if the client accepts none of them
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    default = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding):
+    """
+    Compress data
+    :param bytes data: data
+    :param str encoding: 'gzip', 'br' or 'zstd'
+    :return: bytes
+    """
+    return compressors[encoding](data)
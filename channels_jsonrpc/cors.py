@@ -0,0 +1,166 @@
+"""
+CORS handling of the HTTP transport, with the settings of django-cors-headers.
+"""
+import re
+
+from corsheaders.defaults import default_headers, default_methods
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from six.moves.urllib.parse import urlparse
+
+try:
+    from corsheaders.signals import check_request_enabled
+except ImportError:
+    check_request_enabled = None
+
+
+class CorsHandler(object):
+    """
+    Computes the CORS headers of the responses like corsheaders' CorsMiddleware, and caches them per path, origin and
+    kind of request (preflight or not), so they are only computed once. Preflight requests are answered directly.
+
+    The `CORS_*` settings are read from django.conf.settings when the handler is built: CorsMiddleware reads them from
+    `corsheaders.defaults`, which is frozen when it is first imported, so changed settings (e.g. with
+    `override_settings`) would be ignored.
+
+    Headers are not cached when the allowed origins can change at runtime: with `CORS_MODEL`, or when receivers are
+    connected to corsheaders' `check_request_enabled` signal.
+    """
+
+    # Maximum number of cached header sets, the origin being chosen by the client
+    max_cached_origins = 1024
+
+    def __init__(self):
+        self.allow_headers = getattr(settings, 'CORS_ALLOW_HEADERS', default_headers)
+        self.allow_methods = getattr(settings, 'CORS_ALLOW_METHODS', default_methods)
+        self.allow_credentials = getattr(settings, 'CORS_ALLOW_CREDENTIALS', False)
+        self.preflight_max_age = getattr(settings, 'CORS_PREFLIGHT_MAX_AGE', 86400)
+        self.origin_allow_all = getattr(settings, 'CORS_ORIGIN_ALLOW_ALL', False)
+        self.origin_whitelist = getattr(settings, 'CORS_ORIGIN_WHITELIST', ())
+        self.origin_regex_whitelist = getattr(settings, 'CORS_ORIGIN_REGEX_WHITELIST', ())
+        self.expose_headers = getattr(settings, 'CORS_EXPOSE_HEADERS', ())
+        self.urls_regex = re.compile(getattr(settings, 'CORS_URLS_REGEX', '^.*$'))
+        self.model = getattr(settings, 'CORS_MODEL', None)
+        self.replace_https_referer = getattr(settings, 'CORS_REPLACE_HTTPS_REFERER', False)
+        self.cacheable = self.model is None
+        self._headers = {}
+
+    def is_preflight(self, request):
+        return request.method == 'OPTIONS' and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in request.META
+
+    def is_enabled(self, request):
+        return self.urls_regex.match(request.path) is not None
+
+    def is_allowed(self, request, origin):
+        """
+        Returns True if an origin is allowed by the settings (or by the receivers of `check_request_enabled`)
+        :param request: django.http.HttpRequest
+        :param str origin: value of the Origin header
+        :return: bool
+        """
+        if self.origin_allow_all:
+            return True
+        if urlparse(origin).netloc in self.origin_whitelist:
+            return True
+        if any(re.match(pattern, origin) for pattern in self.origin_regex_whitelist):
+            return True
+        if check_request_enabled is not None:
+            return any(result for _receiver, result in check_request_enabled.send(sender=None, request=request))
+        return False
+
+    def process_request(self, request):
+        """
+        Answer preflight requests
+        :param request: django.http.HttpRequest
+        :return: django.http.HttpResponse for preflight requests, else None
+        """
+        if not self.is_enabled(request):
+            return None
+
+        if self.replace_https_referer:
+            self.replace_referer(request)
+
+        if self.is_preflight(request):
+            return self.process_response(request, HttpResponse())
+        return None
+
+    def replace_referer(self, request):
+        """
+        Replace the referer of the secure requests from allowed origins by the host, for Django's CSRF checks
+        :param request: django.http.HttpRequest
+        :return: None
+        """
+        origin = request.META.get('HTTP_ORIGIN')
+        if not request.is_secure() or not origin or 'ORIGINAL_HTTP_REFERER' in request.META:
+            return
+        if not self.is_allowed(request, origin):
+            return
+        try:
+            http_referer = request.META['HTTP_REFERER']
+            http_host = "https://%s/" % request.META['HTTP_HOST']
+        except KeyError:
+            return
+        request.META = request.META.copy()
+        request.META['ORIGINAL_HTTP_REFERER'] = http_referer
+        request.META['HTTP_REFERER'] = http_host
+
+    def process_response(self, request, response):
+        """
+        Add the CORS headers to a response
+        :param request: django.http.HttpRequest
+        :param response: django.http.HttpResponse
+        :return: django.http.HttpResponse
+        """
+        if 'HTTP_ORIGIN' not in request.META or not self.is_enabled(request):
+            return response
+
+        for header, value in self.get_headers(request):
+            response[header] = value
+        return response
+
+    def get_headers(self, request):
+        """
+        Returns the CORS headers of the response to a request
+        :param request: django.http.HttpRequest
+        :return: tuple of (header, value)
+        """
+        key = (request.path, request.META['HTTP_ORIGIN'], request.method == 'OPTIONS')
+        headers = self._headers.get(key)
+        if headers is None:
+            headers = self.compute_headers(request)
+            if self.cacheable and (check_request_enabled is None or not check_request_enabled.has_listeners()):
+                if len(self._headers) >= self.max_cached_origins:
+                    self._headers.clear()
+                self._headers[key] = headers
+        return headers
+
+    def compute_headers(self, request):
+        """
+        Computes the CORS headers of the response to a request, as CorsMiddleware.process_response does
+        :param request: django.http.HttpRequest
+        :return: tuple of (header, value)
+        """
+        origin = request.META['HTTP_ORIGIN']
+        headers = []
+
+        if self.model is not None:
+            model = apps.get_model(*self.model.split('.'))
+            if model.objects.filter(cors=urlparse(origin).netloc).exists():
+                headers.append(('Access-Control-Allow-Origin', origin))
+
+        if not self.is_allowed(request, origin):
+            return tuple(headers)
+
+        headers = [('Access-Control-Allow-Origin',
+                    '*' if self.origin_allow_all and not self.allow_credentials else origin)]
+        if self.expose_headers:
+            headers.append(('Access-Control-Expose-Headers', ', '.join(self.expose_headers)))
+        if self.allow_credentials:
+            headers.append(('Access-Control-Allow-Credentials', 'true'))
+        if request.method == 'OPTIONS':
+            headers.append(('Access-Control-Allow-Headers', ', '.join(self.allow_headers)))
+            headers.append(('Access-Control-Allow-Methods', ', '.join(self.allow_methods)))
+            if self.preflight_max_age:
+                headers.append(('Access-Control-Max-Age', str(self.preflight_max_age)))
+        return tuple(headers)
@@ -0,0 +1,47 @@
+"""
+Process pool running the CPU-bound RPC methods declared with `rpc_method(executor='process')`, so they don't hold
+the GIL of the worker.
+
+The functions are sent to the pool processes by reference: they must be defined at the top level of a module. Their
+params must be picklable, and they can't take `original_message` (by name or through `**kwargs`), which isn't.
+
+JsonRpcConsumer blocks its worker on the result, as for any other method: the process pool keeps the GIL free for
+the other threads of the worker, it doesn't let the worker serve other requests meanwhile. AsyncJsonRpcConsumer
+keeps handling the other requests while the pool computes the result.
+"""
+# Values of the `executor` option of rpc_method() and rpc_notification()
+EXECUTORS = (None, 'process')
+
+
+def call_in_process(func, params):
+    """
+    Call an RPC method in a pool process
+    :param func: RPC function
+    :param list|dict params: params of the call
+    :return: result of the function
+    """
+    from django.apps import apps
+    if not apps.ready:
+        # processes started with the "spawn" method don't inherit the configured Django
+        import django
+        django.setup()
+    if isinstance(params, list):
+        return func(*params)
+    return func(**params)
+
+
+def check_executor(executor, call_plan):
+    """
+    Check the `executor` option of an RPC function
+    :param str executor: None or 'process'
+    :param channels_jsonrpc.jsonrpcconsumer.CallPlan call_plan: call plan of the function
+    :return: None
+    :raise ValueError: if the function can't run in the executor
+    """
+    if executor not in EXECUTORS:
+        raise ValueError('Unknown executor %r, expected one of %r' % (executor, EXECUTORS))
+    if executor == 'process' and call_plan.is_coroutine:
+        raise ValueError('Coroutine functions can\'t run in the process pool')
+    if executor == 'process' and call_plan.takes_original_message:
+        # the message can't be pickled to the pool processes
+        raise ValueError('Functions taking original_message (or **kwargs) can\'t run in the process pool')
@@ -0,0 +1,185 @@
+"""
+Incremental reading of HTTP request bodies, used with `JsonRpcConsumer.http_max_body_size` and `http_streaming`.
+
+channels' AsgiRequest buffers the whole body (the `body` of the message, then the chunks received on its
+`body_channel`) when it is built, and so do the session decorators. Here, the handlers get a copy of the message
+without its body and the chunks are read one by one from the original message, so the maximum size is enforced as
+they arrive, and the calls of a batch can be handled before the end of the body.
+"""
+import re
+import time
+from codecs import getincrementaldecoder
+
+from channels.handler import AsgiRequest
+from channels.message import Message
+
+
+class RequestTooLarge(Exception):
+    """
+    Raised when the body of a request exceeds the maximum size
+    """
+
+
+def bodyless_message(message):
+    """
+    Returns a copy of an HTTP message without its body, to build its request without reading the body
+    :param message: http.request message
+    :return: channels.message.Message
+    """
+    content = dict(message.content, body=b'', body_channel=None)
+    return Message(content, message.channel.name, message.channel_layer)
+
+
+def iter_body(message, max_size=None, timeout=AsgiRequest.body_receive_timeout):
+    """
+    Yields the chunks of the body of an HTTP request as they are received
+    :param message: http.request message
+    :param int max_size: maximum size of the body, in bytes, None for no limit
+    :param float timeout: maximum number of seconds to wait for the body
+    :raise RequestTooLarge: if the body exceeds max_size
+    :raise channels.exceptions.RequestTimeout: if the body isn't received in time
+    :raise channels.exceptions.RequestAborted: if the client closed the request
+    """
+    from channels.exceptions import RequestAborted, RequestTimeout
+
+    size = 0
+    chunk = message.get('body', b'')
+    more_content = bool(message.get('body_channel'))
+    start = time.time()
+    while True:
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise RequestTooLarge(size)
+        if chunk:
+            yield chunk
+        if not more_content:
+            return
+
+        received = None
+        while received is None:
+            if time.time() - start > timeout:
+                raise RequestTimeout()
+            _, received = message.channel_layer.receive_many([message['body_channel']], block=True)
+        if received.get('closed', False):
+            raise RequestAborted()
+        chunk = received.get('content', b'')
+        more_content = received.get('more_content', False)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'["\[\]{},]')
+_STRING = re.compile(r'["\\]')
+
+
+class JsonArraySplitter(object):
+    """
+    Splits a JSON array fed in chunks into the JSON texts of its elements, as soon as each one is complete.
+
+    Only the structure of the array is followed (strings, nesting and the separators of its elements): the elements
+    are decoded by the codec of the consumer, which reports their errors. Only the text of the element being received
+    is kept.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        # scanning position in buffer, and start of the element being received
+        self.pos = 0
+        self.start = 0
+        self.depth = 0
+        self.in_string = False
+        self.started = False
+        self.ended = False
+        self.count = 0
+        self._decoder = getincrementaldecoder('utf-8')()
+
+    def feed(self, chunk):
+        """
+        Feed a chunk of the document
+        :param bytes chunk: chunk
+        :return: list of the JSON texts of the elements completed by the chunk
+        :raise ValueError: if the document isn't a JSON array
+        """
+        buf = self.buffer + self._decoder.decode(chunk)
+        pos = self.pos
+        elements = []
+        end = len(buf)
+
+        if not self.started:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == end:
+                self.buffer, self.pos = '', 0
+                return elements
+            if buf[pos] != '[':
+                raise ValueError('Not a JSON array')
+            self.started = True
+            self.start = pos = pos + 1
+
+        while pos < end and not self.ended:
+            if self.in_string:
+                match = _STRING.search(buf, pos)
+                if match is None:
+                    pos = end
+                elif match.group() == '\\':
+                    if match.end() == end:
+                        # the escaped character is in the next chunk
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                else:
+                    self.in_string = False
+                    pos = match.end()
+                continue
+
+            match = _STRUCTURE.search(buf, pos)
+            if match is None:
+                pos = end
+                break
+            char = match.group()
+            pos = match.end()
+            if char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+            elif self.depth > 0 and char in ']}':
+                self.depth -= 1
+            elif self.depth == 0 and char in ',]':
+                # end of an element
+                element = buf[self.start:pos - 1]
+                if element.strip():
+                    elements.append(element)
+                    self.count += 1
+                elif char == ',' or self.count:
+                    raise ValueError('Missing element')
+                self.start = pos
+                self.ended = char == ']'
+
+        if self.ended:
+            if _WHITESPACE.match(buf, pos).end() != end:
+                raise ValueError('Extra data')
+            self.buffer, self.pos, self.start = '', 0, 0
+        else:
+            self.buffer = buf[self.start:]
+            self.pos = pos - self.start
+            self.start = 0
+        return elements
+
+    def close(self):
+        """
+        Check the end of the document
+        :raise ValueError: if the array is not terminated
+        """
+        self._decoder.decode(b'', final=True)
+        if not self.ended:
+            raise ValueError('Unterminated JSON array')
+
+
+def is_json_array(chunk):
+    """
+    Returns whether a document starts as a JSON array
+    :param bytes chunk: first chunk of the document
+    :return: bool, None if the chunk has only whitespace
+    """
+    stripped = chunk.lstrip(b' \t\n\r')
+    if not stripped:
+        return None
+    return stripped[:1] == b'['
@@ -0,0 +1,144 @@
+"""
+Idempotency keys of the RPC methods declared with `rpc_method(idempotent=...)`.
+
+The encoded result of a call is stored under its idempotency key: the `idempotency_key` member of the request if it
+has one, else its id and params. A retried call with the same key gets the stored result without the method being
+called again, and duplicates arriving while the first call runs wait for it. Only results are stored: calls that
+failed are executed again.
+
+Explicit keys are scoped to the authenticated user, and are the key itself for anonymous clients, so a retry on a new
+connection is replayed: they must not be guessable (e.g. UUIDs). Keys derived from the id and params are scoped to
+the user or the connection, as clients reuse ids, and are only kept `derived_ttl` seconds.
+"""
+import json
+
+from .cache import NOT_CACHED, DjangoCacheBackend, LocalCacheBackend, get_scope, make_call_key, make_namespace
+from .coalescing import Coalescer
+
+
+class IdempotencyStore(object):
+    """
+    Results of the calls of an RPC method, by idempotency key
+    """
+
+    def __init__(self, ttl=600, maxsize=10000, per_user=True, backend=None, alias='default',
+                 key_field='idempotency_key', derived_ttl=30):
+        """
+        :param float ttl: number of seconds the results of the calls with an explicit key are kept
+        :param int maxsize: maximum number of results kept by the local backend
+        :param bool per_user: scope the explicit keys to the authenticated user of the calls
+        :param backend: 'local' (default), 'django' to share the results and wait for the duplicates of other workers,
+            or a backend instance
+        :param str alias: Django cache alias, for the 'django' backend
+        :param str key_field: member of the requests holding an explicit idempotency key
+        :param float derived_ttl: number of seconds the results of the calls without an explicit key are kept, 0 to
+            only replay the calls with an explicit key
+        """
+        self.ttl = ttl
+        self.derived_ttl = derived_ttl
+        self.maxsize = maxsize
+        self.per_user = per_user
+        self.key_field = key_field
+        self.name = None
+        self.replays = 0
+        self._backend = backend
+        self._alias = alias
+
+    def bind(self, name, consumer_class=None):
+        """
+        Bind the store to the RPC method whose results it keeps
+        :param str name: RPC name of the method
+        :param consumer_class: consumer class the method is registered on, whose path is part of the keys of the
+            'django' backend
+        :return: self
+        """
+        self.name = name
+        if self._backend is None or self._backend == 'local':
+            self.backend = LocalCacheBackend(self.maxsize)
+            self.coalescer = Coalescer().bind(name)
+        elif self._backend == 'django':
+            self.backend = DjangoCacheBackend('idempotency:%s' % make_namespace(name, consumer_class), self._alias)
+            self.coalescer = Coalescer(backend='django', alias=self._alias).bind('idempotency:%s' % name,
+                                                                               consumer_class)
+        else:
+            self.backend = self._backend
+            self.coalescer = Coalescer().bind(name)
+        return self
+
+    @classmethod
+    def from_option(cls, option):
+        """
+        Build a store from the `idempotent` option of rpc_method()
+        :param option: True, a TTL in seconds, a dict of IdempotencyStore arguments or an IdempotencyStore
+        :return: IdempotencyStore, or None if the method has no idempotency keys
+        """
+        if option is None or option is False:
+            return None
+        if isinstance(option, IdempotencyStore):
+            return option
+        if option is True:
+            return cls()
+        if isinstance(option, dict):
+            return cls(**option)
+        return cls(ttl=option)
+
+    def make_key(self, data, original_message=None):
+        """
+        Returns the idempotency key of a call
+        :param dict data: request
+        :param original_message: original message of the call
+        :return: str, None if the call has neither an idempotency key nor an id
+        """
+        explicit_key = data.get(self.key_field)
+        if explicit_key is not None:
+            key = json.dumps(explicit_key, sort_keys=True)
+            user = getattr(original_message, 'user', None)
+            if self.per_user and getattr(user, 'pk', None) is not None:
+                key = 'user:%s|%s' % (user.pk, key)
+            return 'key:%s' % key
+        if data.get('id') is not None and self.derived_ttl:
+            # clients reuse ids: the params are part of the key, which is scoped to the user or the connection
+            return 'id:%s|%s|%s' % (get_scope(original_message), json.dumps(data['id']),
+                                    make_call_key(data.get('params', [])))
+        return None
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, encoded_result):
+        self.backend.set(key, encoded_result, self.derived_ttl if key.startswith('id:') else self.ttl)
+
+    def call(self, key, func):
+        """
+        Returns the stored result of a call, or executes it once
+        :param str key: idempotency key
+        :param func: function returning the encoded result of the call
+        :return: encoded result
+        """
+        encoded_result = self.get(key)
+        if encoded_result is not NOT_CACHED:
+            self.replays += 1
+            return encoded_result
+        return self.coalescer.call(key, lambda: self.execute_once(key, func))
+
+    def execute_once(self, key, func):
+        """
+        Execute a call and store its result, unless a duplicate stored it since it was looked up
+        :param str key: idempotency key
+        :param func: function returning the encoded result of the call
+        :return: encoded result
+        """
+        encoded_result = self.get(key)
+        if encoded_result is not NOT_CACHED:
+            self.replays += 1
+            return encoded_result
+        encoded_result = func()
+        self.set(key, encoded_result)
+        return encoded_result
+
+    def stats(self):
+        """
+        Returns the number of replayed calls, and of calls that waited for a duplicate
+        :return: dict
+        """
+        return {'replays': self.replays, 'coalesced': self.coalescer.coalesced}
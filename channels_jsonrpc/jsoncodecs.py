@@ -0,0 +1,163 @@
+"""
+JSON codecs used by the consumers to decode requests and encode responses.
+
+The standard library `json` module is always available, faster backends (orjson, rapidjson, ujson) are used when
+installed and selected through `JsonRpcConsumer.json_codec` or the `CHANNELS_JSONRPC_CODEC` setting.
+"""
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import rapidjson
+except ImportError:
+    rapidjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec(object):
+    """
+    Standard library codec. `encoder_class` is used the same way `json.dumps(cls=...)` uses it, other codecs
+    use its `default()` method as a hook for the types they can't serialize.
+    """
+    name = 'json'
+
+    # Whether loads() accepts bytes, sparing the transport a decoding step
+    accepts_bytes = False
+
+    def __init__(self, encoder_class=None):
+        self.encoder_class = encoder_class
+        self.default = encoder_class().default if encoder_class is not None else None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def loads(self, data):
+        """
+        Decode a JSON document
+        :param str data: JSON document
+        :return: decoded object
+        :raise ValueError: if the document can't be decoded
+        """
+        return json.loads(data)
+
+    def dumps(self, obj):
+        """
+        Encode an object
+        :param obj: object to encode
+        :return: str
+        :raise TypeError: if the object can't be encoded
+        """
+        return json.dumps(obj, cls=self.encoder_class)
+
+    def dumps_bytes(self, obj):
+        """
+        Encode an object to UTF-8
+        :param obj: object to encode
+        :return: bytes
+        :raise TypeError: if the object can't be encoded
+        """
+        return self.dumps(obj).encode('utf-8')
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+    accepts_bytes = True
+
+    def __init__(self, encoder_class=None):
+        super(OrjsonCodec, self).__init__(encoder_class)
+        self.option = orjson.OPT_NON_STR_KEYS
+        if encoder_class is not None:
+            # let the encoder class serialize the types orjson would otherwise handle natively. Subclasses of str and
+            # dict (OrderedDict, SafeText...) are still encoded natively, as json.JSONEncoder does
+            self.option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    @classmethod
+    def is_available(cls):
+        return orjson is not None
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.option)
+
+
+class RapidjsonCodec(JsonCodec):
+    name = 'rapidjson'
+    accepts_bytes = True
+
+    @classmethod
+    def is_available(cls):
+        return rapidjson is not None
+
+    def loads(self, data):
+        return rapidjson.loads(data)
+
+    def dumps(self, obj):
+        # non-string keys are converted as json.dumps() does, rather than rejected
+        return rapidjson.dumps(obj, default=self.default, mapping_mode=rapidjson.MM_COERCE_KEYS_TO_STRINGS)
+
+
+class UjsonCodec(JsonCodec):
+    """
+    ujson encodes Decimal as a number, without calling the encoder class: it is only used when selected by name
+    """
+    name = 'ujson'
+    accepts_bytes = True
+
+    @classmethod
+    def is_available(cls):
+        return ujson is not None
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, obj):
+        if self.default is None:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, default=self.default)
+
+
+codecs = dict((codec.name, codec) for codec in (JsonCodec, OrjsonCodec, RapidjsonCodec, UjsonCodec))
+
+# Order in which 'auto' picks the codec, among the ones encoding the same output as the standard library
+preferred_codecs = ('orjson', 'rapidjson', 'json')
+
+
+def get_codec(codec=None, encoder_class=None):
+    """
+    Returns a codec instance
+    :param codec: codec name, 'auto' for the fastest installed one, or a JsonCodec subclass. Defaults to 'json'
+    :param encoder_class: json.JSONEncoder subclass
+    :return: JsonCodec
+    """
+    if isinstance(codec, type) and issubclass(codec, JsonCodec):
+        return codec(encoder_class)
+
+    if codec is None:
+        codec = 'json'
+    elif codec == 'auto':
+        codec = next(name for name in preferred_codecs if codecs[name].is_available())
+
+    codec_class = codecs.get(codec)
+    if codec_class is None or not codec_class.is_available():
+        logger.warning("JSON codec '%s' is not available, falling back to the standard library" % codec)
+        codec_class = JsonCodec
+
+    return codec_class(encoder_class)
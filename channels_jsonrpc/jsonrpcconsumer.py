@@ -1,6 +1,14 @@
-import json
+import hashlib
+import itertools
 import logging
+import math
 import sys
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+from timeit import default_timer as timer
 
 if sys.version_info < (3, 5):
     from inspect import getargspec as getfullargspec
@@ -11,16 +19,100 @@ else:
 
     keywords_args = "varkw"
 
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator
+
+try:
+    from inspect import iscoroutinefunction
+except ImportError:
+    def iscoroutinefunction(func):
+        return False
+
+from channels import Channel, Group
+from channels.exceptions import RequestAborted, RequestTimeout
 from channels.generic.websockets import WebsocketConsumer
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
 from channels.handler import AsgiHandler, AsgiRequest
-from six import string_types
-from corsheaders.middleware import CorsMiddleware
+from six import string_types, text_type
+
+from .binarycodecs import get_binary_codec
+from .cache import NOT_CACHED, ResultCache
+from .coalescing import Coalescer
+from .compression import available_encodings, compress, negotiate
+from .cors import CorsHandler
+from .executors import call_in_process, check_executor
+from .httpbody import JsonArraySplitter, RequestTooLarge, bodyless_message, is_json_array, iter_body
+from .idempotency import IdempotencyStore
+from .jsoncodecs import get_codec
+from .metrics import RequestMetrics, registry as metrics_registry
+from .outbox import NotificationBuffer
+from .ratelimit import SESSION_ADDRESS_KEY, RateLimit
+from .registry import get_transport, registry
+from .requestlog import RequestLog
+from .subscriptions import SubscriptionManager
+from .timeouts import CallTimeout, Deadline, ExecutorBusy, TimeoutExecutor, call_with_deadline
+from .validation import InvalidParams, compile_params_validator
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
+# Guards the lazy creation of the executors shared by a consumer class
+_executors_lock = threading.Lock()
+
+# JSON codec of each consumer class
+_json_codecs = {}
+
+# Binary codec of each consumer class, with the `binary_codec` option it was built from
+_binary_codecs = {}
+
+
+# CORS handler of each consumer class
+_cors_handlers = {}
+
+# Rate limit of each consumer class, with the `rate_limit` option it was built from
+_rate_limits = {}
+
+# Request log of each consumer class
+_request_logs = {}
+
+# Notification buffer of each consumer class, with the `notification_buffer` option it was built from
+_notification_buffers = {}
+
+
+def _call_sync(call_plan, params, original_msg, deadline=None):
+    """
+    Call a synchronous RPC method from an executor thread
+    """
+    try:
+        return call_with_deadline(deadline, call_plan, params, original_msg)
+    finally:
+        close_old_connections()
+
+
+@receiver(setting_changed)
+def _reset_json_codecs(setting, **kwargs):
+    if setting == 'CHANNELS_JSONRPC_CODEC':
+        _json_codecs.clear()
+
+
+@receiver(setting_changed)
+def _reset_cors_handlers(setting, **kwargs):
+    if setting.startswith('CORS_'):
+        _cors_handlers.clear()
+
+
+@receiver(setting_changed)
+def _reset_request_logs(setting, **kwargs):
+    if setting in ('DEBUG', 'LOGGING'):
+        _request_logs.clear()
+
 
 class JsonRpcException(Exception):
     """
@@ -43,18 +135,269 @@ class JsonRpcException(Exception):
         return JsonRpcConsumer.error(self.rpc_id, self.code, self.message, self.data)
 
     def __str__(self):
-        return json.dumps(self.as_dict())
+        return JsonRpcConsumer._encode(self.as_dict())
 
 
 class MethodNotSupported(Exception):
     pass
 
 
+class EncodedResult(object):
+    """
+    Encoded result of a call, as kept by the result cache, with its ETag
+    """
+    __slots__ = ('text', 'etag')
+
+    def __init__(self, text):
+        self.text = text
+        self.etag = '"%s"' % hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EncodedFrame(text_type):
+    """
+    Response frame that is already encoded: the consumers send it as it is.
+    `etag` is the ETag of its result, if any.
+    """
+    etag = None
+
+
+class StreamedResult(object):
+    """
+    Result of a call to an RPC method returning an iterator (e.g. a generator): its items are encoded and sent as
+    they are produced, `stream_chunk_size` at a time, so the whole result is never held in memory.
+    """
+
+    def __init__(self, consumer_class, data, iterator):
+        """
+        :param consumer_class: JsonRpcConsumer class whose codec encodes the items
+        :param dict data: request
+        :param iterator: result of the method
+        """
+        self.consumer_class = consumer_class
+        self.data = data
+        self.iterator = iterator
+
+    def chunks(self):
+        """
+        Yields the items of the result, in lists of at most `stream_chunk_size` items. The items produced before
+        an exception raised by the iterator are yielded before it is raised.
+        """
+        size = self.consumer_class.stream_chunk_size
+        chunk = []
+        try:
+            for item in self.iterator:
+                chunk.append(item)
+                if len(chunk) >= size:
+                    yield chunk
+                    chunk = []
+        except Exception:
+            if chunk:
+                yield chunk
+            raise
+        if chunk:
+            yield chunk
+
+    def frames(self, encode=None):
+        """
+        Yields the WebSocket frames of the result: `stream_method` notifications with the id of the call and the items,
+        then the response to the call, whose result is the number of items (or the error raised by the iterator)
+        :param encode: function encoding the frames, defaults to the JSON codec of the consumer
+        """
+        cls = self.consumer_class
+        encode = encode or cls._encode
+        _id = self.data.get('id')
+        count = 0
+        try:
+            for items in self.chunks():
+                count += len(items)
+                yield encode(cls.json_rpc_frame(method=cls.stream_method, params={'id': _id, 'items': items}))
+            response = cls.json_rpc_frame(result={'count': count}, _id=_id)
+        except Exception as e:
+            response = cls._application_error(self.data, e)
+        yield encode(response)
+
+    def http_content(self):
+        """
+        Returns the chunks of the encoded response to the call, its result being the list of the items.
+
+        The first `stream_chunk_size` items are produced before the response is started, so an exception raised by
+        the iterator until then is raised here, and the call is answered with an error. Once started, the response
+        can't hold the error as well as the result: an exception raised by the iterator is logged and the response
+        ends before the list is closed, so that clients get an invalid document rather than a truncated result.
+        :return: iterator of bytes
+        :raise Exception: raised by the iterator before the first items were produced
+        """
+        first = list(itertools.islice(self.iterator, self.consumer_class.stream_chunk_size))
+        return self._http_chunks(first)
+
+    def _http_chunks(self, first):
+        cls = self.consumer_class
+        yield ('{"jsonrpc": "2.0", "id": %s, "result": [' % cls._encode(self.data.get('id'))).encode('utf-8')
+        if first:
+            yield b', '.join(cls._encode_bytes(item) for item in first)
+            try:
+                for items in self.chunks():
+                    yield b', ' + b', '.join(cls._encode_bytes(item) for item in items)
+            except Exception:
+                logger.exception('Error while streaming the result of %s, response cut', self.data.get('method'))
+                return
+        yield b']}'
+
+    def as_dict(self):
+        """
+        Returns the response with the whole result, for calls of a batch
+        :return: dict
+        """
+        try:
+            return self.consumer_class.json_rpc_frame(result=list(self.iterator), _id=self.data.get('id'))
+        except Exception as e:
+            return self.consumer_class._application_error(self.data, e)
+
+
+class PreparedNotification(object):
+    """
+    JSON-RPC notification encoded once, that can be sent any number of times to groups and reply channels
+    without being encoded again.
+    """
+
+    def __init__(self, consumer_class, method, params=None, binary=False):
+        """
+        :param consumer_class: JsonRpcConsumer class whose codec encodes the notification
+        :param method: JSON-RPC method
+        :param params: params of the method
+        :param bool binary: encode the notification with the binary codec of the consumer, in a binary frame
+        """
+        self.method = method
+        self.params = params
+        frame = JsonRpcConsumer.json_rpc_frame(method=method, params=params)
+        if binary:
+            self.text = None
+            content = {"bytes": consumer_class._encode_binary(frame)}
+        else:
+            self.text = consumer_class._encode(frame)
+            content = {"text": self.text}
+        # compressed once, whatever the number of recipients
+        self.content = consumer_class._compress_websocket(content)
+
+    def send_to_group(self, group_name):
+        """
+        Send the notification to a group
+        :param group_name: Group name
+        :return: None
+        """
+        Group(group_name).send(self.content)
+
+    def send_to_groups(self, group_names):
+        """
+        Send the notification to several groups
+        :param group_names: iterable of group names
+        :return: None
+        """
+        for group_name in group_names:
+            Group(group_name).send(self.content)
+
+    def send_to_channel(self, reply_channel):
+        """
+        Send the notification to a reply channel
+        :param reply_channel: Reply channel, or its name
+        :return: None
+        """
+        if isinstance(reply_channel, string_types):
+            reply_channel = Channel(reply_channel)
+        reply_channel.send(self.content)
+
+    def send_to_channels(self, reply_channels):
+        """
+        Send the notification to several reply channels
+        :param reply_channels: iterable of reply channels, or of their names
+        :return: None
+        """
+        for reply_channel in reply_channels:
+            self.send_to_channel(reply_channel)
+
+
+class CallPlan(object):
+    """
+    Precomputed call description of an RPC function, built once when the function is registered so that
+    dispatching a call doesn't need to introspect the function again.
+
+    >>> def f(a, b=1, **kwargs): pass
+    >>> plan = CallPlan(f)
+    >>> plan.takes_original_message, plan.positional, plan.required, plan.min_arity, plan.max_arity
+    (True, ('a', 'b'), ('a',), 1, 2)
+    """
+
+    __slots__ = ('func', 'is_coroutine', 'takes_original_message', 'message_index', 'positional', 'keywords',
+                 'required', 'varkw', 'min_arity', 'max_arity', 'annotations')
+
+    def __init__(self, func):
+        spec = getfullargspec(func)
+        varkw = getattr(spec, keywords_args)
+        kwonlyargs = getattr(spec, 'kwonlyargs', None) or []
+        kwonlydefaults = getattr(spec, 'kwonlydefaults', None) or {}
+        defaults = spec.defaults or ()
+
+        self.func = func
+        self.is_coroutine = iscoroutinefunction(func)
+        # original_message is given to functions accepting **kwargs (as before the call plans, not to other **kw
+        # names) or naming it explicitly
+        self.takes_original_message = bool(varkw and 'kwargs' in varkw) or 'original_message' in spec.args or \
+            'original_message' in kwonlyargs
+        # position of an original_message positional parameter, the list params are bound around it
+        self.message_index = spec.args.index('original_message') if 'original_message' in spec.args else None
+        self.positional = tuple(arg for arg in spec.args if arg != 'original_message')
+        self.keywords = tuple(arg for arg in kwonlyargs if arg != 'original_message')
+
+        required = len(spec.args) - len(defaults)
+        self.required = tuple(arg for arg in spec.args[:required] if arg != 'original_message') + \
+            tuple(arg for arg in self.keywords if arg not in kwonlydefaults)
+        self.varkw = bool(varkw)
+        self.min_arity = len(self.required)
+        self.max_arity = None if spec.varargs else len(self.positional)
+        self.annotations = getattr(spec, 'annotations', None) or {}
+
+    def __call__(self, params, original_msg):
+        """
+        Call the function with the JSON-RPC params
+        :param list|dict params: params of the call
+        :param channels.message.Message original_msg: message to pass as original_message, if accepted
+        :return: result of the function
+        """
+        if self.takes_original_message:
+            if isinstance(params, list):
+                index = self.message_index
+                if index is not None and index < len(params):
+                    return self.func(*(params[:index] + [original_msg] + params[index:]))
+                return self.func(*params, original_message=original_msg)
+            return self.func(original_message=original_msg, **params)
+        if isinstance(params, list):
+            return self.func(*params)
+        return self.func(**params)
+
+
+class _AvailableMethods(object):
+    """
+    Read-only view of the methods (or notifications) of a consumer class in the former format of the
+    `available_rpc_methods` and `available_rpc_notifications` attributes: {id(class): {RPC name: function}}
+    """
+
+    def __init__(self, notification=False):
+        self.notification = notification
+
+    def __get__(self, instance, owner):
+        kind = 'notifications' if self.notification else 'methods'
+        warnings.warn('available_rpc_%s is deprecated, use get_rpc_%s()' % (kind, kind), DeprecationWarning,
+                      stacklevel=2)
+        methods = registry.get_methods(owner, self.notification)
+        return {id(owner): dict((name, method.func) for name, method in methods.items())}
+
+
 class JsonRpcConsumer(WebsocketConsumer):
     """
     Variant of WebsocketConsumer that automatically JSON-encodes and decodes
-    messages as they come in and go out. Expects everything to be text; will
-    error on binary data.
+    messages as they come in and go out. Binary frames are decoded with the
+    `binary_codec` of the consumer, and answered with binary frames; without
+    one, they are answered with an Invalid Request error.
 
     http://groups.google.com/group/json-rpc/web/json-rpc-2-0
     errors:
@@ -66,7 +409,12 @@ class JsonRpcConsumer(WebsocketConsumer):
     -32602 	Invalid params 	Invalid method parameter(s).
     -32603 	Internal error 	Internal JSON-RPC error.
     -32099 to -32000
-            Server error 	Reserved for implementation-defined server-errors. (@TODO)
+            Server error 	Reserved for implementation-defined server-errors:
+    -32000 	Application error 	The method raised an exception (GENERIC_APPLICATION_ERROR).
+    -32001 	Request too large 	The HTTP body exceeds `max_request_size` (REQUEST_TOO_LARGE).
+    -32002 	Rate limited 	The client exceeded its rate limit (RATE_LIMITED).
+    -32003 	Execution timeout 	The method didn't return within its timeout (EXECUTION_TIMEOUT).
+    -32004 	Server busy 	No thread was free to run the method within its timeout (SERVER_BUSY).
 
     """
     # Add http.request alogn with default websocket events
@@ -77,12 +425,20 @@ class JsonRpcConsumer(WebsocketConsumer):
         "http.request": "http_handler"
     }
 
+    # Deprecated, see get_rpc_methods() and get_rpc_notifications()
+    available_rpc_methods = _AvailableMethods()
+    available_rpc_notifications = _AvailableMethods(notification=True)
+
     PARSE_ERROR = -32700
     INVALID_REQUEST = -32600
     METHOD_NOT_FOUND = -32601
     INVALID_PARAMS = -32602
     INTERNAL_ERROR = -32603
     GENERIC_APPLICATION_ERROR = -32000
+    REQUEST_TOO_LARGE = -32001
+    RATE_LIMITED = -32002
+    EXECUTION_TIMEOUT = -32003
+    SERVER_BUSY = -32004
 
     errors = dict()
     errors[PARSE_ERROR] = "Parse Error"
@@ -91,6 +447,10 @@ class JsonRpcConsumer(WebsocketConsumer):
     errors[INVALID_PARAMS] = "Invalid Params"
     errors[INTERNAL_ERROR] = "Internal Error"
     errors[GENERIC_APPLICATION_ERROR] = "Application Error"
+    errors[REQUEST_TOO_LARGE] = "Request Too Large"
+    errors[RATE_LIMITED] = "Rate Limited"
+    errors[EXECUTION_TIMEOUT] = "Execution Timeout"
+    errors[SERVER_BUSY] = "Server Busy"
 
     _http_codes = {
         PARSE_ERROR: 500,
@@ -98,76 +458,345 @@ class JsonRpcConsumer(WebsocketConsumer):
         METHOD_NOT_FOUND: 404,
         INVALID_PARAMS: 500,
         INTERNAL_ERROR: 500,
-        GENERIC_APPLICATION_ERROR: 500
+        GENERIC_APPLICATION_ERROR: 500,
+        REQUEST_TOO_LARGE: 413,
+        RATE_LIMITED: 429,
+        EXECUTION_TIMEOUT: 504,
+        SERVER_BUSY: 503
     }
 
     json_encoder_class = None
 
-    available_rpc_methods = dict()
-    available_rpc_notifications = dict()
+    # Class handling CORS on the HTTP transport, instantiated once per consumer class
+    cors_handler_class = CorsHandler
+
+    # JSON codec: 'json', 'orjson', 'rapidjson', 'ujson', 'auto' or a JsonCodec subclass.
+    # Defaults to the CHANNELS_JSONRPC_CODEC setting, then to 'json'
+    json_codec = None
+
+    # Codec of the binary WebSocket frames: 'msgpack', 'cbor' or a BinaryCodec subclass. Binary frames are decoded
+    # with it and answered with binary frames. None to only accept text frames
+    binary_codec = None
+
+    # Set to a number of threads to run the calls of a batch concurrently
+    batch_max_workers = None
+    _batch_executor = None
+
+    # Executor running the methods declared with rpc_method(executor='process'). Defaults to a process pool of
+    # `process_max_workers` processes (the number of CPUs by default). The worker still waits for the result, see
+    # AsyncJsonRpcConsumer to handle other requests meanwhile
+    process_executor = None
+    process_max_workers = None
+    _process_executor = None
+
+    # Maximum number of seconds to wait for the result of a method run in the process pool, if it has no timeout
+    process_timeout = None
+
+    # Default execution timeout of the RPC methods, in seconds. Calls exceeding it get an EXECUTION_TIMEOUT error
+    call_timeout = None
+
+    # Executor running the synchronous methods that have a timeout, so the worker stops waiting for them when it
+    # expires. Defaults to a TimeoutExecutor of `timeout_max_workers` threads, whose threads stay busy until their calls
+    # return, even after their timeout: calls it has no free thread for get a SERVER_BUSY error
+    timeout_executor = None
+    timeout_max_workers = None
+    _timeout_executor = None
+
+    # Maximum size of the HTTP request bodies, in bytes. Larger requests are rejected as they are received
+    http_max_body_size = None
+
+    # Set to True to handle the calls of HTTP batches as they are received, without buffering the whole body
+    http_streaming = False
+
+    # Rate of the requests of each client: a rate ('100/s'), a dict of RateLimit arguments or a RateLimit.
+    # Requests beyond it are rejected before being parsed
+    rate_limit = None
+
+    # Method of the notifications carrying the items of streamed results, and number of items per notification
+    stream_method = 'rpc.stream'
+    stream_chunk_size = 100
+
+    # Set to True to record metrics in channels_jsonrpc.metrics.registry, or to a MetricsRegistry
+    metrics = None
+
+    # Collect the notifications sent with notify_group(), notify_channel() and their plural forms for a few
+    # milliseconds, sending those of a group or reply channel in one batch: True, a window in seconds, a dict of
+    # NotificationBuffer arguments or a NotificationBuffer
+    notification_buffer = None
+
+    # Encodings the HTTP responses can be compressed with, negotiated with the Accept-Encoding header: True for all
+    # the installed ones, or a tuple of 'zstd', 'br' and 'gzip' in order of preference. Responses smaller than
+    # `compression_min_size` bytes are not compressed
+    http_compression = None
+    compression_min_size = 1024
+
+    # Send the WebSocket responses and notifications larger than this number of bytes in a gzip envelope
+    websocket_compression_min_size = None
+
+    # channels_jsonrpc.subscriptions.SubscriptionManager of the topics clients subscribe to, set by
+    # enable_subscriptions()
+    subscriptions = None
+
+    # Consumer classes whose RPC methods and notifications this consumer dispatches too, on the same connection or
+    # HTTP endpoint, by prefix: with {'billing': BillingConsumer}, 'billing.charge' calls the 'charge' method of
+    # BillingConsumer. The settings of this consumer (codec, limits, timeouts...) apply to all the calls
+    mounts = None
+
+    # Log the calls with their params and results at DEBUG level. Defaults to settings.DEBUG.
+    # Set log_sample to N to log only 1 call in N
+    log_calls = None
+    log_sample = 1
 
     @classmethod
-    def rpc_method(cls, rpc_name=None, websocket=True, http=True):
+    def rpc_method(cls, rpc_name=None, websocket=True, http=True, cache=None, rate=None, executor=None,
+                   timeout=None, params_schema=None, validate=None, coalesce=None, idempotent=None):
         """
         Decorator to list RPC methodds available. An optional name and protocol rectrictions can be added
         :param rpc_name: RPC name for the function
         :param bool websocket: if websocket transport can use this function
         :param bool http:if http transport can use this function
+        :param cache: cache the results: True, a TTL in seconds, a dict of ResultCache arguments or a ResultCache
+        :param rate: limit the rate of the calls of each client: a rate ('10/s'), a dict of RateLimit arguments or a
+            RateLimit
+        :param str executor: 'process' to run the function in the process pool of the consumer, for CPU-bound
+            functions. They must be defined at module level, and can't take original_message or **kwargs
+        :param float timeout: execution timeout of the calls, in seconds, defaults to the `call_timeout` of the
+            consumer
+        :param dict params_schema: schema of the params, by name: a type or a JSON Schema (see
+            channels_jsonrpc.validation). Invalid params are answered with INVALID_PARAMS without calling the function
+        :param bool validate: validate the params against the signature and the annotations of the function,
+            defaults to True when params_schema is given
+        :param coalesce: share the execution of identical concurrent calls: True, 'django' to coalesce them between
+            workers, a dict of Coalescer arguments or a Coalescer
+        :param idempotent: store the results by idempotency key, so retried calls get them without calling the
+            function again: True, a TTL in seconds, a dict of IdempotencyStore arguments or an IdempotencyStore
         :return: decorated function
         """
 
         def wrap(f):
             name = rpc_name if rpc_name is not None else f.__name__
-            cid = id(cls)
-            if cid not in cls.available_rpc_methods:
-                cls.available_rpc_methods[cid] = dict()
-            f.options = dict(websocket=websocket, http=http)
-            cls.available_rpc_methods[cid][name] = f
+            result_cache = ResultCache.from_option(cache)
+            coalescer = Coalescer.from_option(coalesce)
+            idempotency = IdempotencyStore.from_option(idempotent)
+            rate_limit = RateLimit.from_option(rate)
+            if websocket:
+                cls._check_rate_limit_key(rate_limit)
+            call_plan = CallPlan(f)
+            check_executor(executor, call_plan)
+            validator = cls._compile_validator(call_plan, params_schema, validate)
+            takes_original_message = call_plan.takes_original_message
+            options = dict(websocket=websocket, http=http,
+                           cache=result_cache.bind(name, cls, takes_original_message)
+                           if result_cache is not None else None,
+                           rate=rate_limit.bind(name, cls) if rate_limit is not None else None,
+                           executor=executor, timeout=timeout, validator=validator,
+                           coalesce=coalescer.bind(name, cls, takes_original_message)
+                           if coalescer is not None else None,
+                           idempotency=idempotency.bind(name, cls) if idempotency is not None else None)
+            registry.register(cls, name, f, options, call_plan)
 
             return f
 
         return wrap
 
+    @staticmethod
+    def _compile_validator(call_plan, params_schema=None, validate=None):
+        """
+        Compile the params validator of an RPC function
+        :param CallPlan call_plan: call plan of the function
+        :param dict params_schema: `params_schema` option
+        :param bool validate: `validate` option
+        :return: function, None if the params aren't validated
+        """
+        if validate is None:
+            validate = params_schema is not None
+        if not validate:
+            return None
+        return compile_params_validator(call_plan, params_schema, call_plan.annotations)
+
     @classmethod
     def get_rpc_methods(cls):
         """
-        Returns the RPC methods available for this consumer
+        Returns the RPC methods available for this consumer, including the ones of its parent classes
         :return: list
         """
-        if id(cls) not in cls.available_rpc_methods:
-            return []
-        return list(cls.available_rpc_methods[id(cls)].keys())
+        return list(registry.get_methods(cls).keys())
 
     @classmethod
-    def rpc_notification(cls, rpc_name=None, websocket=True, http=True):
+    def rpc_notification(cls, rpc_name=None, websocket=True, http=True, rate=None, executor=None, timeout=None,
+                         params_schema=None, validate=None):
         """
         Decorator to list RPC notifications available. An optional name can be added
         :param rpc_name: RPC name for the function
         :param bool websocket: if websocket transport can use this function
         :param bool http:if http transport can use this function
+        :param rate: limit the rate of the notifications of each client, see rpc_method()
+        :param str executor: 'process' to run the function in the process pool of the consumer, see rpc_method()
+        :param float timeout: execution timeout, see rpc_method()
+        :param dict params_schema: schema of the params, see rpc_method()
+        :param bool validate: validate the params, see rpc_method()
         :return: decorated function
         """
 
         def wrap(f):
             name = rpc_name if rpc_name is not None else f.__name__
-            cid = id(cls)
-            if cid not in cls.available_rpc_notifications:
-                cls.available_rpc_notifications[cid] = dict()
-            f.options = dict(websocket=websocket, http=http)
-            cls.available_rpc_notifications[cid][name] = f
+            rate_limit = RateLimit.from_option(rate)
+            if websocket:
+                cls._check_rate_limit_key(rate_limit)
+            call_plan = CallPlan(f)
+            check_executor(executor, call_plan)
+            validator = cls._compile_validator(call_plan, params_schema, validate)
+            options = dict(websocket=websocket, http=http, cache=None,
+                           rate=rate_limit.bind(name, cls) if rate_limit is not None else None,
+                           executor=executor, timeout=timeout, validator=validator, coalesce=None,
+                           idempotency=None)
+            registry.register(cls, name, f, options, call_plan, notification=True)
             return f
 
         return wrap
 
+    @classmethod
+    def enable_subscriptions(cls, subscriptions=True, subscribe='subscribe', unsubscribe='unsubscribe'):
+        """
+        Register the RPC methods subscribing WebSocket clients to the topics published with publish(). Connections
+        are unsubscribed from their topics when they close.
+        :param subscriptions: True, 'django' to share the topics between processes, a dict of SubscriptionManager
+            arguments or a SubscriptionManager
+        :param str subscribe: RPC name of the method subscribing to a topic
+        :param str unsubscribe: RPC name of the method unsubscribing from a topic
+        :return: channels_jsonrpc.subscriptions.SubscriptionManager
+        """
+        manager = cls.subscriptions = SubscriptionManager.from_option(subscriptions).bind(cls)
+
+        def subscribe_method(topic, version=None, **kwargs):
+            return manager.subscribe(topic, kwargs['original_message'], version)
+
+        def unsubscribe_method(topic, **kwargs):
+            manager.unsubscribe(topic, kwargs['original_message'])
+            return True
+
+        # a version that isn't a number of versions can't be compared with the ones of the topic
+        cls.rpc_method(subscribe, http=False,
+                       params_schema={'version': {'type': ['integer', 'null'], 'minimum': 0}})(subscribe_method)
+        cls.rpc_method(unsubscribe, http=False)(unsubscribe_method)
+        return manager
+
+    @classmethod
+    def publish(cls, topic, state):
+        """
+        Publish the new state of a topic: its subscribers are notified with the JSON Patch from the previous state
+        :param str topic: topic
+        :param state: JSON value
+        :return: int, version of the topic
+        """
+        if cls.subscriptions is None:
+            raise ValueError('Subscriptions are not enabled on %s' % cls.__name__)
+        return cls.subscriptions.publish(topic, state)
+
+    @classmethod
+    def mount(cls, prefix, consumer_class):
+        """
+        Dispatch the RPC methods and notifications of another consumer class under a prefix
+        :param str prefix: prefix of their RPC names, e.g. 'billing' for 'billing.charge'
+        :param consumer_class: JsonRpcConsumer subclass
+        :return: None
+        """
+        if not isinstance(prefix, string_types) or not prefix or prefix.startswith('_'):
+            raise ValueError('Invalid prefix: %r' % (prefix, ))
+        if consumer_class is cls or cls in consumer_class._get_mounted_classes():
+            raise ValueError('%s can\'t be mounted on %s' % (consumer_class.__name__, cls.__name__))
+        # copied, as the subclasses share the mounts of their parent
+        mounts = dict(cls.mounts or {})
+        mounts[prefix] = consumer_class
+        cls.mounts = mounts
+        registry.clear_tables()
+
+    @classmethod
+    def _get_mounted_classes(cls):
+        """
+        Returns the consumer classes mounted on this class, and on the classes mounted on it
+        :return: list
+        """
+        mounted_classes = []
+        for consumer_class in (cls.mounts or {}).values():
+            mounted_classes.append(consumer_class)
+            mounted_classes.extend(consumer_class._get_mounted_classes())
+        return mounted_classes
+
+    def raw_connect(self, message, **kwargs):
+        # only the connection message carries the address of the client, kept for the rate limits by 'ip'
+        client = message.get('client')
+        session = getattr(message, 'channel_session', None)
+        if client and session is not None:
+            session[SESSION_ADDRESS_KEY] = client[0]
+        super(JsonRpcConsumer, self).raw_connect(message, **kwargs)
+
+    def raw_disconnect(self, message, **kwargs):
+        # the connection may have subscribed to the topics of the mounted classes too
+        managers = set(consumer_class.subscriptions for consumer_class in [type(self)] + self._get_mounted_classes())
+        managers.discard(None)
+        for manager in managers:
+            manager.disconnect(message.reply_channel)
+        super(JsonRpcConsumer, self).raw_disconnect(message, **kwargs)
+
+    @classmethod
+    def get_result_cache(cls, rpc_name):
+        """
+        Returns the result cache of an RPC method
+        :param str rpc_name: RPC name of the method
+        :return: channels_jsonrpc.cache.ResultCache, None if the method doesn't cache its results
+        """
+        return registry.get_methods(cls)[rpc_name].options['cache']
+
+    @classmethod
+    def invalidate_cache(cls, rpc_name, params=None, original_message=None):
+        """
+        Invalidate the cached results of an RPC method
+        :param str rpc_name: RPC name of the method
+        :param params: params of the call to invalidate, None to invalidate all the results of the method
+        :param original_message: original message of the call, or its scope ('user:<pk>'), for per user caches
+        :return: None
+        """
+        result_cache = cls.get_result_cache(rpc_name)
+        if result_cache is not None:
+            result_cache.invalidate(params, original_message)
+
+    @classmethod
+    def is_rpc_name(cls, name):
+        """
+        Returns whether an RPC method or notification is registered under a name
+        :param str name: RPC name
+        :return: bool
+        """
+        return name in registry.get_methods(cls) or name in registry.get_methods(cls, notification=True)
+
+    @classmethod
+    def get_metrics(cls):
+        """
+        Returns the metrics of the consumer
+        :return: channels_jsonrpc.metrics.ConsumerMetrics, None if the consumer doesn't record metrics
+        """
+        if not cls.metrics:
+            return None
+        registry = metrics_registry if cls.metrics is True else cls.metrics
+        return registry.consumer(cls)
+
+    @classmethod
+    def _get_request_metrics(cls):
+        """
+        Returns the object recording the metrics of a request, None if the consumer doesn't record metrics
+        :return: channels_jsonrpc.metrics.RequestMetrics
+        """
+        metrics = cls.get_metrics()
+        return RequestMetrics(metrics) if metrics is not None else None
+
     @classmethod
     def get_rpc_notifications(cls):
         """
-        Returns the RPC methods available for this consumer
+        Returns the RPC notifications available for this consumer, including the ones of its parent classes
         :return: list
         """
-        if id(cls) not in cls.available_rpc_notifications:
-            return []
-        return list(cls.available_rpc_notifications[id(cls)].keys())
+        return list(registry.get_methods(cls, notification=True).keys())
 
     @staticmethod
     def json_rpc_frame(_id=None, result=None, params=None, method=None, error=None):
@@ -200,6 +829,21 @@ class JsonRpcConsumer(WebsocketConsumer):
 
         return JsonRpcConsumer.json_rpc_frame(error=error, _id=_id)
 
+    def get_handler(self, message, **kwargs):
+        handler = super(JsonRpcConsumer, self).get_handler(message, **kwargs)
+        if message.channel.name == 'http.request' and self._reads_http_body():
+            # the body is read by the handler: hide it from the session decorators, and from AsgiRequest
+            return lambda message, **kwargs: handler(bodyless_message(message), **kwargs)
+        return handler
+
+    @classmethod
+    def _reads_http_body(cls):
+        """
+        Returns whether the HTTP bodies are read by the consumer, chunk by chunk, rather than by AsgiRequest
+        :return: bool
+        """
+        return cls.http_streaming or cls.http_max_body_size is not None
+
     def http_handler(self, message):
         """
         Called on HTTP request
@@ -210,41 +854,224 @@ class JsonRpcConsumer(WebsocketConsumer):
         request = AsgiRequest(message)
 
         # CORS
-        response = CorsMiddleware().process_request(request)
+        response = self.__class__._get_cors_handler().process_request(request)
         if not isinstance(response, HttpResponse):
+            request_metrics = self.__class__._get_request_metrics()
+            result = self.__class__._check_rate_limit(message, request_metrics)
+            if result is not None:
+                is_notification = False
+            elif self._reads_http_body():
+                try:
+                    result, is_notification = self.__handle_http_body(request, message, request_metrics)
+                except RequestAborted:
+                    return
+                except RequestTimeout:
+                    self._send_http_response(request, HttpResponse(status=408), message)
+                    return
+            else:
+                result, is_notification = self.__handle(self._get_http_content(request), message, request_metrics)
+            if request_metrics is None:
+                response = self._http_response(result, is_notification, request)
+            else:
+                start = timer()
+                response = self._http_response(result, is_notification, request)
+                if not response.streaming:
+                    request_metrics.encoded(timer() - start, len(response.content))
+
+        self._send_http_response(request, response, message)
+
+    def __handle_http_body(self, request, message, request_metrics=None):
+        """
+        Handle an HTTP request whose body is read from its chunks
+        :param request: channels.handler.AsgiRequest, without body
+        :param message: message of the request
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (result, is_notification)
+        """
+        executor = self.__class__._get_batch_executor()
+
+        def handle_call(data):
+            if executor is not None:
+                return executor.submit(self.__handle_batch_call, data, message, request_metrics)
+            return self.__handle_call(data, message, request_metrics)
+
+        try:
+            content, responses = self._read_http_body(request, handle_call, request_metrics)
+        except JsonRpcException as e:
+            result = e.as_dict()
+            if request_metrics is not None:
+                request_metrics.target.record_error(result)
+            return result, False
+
+        if responses is None:
+            return self.__handle(content, message, request_metrics)
+        if executor is not None:
+            responses = [future.result() for future in responses]
+        return self._batch_response(responses)
+
+    def _read_http_body(self, request, handle_call=None, request_metrics=None):
+        """
+        Read the body of an HTTP request from its chunks, rejecting it as soon as it exceeds `http_max_body_size`.
+        With `http_streaming`, `handle_call` is called with each call of a batch as soon as it is received.
+        :param request: channels.handler.AsgiRequest, without body
+        :param handle_call: function handling a decoded call
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (content, None), or (None, list of what handle_call returned) for a streamed batch
+        :raise JsonRpcException: if the request is too large, or the batch can't be decoded
+        """
+        if request.method != 'POST':
+            return '', None
 
-            # Try to process content
+        max_size = self.http_max_body_size
+        try:
+            if max_size is not None and int(request.META.get('CONTENT_LENGTH') or 0) > max_size:
+                raise JsonRpcException(None, self.REQUEST_TOO_LARGE)
+        except ValueError:
+            pass
+
+        # the handler got a copy of the message without the body, self.message is the one received
+        chunks = iter_body(self.message, max_size, request.body_receive_timeout)
+        try:
+            first = next(chunks, b'')
+            while self.http_streaming and first and is_json_array(first) is None:
+                # only whitespace: not yet known if the body is a batch
+                chunk = next(chunks, None)
+                if chunk is None:
+                    # the whole body is whitespace, rejected as any other body that isn't JSON
+                    break
+                first += chunk
+            if not self.http_streaming or not is_json_array(first):
+                content = first + b''.join(chunks)
+                if not self.__class__._get_codec().accepts_bytes:
+                    try:
+                        content = content.decode('utf-8')
+                    except UnicodeDecodeError:
+                        content = ''
+                return content, None
+
+            loads = self.__class__._get_codec().loads
+            splitter = JsonArraySplitter()
+            responses = []
+            size = 0
+            parse_time = 0
+            for chunk in itertools.chain((first, ), chunks):
+                size += len(chunk)
+                start = timer() if request_metrics is not None else None
+                elements = splitter.feed(chunk)
+                calls = [loads(element) for element in elements]
+                if request_metrics is not None:
+                    parse_time += timer() - start
+                responses.extend(handle_call(data) for data in calls)
+            splitter.close()
+        except RequestTooLarge:
+            raise JsonRpcException(None, self.REQUEST_TOO_LARGE)
+        except ValueError:
+            # json could not decoded
+            raise JsonRpcException(None, self.PARSE_ERROR)
+
+        if request_metrics is not None:
+            request_metrics.parsed([], parse_time, size)
+        if not responses:
+            raise JsonRpcException(None, self.INVALID_REQUEST)
+        return None, responses
+
+    def _get_http_content(self, request):
+        """
+        Returns the JSON-RPC content of an HTTP request
+        :param request: channels.handler.AsgiRequest
+        :return: str or bytes, empty if the request can't be processed
+        """
+        # Try to process content
+        try:
+            if request.method != 'POST':
+                raise MethodNotSupported('Only POST method is supported')
+            content = request.body
+            if not self.__class__._get_codec().accepts_bytes:
+                content = content.decode('utf-8')
+        except (UnicodeDecodeError, MethodNotSupported):
+            content = ''
+        return content
+
+    def _http_response(self, result, is_notification, request=None):
+        """
+        Build the HTTP response of a handled request
+        :param result: result of the request
+        :param bool is_notification: if the request is a notification
+        :param request: channels.handler.AsgiRequest, to check the ETag of cached results against
+        :return: django.http.HttpResponse
+        """
+        if isinstance(result, StreamedResult):
             try:
-                if request.method != 'POST':
-                    raise MethodNotSupported('Only POST method is supported')
-                content = request.body.decode('utf-8')
-            except (UnicodeDecodeError, MethodNotSupported):
-                content = ''
-            result, is_notification = self.__handle(content, message)
-
-            # Set response status code
-            # http://www.jsonrpc.org/historical/json-rpc-over-http.html#response-codes
-            if not is_notification:
-                # call response
-                status_code = 200
-                if 'error' in result:
-                    status_code = self._http_codes[result['error']['code']]
-            else:
-                # notification response
-                status_code = 204
-                if result and 'error' in result:
-                    status_code = self._http_codes[result['error']['code']]
-                result = ''
+                return StreamingHttpResponse(result.http_content(), content_type='application/json-rpc')
+            except Exception as e:
+                result = self._application_error(result.data, e)
 
-            response = HttpResponse(self.__class__._encode(result), content_type='application/json-rpc',
-                                    status=status_code)
+        # Set response status code
+        # http://www.jsonrpc.org/historical/json-rpc-over-http.html#response-codes
+        if not is_notification:
+            # call response
+            status_code = 200
+            if isinstance(result, dict) and 'error' in result:
+                status_code = self._http_codes[result['error']['code']]
+                if result['error']['code'] == self.RATE_LIMITED:
+                    response = HttpResponse(self.__class__._encode_bytes(result), content_type='application/json-rpc',
+                                            status=status_code)
+                    response['Retry-After'] = str(int(math.ceil(result['error']['data']['retry_after'])))
+                    return response
+            elif getattr(result, 'etag', None) is not None:
+                # the ETag of compressed responses is weak
+                if request is not None and request.META.get('HTTP_IF_NONE_MATCH') in (result.etag,
+                                                                                      'W/' + result.etag):
+                    response = HttpResponse(status=304)
+                else:
+                    response = HttpResponse(self.__class__._encode_bytes(result),
+                                            content_type='application/json-rpc', status=status_code)
+                response['ETag'] = result.etag
+                return response
+        else:
+            # notification response
+            status_code = 204
+            if result and 'error' in result:
+                status_code = self._http_codes[result['error']['code']]
+            result = None
 
+        return HttpResponse(self.__class__._encode_bytes(result) if result is not None else b'',
+                            content_type='application/json-rpc', status=status_code)
+
+    def _send_http_response(self, request, response, message):
+        """
+        Send an HTTP response on the reply channel of the request
+        :param request: channels.handler.AsgiRequest
+        :param response: django.http.HttpResponse
+        :param message: message of the request
+        :return: None
+        """
         # CORS
-        response = CorsMiddleware().process_response(request, response)
+        response = self.__class__._get_cors_handler().process_response(request, response)
+
+        if self.http_compression and not response.streaming:
+            response = self.__class__._compress_http_response(request, response)
 
         # Encode that response into message format (ASGI)
         for chunk in AsgiHandler.encode_response(response):
-            message.reply_channel.send(chunk)
+            # streamed chunks are sent as they are produced, not when the consumer returns
+            message.reply_channel.send(chunk, immediately=response.streaming)
+
+    @staticmethod
+    def _send_streamed_result(result, message, binary_codec=None):
+        """
+        Send the frames of a streamed result on a WebSocket as they are produced
+        :param StreamedResult result: result
+        :param message: message of the call
+        :param binary_codec: codec of the binary frames, if the call was received in one
+        :return: None
+        """
+        if binary_codec is None:
+            for text in result.frames():
+                message.reply_channel.send({"text": text}, immediately=True)
+        else:
+            for content in result.frames(partial(result.consumer_class._encode_binary, codec=binary_codec)):
+                message.reply_channel.send({"bytes": content}, immediately=True)
 
     def raw_receive(self, message, **kwargs):
         """
@@ -253,53 +1080,386 @@ class JsonRpcConsumer(WebsocketConsumer):
         :param kwargs:
         :return:
         """
-        content = '' if "text" not in message else message["text"]
-        result, is_notification = self.__handle(content, message)
+        content, binary_codec = self.__class__._get_frame_content(message)
+        request_metrics = self.__class__._get_request_metrics()
+        result = self.__class__._check_rate_limit(message, request_metrics)
+        if result is None:
+            result, is_notification = self.__handle(content, message, request_metrics, binary_codec)
+        else:
+            is_notification = False
 
         # Send responce back only if it is a call, not notification
-        if not is_notification:
-            self.send(text=self.__class__._encode(result))
+        if isinstance(result, StreamedResult):
+            self._send_streamed_result(result, message, binary_codec)
+        elif not is_notification:
+            if request_metrics is None:
+                self.message.reply_channel.send(self.__class__._encode_websocket(result, binary_codec))
+            else:
+                start = timer()
+                frame = self.__class__._encode_websocket(result, binary_codec)
+                request_metrics.encoded(timer() - start, len(frame['text'] if 'text' in frame else frame['bytes']))
+                self.message.reply_channel.send(frame)
 
-    def __handle(self, content, message):
+    def __handle(self, content, message, request_metrics=None, codec=None):
         """
         Handle
         :param content:
         :param message:
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :param codec: codec decoding the content, defaults to the JSON codec
         :return:
         """
         result = None
         is_notification = False
-        if content != '':
+        if content:
+            start = timer() if request_metrics is not None else None
             try:
-                data = json.loads(content)
+                data = (codec or self.__class__._get_codec()).loads(content)
             except ValueError:
                 # json could not decoded
                 result = self.error(None, self.PARSE_ERROR, self.errors[self.PARSE_ERROR])
+                if request_metrics is not None:
+                    request_metrics.parsed(None, timer() - start, len(content))
+                    request_metrics.target.record_error(result)
             else:
-                if isinstance(data, dict):
-
-                    try:
-                        if data.get('method') is not None and data.get('id') is None:
-                            is_notification = True
-                        result = self.__process(data, message, is_notification)
-                    except JsonRpcException as e:
-                        result = e.as_dict()
-                    except Exception as e:
-                        logger.debug('Application error', e)
-                        result = self.error(data.get('id'),
-                                            self.GENERIC_APPLICATION_ERROR,
-                                            str(e),
-                                            e.args[0] if len(e.args) == 1 else e.args)
-                elif isinstance(data, list):
-                    # TODO: implement batch calls
-                    if len([x for x in data if not isinstance(x, dict)]):
-                        result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+                if request_metrics is not None:
+                    request_metrics.parsed(data, timer() - start, len(content))
+                if isinstance(data, list):
+                    result, is_notification = self.__handle_batch(data, message, request_metrics)
+                else:
+                    result, is_notification = self.__handle_call(data, message, request_metrics)
 
         else:
             result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+            if request_metrics is not None:
+                request_metrics.target.record_error(result)
+
+        return result, is_notification
+
+    def __handle_call(self, data, message, request_metrics=None):
+        """
+        Handle a single call or notification
+        :param data: decoded request object
+        :param message: original message
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (result, is_notification)
+        """
+        result = None
+        is_notification = False
+        if not isinstance(data, dict):
+            result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+            if request_metrics is not None:
+                request_metrics.consumer.unknown.record_error(result)
+            return result, is_notification
 
+        start = timer() if request_metrics is not None else None
+        try:
+            if data.get('method') is not None and data.get('id') is None:
+                is_notification = True
+            result = self.__process(data, message, is_notification)
+        except JsonRpcException as e:
+            result = e.as_dict()
+            self._log_call(data, data.get('params', []), error=result['error'])
+        except Exception as e:
+            result = self._application_error(data, e)
+            self._log_call(data, data.get('params', []), error=result['error'])
+
+        if request_metrics is not None:
+            request_metrics.consumer.method(data.get('method')).record_call(timer() - start, result)
         return result, is_notification
 
+    @classmethod
+    def _application_error(cls, data, e):
+        """
+        Error answer for an exception raised by an RPC method
+        :param dict data: request
+        :param Exception e: exception raised
+        :return: dict
+        """
+        logger.debug('Application error in %s: %s', data.get('method'), e)
+        return cls.error(data.get('id'),
+                         cls.GENERIC_APPLICATION_ERROR,
+                         str(e),
+                         e.args[0] if len(e.args) == 1 else e.args)
+
+    def __handle_batch(self, data, message, request_metrics=None):
+        """
+        Handle a batch of calls. Responses are returned in the order of the calls, notifications have none.
+        :param list data: decoded request objects
+        :param message: original message
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (list of responses, is_notification)
+        """
+        if not data:
+            result = self.error(None, self.INVALID_REQUEST, self.errors[self.INVALID_REQUEST])
+            if request_metrics is not None:
+                request_metrics.target.record_error(result)
+            return result, False
+
+        executor = self.__class__._get_batch_executor() if len(data) > 1 else None
+        if executor is not None:
+            responses = executor.map(lambda call: self.__handle_batch_call(call, message, request_metrics), data)
+        else:
+            responses = [self.__handle_call(call, message, request_metrics) for call in data]
+
+        return self._batch_response(responses)
+
+    @staticmethod
+    def _batch_response(responses):
+        """
+        Response to a batch
+        :param responses: tuples (result, is_notification) of the calls of the batch
+        :return: tuple (list of responses, is_notification)
+        """
+        result = [response.as_dict() if isinstance(response, StreamedResult) else response
+                  for response, is_notification in responses if not is_notification]
+        if not result:
+            # batch of notifications only: nothing to answer
+            return None, True
+
+        return result, False
+
+    def __handle_batch_call(self, data, message, request_metrics=None):
+        """
+        Handle a call of a batch in a thread of the batch pool
+        :param data: decoded request object
+        :param message: original message
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: tuple (result, is_notification)
+        """
+        try:
+            return self.__handle_call(data, message, request_metrics)
+        finally:
+            close_old_connections()
+
+    @classmethod
+    def _get_batch_executor(cls):
+        """
+        Returns the thread pool running the calls of a batch concurrently, or None if `batch_max_workers` isn't set
+        :return: concurrent.futures.ThreadPoolExecutor
+        """
+        if not cls.batch_max_workers:
+            return None
+
+        executor = cls.__dict__.get('_batch_executor')
+        if executor is None:
+            with _executors_lock:
+                executor = cls.__dict__.get('_batch_executor')
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=cls.batch_max_workers)
+                    cls._batch_executor = executor
+        return executor
+
+    @classmethod
+    def _get_process_executor(cls):
+        """
+        Returns the executor running the methods declared with rpc_method(executor='process')
+        :return: concurrent.futures.Executor
+        """
+        if cls.process_executor is not None:
+            return cls.process_executor
+
+        executor = cls.__dict__.get('_process_executor')
+        if executor is None:
+            with _executors_lock:
+                executor = cls.__dict__.get('_process_executor')
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=cls.process_max_workers)
+                    cls._process_executor = executor
+        return executor
+
+    @classmethod
+    def _get_timeout_executor(cls):
+        """
+        Returns the executor running the synchronous methods that have a timeout
+        :return: channels_jsonrpc.timeouts.TimeoutExecutor, or the `timeout_executor` of the consumer
+        """
+        if cls.timeout_executor is not None:
+            return cls.timeout_executor
+
+        executor = cls.__dict__.get('_timeout_executor')
+        if executor is None:
+            with _executors_lock:
+                executor = cls.__dict__.get('_timeout_executor')
+                if executor is None:
+                    executor = TimeoutExecutor(max_workers=cls.timeout_max_workers or 4)
+                    cls._timeout_executor = executor
+        return executor
+
+    @classmethod
+    def _get_timeout(cls, method):
+        """
+        Returns the execution timeout of an RPC method
+        :param method: RPC method
+        :return: float, None if the calls aren't bounded
+        """
+        timeout = method.options['timeout']
+        if timeout is None:
+            timeout = cls.call_timeout
+        if timeout is None and method.options['executor'] == 'process':
+            timeout = cls.process_timeout
+        return timeout
+
+    @staticmethod
+    def _own_error(e, rpc_id):
+        """
+        Error of a coalesced call, raised by the execution of another call
+        :param JsonRpcException e: error of the execution
+        :param rpc_id: id of the call
+        :return: JsonRpcException
+        """
+        if e.rpc_id == rpc_id:
+            return e
+        return JsonRpcException(rpc_id, e.code, e.data)
+
+    @classmethod
+    def _timeout_error(cls, rpc_id, timeout):
+        """
+        Error of a call exceeding its timeout
+        :param rpc_id: id of the call
+        :param float timeout: timeout of the call
+        :return: JsonRpcException
+        """
+        return JsonRpcException(rpc_id, cls.EXECUTION_TIMEOUT, {'timeout': timeout})
+
+    @classmethod
+    def _busy_error(cls, rpc_id):
+        """
+        Error of a call that couldn't be started, all the threads of its executor being busy
+        :param rpc_id: id of the call
+        :return: JsonRpcException
+        """
+        return JsonRpcException(rpc_id, cls.SERVER_BUSY)
+
+    @classmethod
+    def _get_codec(cls):
+        """
+        Returns the JSON codec of the consumer
+        :return: channels_jsonrpc.jsoncodecs.JsonCodec
+        """
+        try:
+            return _json_codecs[cls]
+        except KeyError:
+            codec = cls.json_codec
+            if codec is None:
+                codec = getattr(settings, 'CHANNELS_JSONRPC_CODEC', None)
+            codec = _json_codecs[cls] = get_codec(codec, cls.json_encoder_class)
+            return codec
+
+    @classmethod
+    def _get_request_log(cls):
+        """
+        Returns the log of the calls of the consumer. It is set up once, from the options of the consumer, the
+        DEBUG setting and the level of the logger.
+        :return: channels_jsonrpc.requestlog.RequestLog
+        """
+        try:
+            return _request_logs[cls]
+        except KeyError:
+            enabled = cls.log_calls
+            if enabled is None:
+                enabled = settings.DEBUG
+            request_log = _request_logs[cls] = RequestLog(logger, enabled, cls.log_sample, cls._encode)
+            return request_log
+
+    @classmethod
+    def _get_binary_codec(cls):
+        """
+        Returns the codec of the binary WebSocket frames
+        :return: channels_jsonrpc.binarycodecs.BinaryCodec, None if binary frames aren't accepted
+        """
+        option = cls.binary_codec
+        try:
+            built_from, codec = _binary_codecs[cls]
+            if built_from is option:
+                return codec
+        except KeyError:
+            pass
+        codec = get_binary_codec(option, cls.json_encoder_class) if option is not None else None
+        _binary_codecs[cls] = (option, codec)
+        return codec
+
+    @classmethod
+    def _get_frame_content(cls, message):
+        """
+        Returns the content of a WebSocket frame, and the codec of binary frames
+        :param message: websocket.receive message
+        :return: tuple (content, binary codec or None for text frames)
+        """
+        text = message.get('text')
+        if text is None and message.get('bytes') is not None:
+            codec = cls._get_binary_codec()
+            if codec is not None:
+                # decoded without copying the frame
+                return memoryview(message['bytes']), codec
+        return text or '', None
+
+    @classmethod
+    def _get_rate_limit(cls):
+        """
+        Returns the rate limit of the consumer
+        :return: channels_jsonrpc.ratelimit.RateLimit, None if the rate isn't limited
+        """
+        option = cls.rate_limit
+        try:
+            built_from, rate_limit = _rate_limits[cls]
+            if built_from is option:
+                return rate_limit
+        except KeyError:
+            pass
+        rate_limit = RateLimit.from_option(option)
+        if rate_limit is not None:
+            cls._check_rate_limit_key(rate_limit)
+            rate_limit.bind('%s.%s' % (cls.__module__, cls.__name__))
+        _rate_limits[cls] = (option, rate_limit)
+        return rate_limit
+
+    @classmethod
+    def _check_rate_limit_key(cls, rate_limit):
+        """
+        Check that the WebSocket clients of a rate limit by 'ip' can be counted by address: only the connection
+        message carries it, and it is kept in the channel session
+        :param channels_jsonrpc.ratelimit.RateLimit rate_limit: rate limit, or None
+        :return: None
+        :raise ValueError: if the consumer has no channel session
+        """
+        if rate_limit is None or rate_limit.key != 'ip':
+            return
+        if not (cls.channel_session or cls.channel_session_user or cls.http_user or cls.http_user_and_session):
+            raise ValueError("Rate limits by 'ip' need a channel session on %s (channel_session = True), or "
+                             "websocket=False" % cls.__name__)
+
+    @classmethod
+    def _check_rate_limit(cls, message, request_metrics=None):
+        """
+        Admit a request under the rate limit of the consumer
+        :param message: message of the request
+        :param request_metrics: channels_jsonrpc.metrics.RequestMetrics, if the consumer records metrics
+        :return: None if the request is admitted, else the error to answer
+        """
+        rate_limit = cls._get_rate_limit()
+        if rate_limit is None:
+            return None
+        retry_after = rate_limit.check(message)
+        if not retry_after:
+            return None
+        result = cls.error(None, cls.RATE_LIMITED, cls.errors[cls.RATE_LIMITED], {'retry_after': retry_after})
+        if request_metrics is not None:
+            request_metrics.target.record_error(result)
+        return result
+
+    @classmethod
+    def _get_cors_handler(cls):
+        """
+        Returns the CORS handler of the consumer
+        :return: channels_jsonrpc.cors.CorsHandler
+        """
+        try:
+            return _cors_handlers[cls]
+        except KeyError:
+            handler = _cors_handlers[cls] = cls.cors_handler_class()
+            return handler
+
     @classmethod
     def _encode(cls, data):
         """
@@ -307,31 +1467,223 @@ class JsonRpcConsumer(WebsocketConsumer):
         :param data:
         :return:
         """
-        return json.dumps(data, cls=cls.json_encoder_class)
+        if isinstance(data, EncodedFrame):
+            return data
+        if isinstance(data, list) and any(isinstance(frame, EncodedFrame) for frame in data):
+            # batch response containing encoded frames
+            return '[%s]' % ', '.join(cls._encode(frame) for frame in data)
+        return cls._get_codec().dumps(data)
+
+    @classmethod
+    def _encode_bytes(cls, data):
+        """
+        Encode data object to UTF-8 encoded JSON
+        :param data:
+        :return: bytes
+        """
+        if isinstance(data, (EncodedFrame, list)):
+            return cls._encode(data).encode('utf-8')
+        return cls._get_codec().dumps_bytes(data)
+
+    @classmethod
+    def _encode_binary(cls, data, codec=None):
+        """
+        Encode data object with the binary codec. Frames already encoded in JSON are decoded first.
+        :param data:
+        :param codec: binary codec, defaults to the one of the consumer
+        :return: bytes
+        """
+        if isinstance(data, EncodedFrame):
+            data = cls._get_codec().loads(data)
+        elif isinstance(data, list) and any(isinstance(frame, EncodedFrame) for frame in data):
+            data = [cls._get_codec().loads(frame) if isinstance(frame, EncodedFrame) else frame for frame in data]
+        return (codec or cls._get_binary_codec()).dumps(data)
+
+    @classmethod
+    def _encode_websocket(cls, data, binary_codec=None):
+        """
+        Encode a response to the content of a WebSocket frame
+        :param data:
+        :param binary_codec: binary codec, for calls received in binary frames
+        :return: dict, {"text": ...} or {"bytes": ...}
+        """
+        if binary_codec is None:
+            return cls._compress_websocket({"text": cls._encode(data)})
+        return cls._compress_websocket({"bytes": cls._encode_binary(data, binary_codec)})
 
     @classmethod
-    def notify_group(cls, group_name, method, params=None):
+    def _compress(cls, data, encoding):
+        """
+        Compress data, recording the compression in the metrics
+        :param bytes data: data
+        :param str encoding: 'gzip', 'br' or 'zstd'
+        :return: bytes
+        """
+        metrics = cls.get_metrics()
+        if metrics is None:
+            return compress(data, encoding)
+        start = timer()
+        compressed = compress(data, encoding)
+        metrics.compression(encoding).record(len(data), len(compressed), timer() - start)
+        return compressed
+
+    @classmethod
+    def _compress_websocket(cls, content):
+        """
+        Put the content of a WebSocket frame in a gzip envelope if it is larger than `websocket_compression_min_size`
+        :param dict content: {"text": ...} or {"bytes": ...}
+        :return: dict
+        """
+        min_size = cls.websocket_compression_min_size
+        if min_size is None:
+            return content
+        data = content['bytes'] if 'bytes' in content else content['text']
+        if len(data) < min_size:
+            return content
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return {"bytes": cls._compress(data, 'gzip')}
+
+    @classmethod
+    def _compress_http_response(cls, request, response):
+        """
+        Compress an HTTP response with the encoding accepted by the client
+        :param request: channels.handler.AsgiRequest
+        :param response: django.http.HttpResponse
+        :return: django.http.HttpResponse
+        """
+        if response.status_code != 200 or response.has_header('Content-Encoding') or \
+                len(response.content) < cls.compression_min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), available_encodings(cls.http_compression))
+        if encoding is None:
+            return response
+
+        response.content = cls._compress(response.content, encoding)
+        response['Content-Length'] = str(len(response.content))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag is not None and not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    @classmethod
+    def _encode_frame(cls, _id, encoded_result):
+        """
+        Build the encoded response of a call from its encoded result, without encoding the result again
+        :param _id: id of the call
+        :param EncodedResult encoded_result: encoded result
+        :return: EncodedFrame
+        """
+        frame = EncodedFrame('{"jsonrpc": "2.0", "id": %s, "result": %s}' % (cls._encode(_id), encoded_result.text))
+        frame.etag = encoded_result.etag
+        return frame
+
+    @classmethod
+    def notify_group(cls, group_name, method, params=None, key=None):
         """
         Notify a group. Using JSON-RPC notificatons
         :param group_name: Group name
         :param method: JSON-RPC method
         :param params: parmas of the method
+        :param key: with a notification buffer, notifications with the same method and key supersede each other
         :return:
         """
-        content = JsonRpcConsumer.json_rpc_frame(method=method, params=params)
-        cls.group_send(group_name, cls._encode(content))
+        notification_buffer = cls._get_notification_buffer()
+        if notification_buffer is not None:
+            notification_buffer.add(('group', group_name), method, params, key)
+        else:
+            cls.prepare_notification(method, params).send_to_group(group_name)
 
     @classmethod
-    def notify_channel(cls, reply_channel, method, params):
+    def notify_channel(cls, reply_channel, method, params, key=None):
         """
         Notify a group. Using JSON-RPC notificatons
         :param reply_channel: Reply channel
         :param method: JSON-RPC method
         :param params: parmas of the method
+        :param key: with a notification buffer, notifications with the same method and key supersede each other
         :return:
         """
-        content = JsonRpcConsumer.json_rpc_frame(method=method, params=params)
-        reply_channel.send({"text": cls._encode(content)})
+        notification_buffer = cls._get_notification_buffer()
+        if notification_buffer is not None:
+            notification_buffer.add(('channel', getattr(reply_channel, 'name', reply_channel)), method, params, key)
+        else:
+            cls.prepare_notification(method, params).send_to_channel(reply_channel)
+
+    @classmethod
+    def _get_notification_buffer(cls):
+        """
+        Returns the notification buffer of the consumer
+        :return: channels_jsonrpc.outbox.NotificationBuffer, None if notifications are sent right away
+        """
+        option = cls.notification_buffer
+        try:
+            built_from, notification_buffer = _notification_buffers[cls]
+            if built_from is option:
+                return notification_buffer
+        except KeyError:
+            pass
+        notification_buffer = NotificationBuffer.from_option(option)
+        if notification_buffer is not None:
+            notification_buffer.bind(cls)
+        _notification_buffers[cls] = (option, notification_buffer)
+        return notification_buffer
+
+    @classmethod
+    def flush_notifications(cls):
+        """
+        Send the notifications collected by the notification buffer of the consumer without waiting
+        :return: None
+        """
+        notification_buffer = cls._get_notification_buffer()
+        if notification_buffer is not None:
+            notification_buffer.flush()
+
+    @classmethod
+    def prepare_notification(cls, method, params=None, binary=False):
+        """
+        Encode a notification once, to send it repeatedly. See PreparedNotification.
+        :param method: JSON-RPC method
+        :param params: params of the method
+        :param bool binary: encode the notification with the binary codec, for the clients using binary frames
+        :return: PreparedNotification
+        """
+        return PreparedNotification(cls, method, params, binary)
+
+    @classmethod
+    def notify_groups(cls, group_names, method, params=None):
+        """
+        Notify several groups with the same notification, encoded once
+        :param group_names: iterable of group names
+        :param method: JSON-RPC method
+        :param params: params of the method
+        :return: None
+        """
+        notification_buffer = cls._get_notification_buffer()
+        if notification_buffer is not None:
+            notification_buffer.add_to_targets([('group', group_name) for group_name in group_names], method, params)
+        else:
+            cls.prepare_notification(method, params).send_to_groups(group_names)
+
+    @classmethod
+    def notify_channels(cls, reply_channels, method, params=None):
+        """
+        Notify several reply channels with the same notification, encoded once
+        :param reply_channels: iterable of reply channels, or of their names
+        :param method: JSON-RPC method
+        :param params: params of the method
+        :return: None
+        """
+        notification_buffer = cls._get_notification_buffer()
+        if notification_buffer is not None:
+            notification_buffer.add_to_targets(
+                [('channel', getattr(reply_channel, 'name', reply_channel)) for reply_channel in reply_channels],
+                method, params)
+        else:
+            cls.prepare_notification(method, params).send_to_channels(reply_channels)
 
     @classmethod
     def __process(cls, data, original_msg, is_notification=False):
@@ -342,6 +1694,115 @@ class JsonRpcConsumer(WebsocketConsumer):
         :param bool is_notification:
         :return: dict
         """
+        method, params = cls._get_method(data, original_msg, is_notification)
+
+        idempotency = method.options['idempotency']
+        idempotency_key = idempotency.make_key(data, original_msg) if idempotency is not None else None
+        if method.options['cache'] is None and method.options['coalesce'] is None and idempotency_key is None:
+            result = cls.__call(method, params, original_msg, data.get('id'))
+            return cls._pack_result(data, params, result, is_notification)
+
+        # the encoded result is cached, shared or stored, to only substitute the id of the call
+        try:
+            if idempotency_key is None:
+                encoded_result = cls.__encoded_result(method, params, original_msg, data)
+            else:
+                encoded_result = idempotency.call(idempotency_key,
+                                                  partial(cls.__encoded_result, method, params, original_msg, data))
+        except JsonRpcException as e:
+            raise cls._own_error(e, data.get('id'))
+        cls._log_call(data, params, encoded_result)
+        return cls._encode_frame(data.get('id'), encoded_result)
+
+    @classmethod
+    def __encoded_result(cls, method, params, original_msg, data):
+        """
+        Returns the encoded result of a call, from the result cache of the method, or shared with the identical calls
+        being executed
+        :param method: RPC method
+        :param params: params of the call
+        :param original_msg: original message
+        :param dict data: request
+        :return: EncodedResult
+        """
+        result_cache = method.options['cache']
+        if result_cache is not None:
+            key = result_cache.make_key(params, original_msg)
+            encoded_result = result_cache.get(key)
+            if encoded_result is not NOT_CACHED:
+                return encoded_result
+
+        def execute():
+            result = cls.__call(method, params, original_msg, data.get('id'))
+            if isinstance(result, Iterator):
+                result = list(result)
+            return EncodedResult(cls._encode(result))
+
+        coalescer = method.options['coalesce']
+        if coalescer is None:
+            encoded_result = execute()
+        else:
+            encoded_result = coalescer.call(coalescer.make_key(params, original_msg), execute)
+
+        if result_cache is not None:
+            result_cache.set(key, encoded_result)
+        return encoded_result
+
+    @classmethod
+    def __call(cls, method, params, original_msg, rpc_id=None):
+        """
+        Call an RPC method, waiting for the result of coroutine functions and of the process pool
+        :param method: RPC method
+        :param params: params of the call
+        :param original_msg: original message
+        :param rpc_id: id of the call
+        :return: result of the method
+        :raise JsonRpcException: if the method doesn't return within its timeout, or can't be started
+        """
+        call_plan = method.call_plan
+        timeout = cls._get_timeout(method)
+        if call_plan.is_coroutine:
+            from .asyncconsumer import run_coroutine
+            try:
+                return run_coroutine(call_plan(params, original_msg), timeout=timeout)
+            except CallTimeout:
+                raise cls._timeout_error(rpc_id, timeout)
+
+        if method.options['executor'] == 'process':
+            future = cls._get_process_executor().submit(call_in_process, call_plan.func, params)
+            deadline = None
+        elif timeout is not None:
+            deadline = Deadline(timeout)
+            try:
+                future = cls._get_timeout_executor().submit(_call_sync, call_plan, params, original_msg, deadline)
+            except ExecutorBusy:
+                raise cls._busy_error(rpc_id)
+        else:
+            return call_plan(params, original_msg)
+
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # a call still waiting for a process or a thread never started, so it didn't time out: its executor is
+            # busy. A running one can check its deadline
+            if future.cancel():
+                raise cls._busy_error(rpc_id)
+            if deadline is not None:
+                deadline.cancelled = True
+            raise cls._timeout_error(rpc_id, timeout)
+        except CallTimeout:
+            raise cls._timeout_error(rpc_id, timeout)
+
+    @classmethod
+    def _get_method(cls, data, original_msg, is_notification=False):
+        """
+        Validate a request and look up the RPC method it calls
+        :param dict data:
+        :param channels.message.Message original_msg:
+        :param bool is_notification:
+        :return: tuple (method, params)
+        :raise JsonRpcException: if the request is invalid
+        """
 
         if data.get('jsonrpc') != "2.0":
             raise JsonRpcException(data.get('id'), cls.INVALID_REQUEST)
@@ -356,59 +1817,81 @@ class JsonRpcConsumer(WebsocketConsumer):
         if method_name.startswith('_'):
             raise JsonRpcException(data.get('id'), cls.METHOD_NOT_FOUND)
 
-        try:
-            if is_notification:
-                method = cls.available_rpc_notifications[id(cls)][method_name]
-            else:
-                method = cls.available_rpc_methods[id(cls)][method_name]
-            proto = original_msg.channel.name.split('.')[0]
-            if not method.options[proto]:
-                raise MethodNotSupported('Method not available through %s' % proto)
-        except (KeyError, MethodNotSupported):
+        # the dispatch table only has the methods available on the transport
+        table = registry.get_table(cls, get_transport(original_msg.channel.name))
+        method = (table.notifications if is_notification else table.methods).get(method_name)
+        if method is None:
             raise JsonRpcException(data.get('id'), cls.METHOD_NOT_FOUND)
         params = data.get('params', [])
 
         if not isinstance(params, (list, dict)):
             raise JsonRpcException(data.get('id'), cls.INVALID_PARAMS)
 
-        # log call in debug mode
-        if settings.DEBUG:
-            logger.debug('Executing %s(%s)' % (method_name, json.dumps(params)))
+        validator = method.options['validator']
+        if validator is not None:
+            try:
+                validator(params)
+            except InvalidParams as e:
+                raise JsonRpcException(data.get('id'), cls.INVALID_PARAMS, str(e))
+
+        rate_limit = method.options['rate']
+        if rate_limit is not None:
+            retry_after = rate_limit.check(original_msg)
+            if retry_after:
+                raise JsonRpcException(data.get('id'), cls.RATE_LIMITED, {'retry_after': retry_after})
 
-        result = JsonRpcConsumer.__get_result(method, params, original_msg)
+        return method, params
+
+    @classmethod
+    def _log_call(cls, data, params, result=None, error=None):
+        """
+        Log a call in the request log of the consumer, if it is enabled
+        :param dict data: request
+        :param params: params of the call
+        :param result: result of the method, or EncodedResult for the cached, shared and replayed results
+        :param dict error: error object, for the failed calls
+        :return: None
+        """
+        request_log = cls._get_request_log()
+        if not request_log.enabled or not request_log.sampled():
+            return
+        if error is not None:
+            request_log.failure(data, params, error)
+        elif isinstance(result, EncodedResult):
+            request_log.call(data, params, result.text, encoded=True)
+        else:
+            request_log.call(data, params, result)
+
+    @classmethod
+    def _pack_result(cls, data, params, result, is_notification=False):
+        """
+        Pack the result of an RPC method into its answer
+        :param dict data: request
+        :param params: params of the call
+        :param result: result of the method
+        :param bool is_notification:
+        :return: dict, StreamedResult for iterators, None for notifications
+        """
+        if isinstance(result, Iterator):
+            if not is_notification:
+                return StreamedResult(cls, data, result)
+            # run the iterator for its side effects
+            for _ in result:
+                pass
+            result = None
+
+        cls._log_call(data, params, result)
 
         # check and pack result
         if not is_notification:
-            # log call in debug mode
-            if settings.DEBUG:
-                logger.debug('Execution result: %s' % cls._encode(result))
-
             result = JsonRpcConsumer.json_rpc_frame(result=result, _id=data.get('id'))
         elif result is not None:
             logger.warning("The notification method shouldn't return any result")
-            logger.warning("method: %s, params: %s" % (method_name, params))
+            logger.warning("method: %s, params: %s", data['method'], params)
             result = None
 
         return result
 
-    @staticmethod
-    def __get_result(method, params, original_msg):
-
-        func_args = getattr(getfullargspec(method), keywords_args)
-
-        if func_args and "kwargs" in func_args:
-            if isinstance(params, list):
-                result = method(*params, original_message=original_msg)
-            else:
-                result = method(original_message=original_msg, **params)
-        else:
-            if isinstance(params, list):
-                result = method(*params)
-            else:
-                result = method(**params)
-
-        return result
-
 
 class JsonRpcConsumerTest(JsonRpcConsumer):
     @classmethod
@@ -417,5 +1900,4 @@ class JsonRpcConsumerTest(JsonRpcConsumer):
         Clean the class method name for tests
         :return: None
         """
-        if id(cls) in cls.available_rpc_methods:
-            del cls.available_rpc_methods[id(cls)]
+        registry.unregister_all(cls)
@@ -0,0 +1,341 @@
+"""
+Per consumer and per method metrics of the JSON-RPC consumers, exported in the Prometheus text format.
+
+Enable them on a consumer with `metrics = True` (process-wide `registry`) or `metrics = MetricsRegistry()`, and
+route `metrics_route()` to expose them.
+
+All the counters and histogram buckets of a method are allocated the first time it is called: recording a call
+only increments them. Updates are not locked, so concurrent threads may very rarely lose an increment.
+"""
+import threading
+from bisect import bisect_left
+
+from channels.handler import AsgiHandler
+from channels.routing import route
+from django.http import HttpResponse
+from six import string_types
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+# Upper bounds of the size buckets, in bytes
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Error codes counted without allocation
+JSONRPC_ERROR_CODES = (-32700, -32600, -32601, -32602, -32603, -32000, -32001, -32002, -32003)
+
+# Error code of the calls exceeding their timeout
+EXECUTION_TIMEOUT = -32003
+
+# Label of calls to methods that are not registered, and of batch frames
+UNKNOWN_METHOD = '(unknown)'
+BATCH = '(batch)'
+
+
+class Histogram(object):
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # one more bucket for the values above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class MethodMetrics(object):
+    """
+    Metrics of a method of a consumer
+    """
+    __slots__ = ('calls', 'errors', 'timeouts', 'parse', 'dispatch', 'encode', 'request_size', 'response_size')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = dict((code, 0) for code in JSONRPC_ERROR_CODES)
+        self.timeouts = 0
+        self.parse = Histogram(LATENCY_BUCKETS)
+        self.dispatch = Histogram(LATENCY_BUCKETS)
+        self.encode = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+    def record_call(self, duration, result):
+        """
+        Record a call
+        :param float duration: time spent dispatching the call, in seconds
+        :param result: response frame of the call
+        :return: None
+        """
+        self.calls += 1
+        self.dispatch.observe(duration)
+        self.record_error(result)
+
+    def record_error(self, result):
+        """
+        Count the error of a response, if it is one
+        :param result: response frame
+        :return: None
+        """
+        if isinstance(result, dict) and 'error' in result:
+            code = result['error']['code']
+            try:
+                self.errors[code] += 1
+            except KeyError:
+                self.errors[code] = 1
+            if code == EXECUTION_TIMEOUT:
+                self.timeouts += 1
+
+
+class CompressionMetrics(object):
+    """
+    Metrics of the compression of the responses of a consumer with an encoding
+    """
+    __slots__ = ('input_bytes', 'output_bytes', 'duration')
+
+    def __init__(self):
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.duration = Histogram(LATENCY_BUCKETS)
+
+    def record(self, input_size, output_size, duration):
+        """
+        Record a compression
+        :param int input_size: size of the data
+        :param int output_size: size of the compressed data
+        :param float duration: compression time, in seconds
+        :return: None
+        """
+        self.input_bytes += input_size
+        self.output_bytes += output_size
+        self.duration.observe(duration)
+
+    @property
+    def ratio(self):
+        """
+        Compressed size over uncompressed size, None if nothing was compressed
+        """
+        return float(self.output_bytes) / self.input_bytes if self.input_bytes else None
+
+
+class ConsumerMetrics(object):
+    """
+    Metrics of the methods of a consumer class
+    """
+
+    def __init__(self, consumer_class):
+        self.consumer_class = consumer_class
+        self.name = '%s.%s' % (consumer_class.__module__, consumer_class.__name__)
+        self.methods = {UNKNOWN_METHOD: MethodMetrics(), BATCH: MethodMetrics()}
+        self.unknown = self.methods[UNKNOWN_METHOD]
+        self.batch = self.methods[BATCH]
+        self.compressions = {}
+        self._lock = threading.Lock()
+
+    def method(self, name):
+        """
+        Returns the metrics of a method. Names that are not RPC methods of the consumer are all recorded as
+        UNKNOWN_METHOD, as they come from the clients.
+        :param name: RPC name of the method
+        :return: MethodMetrics
+        """
+        if not isinstance(name, string_types):
+            return self.unknown
+        try:
+            return self.methods[name]
+        except KeyError:
+            if not self.consumer_class.is_rpc_name(name):
+                return self.unknown
+            with self._lock:
+                return self.methods.setdefault(name, MethodMetrics())
+
+    def compression(self, encoding):
+        """
+        Returns the compression metrics of an encoding
+        :param str encoding: 'gzip', 'br' or 'zstd'
+        :return: CompressionMetrics
+        """
+        try:
+            return self.compressions[encoding]
+        except KeyError:
+            with self._lock:
+                return self.compressions.setdefault(encoding, CompressionMetrics())
+
+
+class RequestMetrics(object):
+    """
+    Metrics of a request (a frame) being handled
+    """
+    __slots__ = ('consumer', 'target')
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        # metrics the parsing and encoding of the frame are recorded into: its method, or BATCH
+        self.target = consumer.unknown
+
+    def parsed(self, data, duration, size):
+        """
+        Record the parsing of the frame
+        :param data: decoded frame
+        :param float duration: parse time, in seconds
+        :param int size: size of the frame
+        :return: None
+        """
+        if isinstance(data, list):
+            self.target = self.consumer.batch
+        elif isinstance(data, dict):
+            self.target = self.consumer.method(data.get('method'))
+        self.target.parse.observe(duration)
+        self.target.request_size.observe(size)
+
+    def encoded(self, duration, size):
+        """
+        Record the encoding of the response
+        :param float duration: encode time, in seconds
+        :param int size: size of the response
+        :return: None
+        """
+        self.target.encode.observe(duration)
+        self.target.response_size.observe(size)
+
+
+class MetricsRegistry(object):
+    """
+    Metrics of the consumer classes
+    """
+
+    def __init__(self):
+        self.consumers = {}
+        self._lock = threading.Lock()
+
+    def consumer(self, consumer_class):
+        """
+        Returns the metrics of a consumer class
+        :param consumer_class: JsonRpcConsumer subclass
+        :return: ConsumerMetrics
+        """
+        try:
+            return self.consumers[consumer_class]
+        except KeyError:
+            with self._lock:
+                return self.consumers.setdefault(consumer_class, ConsumerMetrics(consumer_class))
+
+    def render_prometheus(self):
+        """
+        Export the metrics in the Prometheus text format
+        :return: str
+        """
+        lines = []
+        phases = ('parse', 'dispatch', 'encode')
+        items = [(consumer.name, name, method) for consumer in list(self.consumers.values())
+                 for name, method in sorted(consumer.methods.items())
+                 if method.calls or method.parse.count or any(method.errors.values())]
+
+        lines.append('# HELP jsonrpc_calls_total Number of RPC calls and notifications.')
+        lines.append('# TYPE jsonrpc_calls_total counter')
+        for consumer, name, method in items:
+            lines.append('jsonrpc_calls_total{%s} %s' % (_labels(consumer=consumer, method=name), method.calls))
+
+        lines.append('# HELP jsonrpc_errors_total Number of error responses, by JSON-RPC error code.')
+        lines.append('# TYPE jsonrpc_errors_total counter')
+        for consumer, name, method in items:
+            for code, count in sorted(method.errors.items()):
+                if count:
+                    lines.append('jsonrpc_errors_total{%s} %s' % (_labels(consumer=consumer, method=name, code=code),
+                                                                  count))
+
+        lines.append('# HELP jsonrpc_timeouts_total Number of calls that exceeded their execution timeout.')
+        lines.append('# TYPE jsonrpc_timeouts_total counter')
+        for consumer, name, method in items:
+            if method.timeouts:
+                lines.append('jsonrpc_timeouts_total{%s} %s' % (_labels(consumer=consumer, method=name),
+                                                                method.timeouts))
+
+        lines.append('# HELP jsonrpc_phase_seconds Time spent parsing requests, dispatching calls and encoding '
+                     'responses.')
+        lines.append('# TYPE jsonrpc_phase_seconds histogram')
+        for consumer, name, method in items:
+            for phase in phases:
+                _render_histogram(lines, 'jsonrpc_phase_seconds', getattr(method, phase),
+                                  consumer=consumer, method=name, phase=phase)
+
+        for metric, attribute, description in (('jsonrpc_request_bytes', 'request_size', 'Size of the requests.'),
+                                               ('jsonrpc_response_bytes', 'response_size', 'Size of the responses.')):
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s histogram' % metric)
+            for consumer, name, method in items:
+                _render_histogram(lines, metric, getattr(method, attribute), consumer=consumer, method=name)
+
+        compressions = [(consumer.name, encoding, compression) for consumer in list(self.consumers.values())
+                        for encoding, compression in sorted(consumer.compressions.items())]
+        for metric, attribute, description in (
+                ('jsonrpc_compression_input_bytes_total', 'input_bytes', 'Size of the compressed responses, before '
+                                                                         'compression.'),
+                ('jsonrpc_compression_output_bytes_total', 'output_bytes', 'Size of the compressed responses.')):
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s counter' % metric)
+            for consumer, encoding, compression in compressions:
+                lines.append('%s{%s} %s' % (metric, _labels(consumer=consumer, encoding=encoding),
+                                            getattr(compression, attribute)))
+
+        lines.append('# HELP jsonrpc_compression_seconds Time spent compressing responses.')
+        lines.append('# TYPE jsonrpc_compression_seconds histogram')
+        for consumer, encoding, compression in compressions:
+            _render_histogram(lines, 'jsonrpc_compression_seconds', compression.duration, consumer=consumer,
+                              encoding=encoding)
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in sorted(labels.items()))
+
+
+def _render_histogram(lines, metric, histogram, **labels):
+    if not histogram.count:
+        return
+    label = _labels(**labels)
+    for bound, count in zip(histogram.bounds + ('+Inf', ), histogram.cumulative_counts()):
+        lines.append('%s_bucket{%s,le="%s"} %s' % (metric, label, bound, count))
+    lines.append('%s_sum{%s} %s' % (metric, label, histogram.sum))
+    lines.append('%s_count{%s} %s' % (metric, label, histogram.count))
+
+
+# Registry used by the consumers with `metrics = True`
+registry = MetricsRegistry()
+
+
+def metrics_consumer(message, registry=registry):
+    """
+    HTTP consumer answering with the metrics in the Prometheus text format
+    :param message: http.request message
+    :param MetricsRegistry registry: registry to export
+    :return: None
+    """
+    response = HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    for chunk in AsgiHandler.encode_response(response):
+        message.reply_channel.send(chunk)
+
+
+def metrics_route(path=r'^/metrics/$', registry=registry):
+    """
+    Route exposing the metrics over HTTP, to add to the channel routing
+    :param str path: path regex
+    :param MetricsRegistry registry: registry to export
+    :return: channels.routing.Route
+    """
+    def consumer(message, **kwargs):
+        metrics_consumer(message, registry)
+    return route('http.request', consumer, path=path)
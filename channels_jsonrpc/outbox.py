@@ -0,0 +1,208 @@
+"""
+Batching of the outbound notifications, enabled with the `notification_buffer` attribute of a consumer.
+
+The notifications sent to a group or a reply channel are collected for `window` seconds (or until `max_items` are
+pending), then sent in a single message: a JSON-RPC batch array, or the notification itself if it is alone.
+Notifications sent with a `key` supersede the pending notification with the same method and key, only the latest is
+sent. Each notification is encoded once, whatever the number of its targets, and the batches are assembled from the
+encoded notifications.
+"""
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from channels import Channel, Group
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+class PendingBatch(OrderedDict):
+    """
+    Pending notifications of a group or reply channel, by slot. `batch_id` tells its deadline from the deadlines of
+    the batches of the same target flushed before it.
+    """
+
+    def __init__(self, batch_id):
+        super(PendingBatch, self).__init__()
+        self.batch_id = batch_id
+
+
+class NotificationBuffer(object):
+    """
+    Collects the notifications of a consumer class per group and reply channel, and flushes them in batches from a
+    background thread
+    """
+
+    def __init__(self, window=0.005, max_items=100, collapse=True):
+        """
+        :param float window: number of seconds the notifications of a group or reply channel are collected for
+        :param int max_items: number of pending notifications sent without waiting for the end of the window
+        :param bool collapse: only send the latest of the pending notifications with the same method and key
+        """
+        self.window = window
+        self.max_items = max_items
+        self.collapse = collapse
+        self.consumer_class = None
+        self.notifications = 0
+        self.collapsed = 0
+        self.messages = 0
+        self._pending = {}
+        self._deadlines = []
+        self._ids = itertools.count()
+        self._batch_ids = itertools.count()
+        self._encoded_frame = None
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def bind(self, consumer_class):
+        """
+        Bind the buffer to the consumer class whose codec encodes the notifications
+        :param consumer_class: JsonRpcConsumer class
+        :return: self
+        """
+        from .jsonrpcconsumer import EncodedFrame
+        self.consumer_class = consumer_class
+        self._encoded_frame = EncodedFrame
+        return self
+
+    @classmethod
+    def from_option(cls, option):
+        """
+        Build a buffer from the `notification_buffer` attribute of a consumer
+        :param option: True, a window in seconds, a dict of NotificationBuffer arguments or a NotificationBuffer
+        :return: NotificationBuffer, or None if notifications aren't buffered
+        """
+        if option is None or option is False:
+            return None
+        if isinstance(option, NotificationBuffer):
+            return option
+        if option is True:
+            return cls()
+        if isinstance(option, dict):
+            return cls(**option)
+        return cls(window=option)
+
+    def add(self, target, method, params=None, key=None):
+        """
+        Buffer a notification
+        :param tuple target: ('group', group name) or ('channel', reply channel name)
+        :param method: JSON-RPC method
+        :param params: params of the method
+        :param key: notifications with the same method and key supersede each other, None to always send it
+        :return: None
+        """
+        self.add_to_targets((target, ), method, params, key)
+
+    def add_to_targets(self, targets, method, params=None, key=None):
+        """
+        Buffer a notification for several targets, encoded once
+        :param targets: iterable of ('group', group name) or ('channel', reply channel name)
+        :param method: JSON-RPC method
+        :param params: params of the method
+        :param key: notifications with the same method and key supersede each other, None to always send it
+        :return: None
+        """
+        consumer_class = self.consumer_class
+        frame = self._encoded_frame(consumer_class._encode(consumer_class.json_rpc_frame(method=method, params=params)))
+        full = []
+        with self._condition:
+            for target in targets:
+                self.notifications += 1
+                pending = self._pending.get(target)
+                if pending is None:
+                    pending = self._pending[target] = PendingBatch(next(self._batch_ids))
+                    heapq.heappush(self._deadlines, (timer() + self.window, pending.batch_id, target))
+                    self._start()
+                    self._condition.notify()
+
+                if key is not None and self.collapse:
+                    slot = (method, key)
+                    # the latest notification takes the place of the superseded one, at the end
+                    if pending.pop(slot, None) is not None:
+                        self.collapsed += 1
+                else:
+                    slot = next(self._ids)
+                pending[slot] = frame
+
+                if len(pending) >= self.max_items:
+                    del self._pending[target]
+                    full.append((target, pending))
+        for target, pending in full:
+            self._send(target, pending)
+
+    def flush(self, target=None):
+        """
+        Send the pending notifications without waiting for the end of their window
+        :param tuple target: ('group', group name) or ('channel', reply channel name), None for all of them
+        :return: None
+        """
+        with self._condition:
+            if target is None:
+                flushed = list(self._pending.items())
+                self._pending.clear()
+            else:
+                pending = self._pending.pop(target, None)
+                flushed = [(target, pending)] if pending else []
+        for flushed_target, pending in flushed:
+            self._send(flushed_target, pending)
+
+    def stats(self):
+        """
+        Returns the number of notifications, of superseded notifications, and of messages sent
+        :return: dict
+        """
+        return {'notifications': self.notifications, 'collapsed': self.collapsed, 'messages': self.messages}
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='channels-jsonrpc-notifications')
+            self._thread.daemon = True
+            self._thread.start()
+            # the daemon thread doesn't outlive the interpreter
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._deadlines:
+                    self._condition.wait()
+                deadline, batch_id, target = self._deadlines[0]
+                delay = deadline - timer()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._deadlines)
+                pending = self._pending.get(target)
+                if pending is None or pending.batch_id != batch_id:
+                    # the batch was flushed already, the pending one (if any) has its own deadline
+                    continue
+                del self._pending[target]
+            if pending:
+                try:
+                    self._send(target, pending)
+                except Exception:
+                    logger.exception('Error while sending notifications to %s %s', *target)
+
+    def _send(self, target, pending):
+        """
+        Send pending notifications in one message
+        :param tuple target: ('group', group name) or ('channel', reply channel name)
+        :param PendingBatch pending: encoded notifications
+        :return: None
+        """
+        frames = list(pending.values())
+        consumer_class = self.consumer_class
+        # the batch array is assembled from the encoded notifications, without encoding them again
+        text = consumer_class._encode(frames[0] if len(frames) == 1 else frames)
+        content = consumer_class._compress_websocket({"text": text})
+        kind, name = target
+        if kind == 'group':
+            Group(name).send(content)
+        else:
+            Channel(name).send(content)
+        self.messages += 1
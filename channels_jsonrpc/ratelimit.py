@@ -0,0 +1,191 @@
+"""
+Token bucket rate limits of the consumers (`rate_limit`) and of the RPC methods declared with `rpc_method(rate=...)`.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from six import string_types
+
+from .cache import make_namespace
+from .registry import get_transport
+
+# Seconds of the periods of the "<count>/<period>" rates
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Key of the address of the WebSocket clients in their channel session
+SESSION_ADDRESS_KEY = 'jsonrpc_client_address'
+
+
+class LocalRateLimitBackend(object):
+    """
+    Buckets kept in process memory. The least recently used buckets are dropped beyond `maxsize`, as the keys come
+    from the clients.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        """
+        Take a token from a bucket
+        :param str key: key of the bucket
+        :param float capacity: maximum number of tokens of the bucket
+        :param float rate: number of tokens added per second
+        :return: 0 if a token was taken, else the number of seconds until one is available
+        """
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            # most recently used buckets are at the end
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class DjangoRateLimitBackend(object):
+    """
+    Buckets stored in a cache of Django's cache framework (e.g. Redis or memcached), shared by the workers using it.
+
+    Buckets are read and written back without locking: concurrent requests of a key on different workers may
+    occasionally be admitted beyond the limit.
+    """
+
+    def __init__(self, namespace, alias='default'):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def consume(self, key, capacity, rate):
+        cache_key = 'jsonrpc:rate:%s:%s' % (self.namespace, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        now = time.time()
+        tokens, updated = self.cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / rate
+        # a bucket that would be full again doesn't need to be kept
+        self.cache.set(cache_key, (tokens, now), int((capacity - tokens) / rate) + 1)
+        return wait
+
+    def clear(self):
+        pass
+
+
+class RateLimit(object):
+    """
+    Token bucket limiting the rate of the requests of each client: of a reply channel, user or IP address
+    """
+
+    def __init__(self, rate, burst=None, key='channel', backend=None, alias='default'):
+        """
+        :param rate: '<count>/<period>' (period: 's', 'm', 'h' or 'd', e.g. '10/s'), or a number of requests per second
+        :param float burst: number of requests that can be made at once, defaults to the count of the rate
+        :param key: what the requests are counted by: 'channel' (reply channel), 'user' (the authenticated user, else
+            the reply channel), 'ip' (the client address, else the reply channel), or a function of original_message.
+            Over HTTP, where each request has its own reply channel, the client address is used instead of the reply
+            channel. On WebSockets, the address is read from the channel session, where the consumer stores it on
+            connection: 'ip' needs consumers with a channel session
+        :param backend: 'local' (default), 'django', or a backend instance
+        :param str alias: Django cache alias, for the 'django' backend
+        """
+        if isinstance(rate, string_types):
+            count, period = rate.split('/')
+            count = float(count)
+            self.rate = count / PERIODS[period.strip()[:1]]
+        else:
+            count = self.rate = float(rate)
+        self.capacity = float(burst) if burst is not None else max(count, 1.0)
+        self.key = key
+        self.name = None
+        self.rejected = 0
+        self._backend = backend
+        self._alias = alias
+
+    def bind(self, name, consumer_class=None):
+        """
+        Bind the rate limit to the RPC method or consumer it limits
+        :param str name: name of the method or consumer
+        :param consumer_class: consumer class the method is registered on, whose path is part of the keys of the
+            'django' backend
+        :return: self
+        """
+        self.name = name
+        if self._backend is None or self._backend == 'local':
+            self.backend = LocalRateLimitBackend()
+        elif self._backend == 'django':
+            self.backend = DjangoRateLimitBackend(make_namespace(name, consumer_class), self._alias)
+        else:
+            self.backend = self._backend
+        return self
+
+    @classmethod
+    def from_option(cls, option):
+        """
+        Build a rate limit from the `rate` option of rpc_method() or the `rate_limit` attribute of a consumer
+        :param option: a rate, a dict of RateLimit arguments or a RateLimit
+        :return: RateLimit, or None if the rate isn't limited
+        """
+        if option is None:
+            return None
+        if isinstance(option, RateLimit):
+            return option
+        if isinstance(option, dict):
+            return cls(**option)
+        return cls(option)
+
+    def make_key(self, original_message):
+        """
+        Returns the key of the bucket of a request
+        :param original_message: message of the request
+        :return: str
+        """
+        if callable(self.key):
+            return self.key(original_message)
+        if self.key == 'user':
+            user = getattr(original_message, 'user', None)
+            if getattr(user, 'pk', None) is not None:
+                return 'user:%s' % user.pk
+        elif self.key != 'ip' and get_transport(original_message.channel.name) != 'http':
+            return 'channel:%s' % original_message.reply_channel.name
+        client = original_message.get('client')
+        if client:
+            return 'ip:%s' % client[0]
+        if self.key == 'ip':
+            # the WebSocket frames don't carry the address, only the connection message does
+            session = getattr(original_message, 'channel_session', None)
+            address = session.get(SESSION_ADDRESS_KEY) if session is not None else None
+            if address is not None:
+                return 'ip:%s' % address
+        return 'channel:%s' % original_message.reply_channel.name
+
+    def check(self, original_message):
+        """
+        Admit a request
+        :param original_message: message of the request
+        :return: 0 if the request is admitted, else the number of seconds until it would be
+        """
+        wait = self.backend.consume(self.make_key(original_message), self.capacity, self.rate)
+        if wait:
+            self.rejected += 1
+        return wait
@@ -0,0 +1,162 @@
+"""
+Registry of the RPC methods and notifications of the consumer classes.
+
+Methods are registered on a class and inherited by its subclasses, which can override them. The methods of the
+classes mounted on a class (its `mounts`) are dispatched by it too, under their prefix. The methods a class can
+dispatch on a transport, mounted ones included, are gathered once in a frozen dispatch table, rebuilt only after new
+registrations: a call is dispatched with a single lookup of its full RPC name.
+"""
+import threading
+from collections import namedtuple
+from weakref import WeakKeyDictionary
+
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = dict
+
+# Methods and notifications a consumer class dispatches on a transport, by RPC name
+DispatchTable = namedtuple('DispatchTable', ('methods', 'notifications'))
+
+# Transport of the channels of the consumers
+TRANSPORTS = {
+    'websocket.receive': 'websocket',
+    'http.request': 'http',
+}
+
+
+def get_transport(channel_name):
+    """
+    Returns the transport of a channel
+    :param str channel_name: name of the channel of a message
+    :return: str, 'websocket' or 'http'
+    """
+    try:
+        return TRANSPORTS[channel_name]
+    except KeyError:
+        return channel_name.split('.')[0]
+
+
+class RegisteredMethod(object):
+    """
+    Registration of a function as an RPC method or notification of a consumer class. The options are kept here
+    rather than on the function, which can be registered on several classes with different options.
+    """
+    __slots__ = ('name', 'func', 'options', 'call_plan')
+
+    def __init__(self, name, func, options, call_plan):
+        """
+        :param str name: RPC name
+        :param func: function
+        :param dict options: options of the registration (transports, cache, rate limit...)
+        :param channels_jsonrpc.jsonrpcconsumer.CallPlan call_plan: call plan of the function
+        """
+        self.name = name
+        self.func = func
+        self.options = options
+        self.call_plan = call_plan
+
+    def __repr__(self):
+        return '<RegisteredMethod %s: %r>' % (self.name, self.func)
+
+
+class MethodRegistry(object):
+    """
+    RPC methods and notifications registered on the consumer classes, and their dispatch tables
+    """
+
+    def __init__(self):
+        # methods and notifications registered on each class, by RPC name
+        self._methods = WeakKeyDictionary()
+        self._notifications = WeakKeyDictionary()
+        # dispatch tables of each class, by transport
+        self._tables = WeakKeyDictionary()
+        # bumped by each registration, so tables built meanwhile are not kept
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def register(self, consumer_class, name, func, options, call_plan, notification=False):
+        """
+        Register an RPC method or notification on a consumer class
+        :param consumer_class: JsonRpcConsumer subclass
+        :param str name: RPC name
+        :param func: function
+        :param dict options: options of the registration
+        :param channels_jsonrpc.jsonrpcconsumer.CallPlan call_plan: call plan of the function
+        :param bool notification: if the function is a notification
+        :return: RegisteredMethod
+        """
+        method = RegisteredMethod(name, func, options, call_plan)
+        registered = self._notifications if notification else self._methods
+        with self._lock:
+            registered.setdefault(consumer_class, {})[name] = method
+            self._clear_tables()
+        return method
+
+    def unregister_all(self, consumer_class):
+        """
+        Remove the methods and notifications registered on a consumer class
+        :param consumer_class: JsonRpcConsumer subclass
+        :return: None
+        """
+        with self._lock:
+            self._methods.pop(consumer_class, None)
+            self._notifications.pop(consumer_class, None)
+            self._clear_tables()
+
+    def clear_tables(self):
+        """
+        Discard the dispatch tables, after the mounts of a consumer class changed
+        :return: None
+        """
+        with self._lock:
+            self._clear_tables()
+
+    def _clear_tables(self):
+        self.generation += 1
+        self._tables.clear()
+
+    def get_methods(self, consumer_class, notification=False):
+        """
+        Returns the methods (or notifications) of a consumer class, including the ones it inherits and the ones of the
+        classes mounted on it, prefixed
+        :param consumer_class: JsonRpcConsumer subclass
+        :param bool notification: to return the notifications
+        :return: dict of the RegisteredMethod, by RPC name
+        """
+        registered = self._notifications if notification else self._methods
+        methods = {}
+        # the methods of the class itself take precedence over the mounted ones
+        for prefix, mounted_class in (getattr(consumer_class, 'mounts', None) or {}).items():
+            for name, method in self.get_methods(mounted_class, notification).items():
+                methods['%s.%s' % (prefix, name)] = method
+        for klass in reversed(consumer_class.__mro__):
+            methods.update(registered.get(klass, ()))
+        return methods
+
+    def get_table(self, consumer_class, transport):
+        """
+        Returns the dispatch table of a consumer class on a transport
+        :param consumer_class: JsonRpcConsumer subclass
+        :param str transport: 'websocket' or 'http'
+        :return: DispatchTable
+        """
+        try:
+            return self._tables[consumer_class][transport]
+        except KeyError:
+            pass
+
+        generation = self.generation
+        table = DispatchTable(*[
+            MappingProxyType(dict((name, method)
+                                  for name, method in self.get_methods(consumer_class, notification).items()
+                                  if method.options.get(transport)))
+            for notification in (False, True)])
+        with self._lock:
+            if generation == self.generation:
+                self._tables.setdefault(consumer_class, {})[transport] = table
+        return table
+
+
+# Registry of the consumers
+registry = MethodRegistry()
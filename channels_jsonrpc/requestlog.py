@@ -0,0 +1,83 @@
+"""
+DEBUG log of the RPC calls, with their params and results, or their errors.
+
+Whether calls are logged is decided once per consumer class, from its `log_calls` option (`settings.DEBUG` by
+default) and the level of the logger, so calls that aren't logged cost a single attribute check. The params and
+results are only serialized if a handler emits the record, and `log_sample` logs 1 call in N.
+"""
+import itertools
+import logging
+
+
+class LazyJson(object):
+    """
+    Payload of a log record, serialized when the record is formatted
+    """
+    __slots__ = ('encode', 'value')
+
+    def __init__(self, encode, value):
+        self.encode = encode
+        self.value = value
+
+    def __str__(self):
+        text = self.encode(self.value)
+        return text.decode('utf-8') if isinstance(text, bytes) else text
+
+
+class RequestLog(object):
+    """
+    Log of the calls of a consumer class
+    """
+
+    def __init__(self, logger, enabled, sample=1, encode=None):
+        """
+        :param logging.Logger logger: logger of the records
+        :param bool enabled: if the calls are logged
+        :param int sample: log 1 call in `sample`
+        :param encode: function serializing the params and results
+        """
+        self.logger = logger
+        # the level of the logger is captured here, not checked on each call
+        self.enabled = bool(enabled) and logger.isEnabledFor(logging.DEBUG)
+        self.sample = sample or 1
+        self.encode = encode
+        self._counter = itertools.count()
+
+    def sampled(self):
+        """
+        Returns whether the current call is logged
+        :return: bool
+        """
+        if not self.enabled:
+            return False
+        return self.sample == 1 or next(self._counter) % self.sample == 0
+
+    def call(self, data, params, result, encoded=False):
+        """
+        Log a call and its result
+        :param dict data: request
+        :param params: params of the call
+        :param result: result of the method
+        :param bool encoded: if the result is already encoded (cached, shared or replayed results)
+        :return: None
+        """
+        params = LazyJson(self.encode, params)
+        if not encoded:
+            result = LazyJson(self.encode, result)
+        self.logger.debug('Executed %s(%s): %s', data.get('method'), params, result,
+                          extra={'rpc_method': data.get('method'), 'rpc_id': data.get('id'),
+                                 'rpc_params': params, 'rpc_result': result})
+
+    def failure(self, data, params, error):
+        """
+        Log a failed call and its error
+        :param dict data: request
+        :param params: params of the call
+        :param dict error: error object of the answer
+        :return: None
+        """
+        params = LazyJson(self.encode, params)
+        error = LazyJson(self.encode, error)
+        self.logger.debug('Failed %s(%s): %s', data.get('method'), params, error,
+                          extra={'rpc_method': data.get('method'), 'rpc_id': data.get('id'),
+                                 'rpc_params': params, 'rpc_error': error})
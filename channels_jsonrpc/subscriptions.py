@@ -0,0 +1,375 @@
+"""
+Subscriptions of the WebSocket clients to topics, enabled with `JsonRpcConsumer.enable_subscriptions()`.
+
+Clients call `subscribe(topic, version=None)` and get the state of the topic and its version. Publishers call
+`JsonRpcConsumer.publish(topic, state)`: the subscribers are notified with a JSON Patch (RFC 6902) from the previous
+state to the new one::
+
+    {"jsonrpc": "2.0", "method": "subscription.update",
+     "params": {"topic": "prices", "version": 8, "patch": [{"op": "replace", "path": "/EUR", "value": 1.09}]}}
+
+A client that misses a version (its next update doesn't have the version after the one it has) calls
+`subscribe(topic, version)` again with the version it has: it gets the patches since that version if they are still
+in the history of the topic, else the whole state.
+"""
+import copy
+import hashlib
+import re
+import threading
+
+from channels import Group
+from six import string_types
+
+from .cache import make_namespace
+
+# Topics are part of the group names, which channels restricts to these characters
+TOPIC_RE = re.compile(r'^[a-zA-Z0-9_.\-]{1,80}$')
+
+
+class SubscriptionError(ValueError):
+    """
+    Raised for subscriptions to invalid or forbidden topics
+    """
+
+
+def _escape(key):
+    if not isinstance(key, string_types):
+        key = str(key)
+    return key.replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(old, new, path=''):
+    """
+    Returns the JSON Patch transforming a JSON value into another one
+    :param old: previous value
+    :param new: new value
+    :param str path: JSON Pointer of the values
+    :return: list of 'add', 'remove' and 'replace' operations
+
+    >>> make_patch({'a': 1, 'b': [1, 2]}, {'a': 2, 'b': [1]})
+    [{'op': 'replace', 'path': '/a', 'value': 2}, {'op': 'remove', 'path': '/b/1'}]
+    """
+    if type(old) is type(new) and old == new:
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = []
+        for key, value in new.items():
+            if key in old:
+                patch.extend(make_patch(old[key], value, '%s/%s' % (path, _escape(key))))
+        for key in old:
+            if key not in new:
+                patch.append({'op': 'remove', 'path': '%s/%s' % (path, _escape(key))})
+        for key, value in new.items():
+            if key not in old:
+                patch.append({'op': 'add', 'path': '%s/%s' % (path, _escape(key)), 'value': value})
+        return patch
+
+    if isinstance(old, list) and isinstance(new, list):
+        patch = []
+        for index in range(min(len(old), len(new))):
+            patch.extend(make_patch(old[index], new[index], '%s/%d' % (path, index)))
+        # from the end, so the indexes stay valid
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            patch.append({'op': 'remove', 'path': '%s/%d' % (path, index)})
+        for index in range(len(old), len(new)):
+            patch.append({'op': 'add', 'path': '%s/%d' % (path, index), 'value': new[index]})
+        return patch
+
+    return [{'op': 'replace', 'path': path, 'value': new}]
+
+
+def apply_patch(document, patch):
+    """
+    Apply a JSON Patch made by make_patch() to a copy of a JSON value
+    :param document: JSON value
+    :param list patch: 'add', 'remove' and 'replace' operations
+    :return: patched copy of the value
+    """
+    document = copy.deepcopy(document)
+    for operation in patch:
+        if operation['path'] == '':
+            document = None if operation['op'] == 'remove' else copy.deepcopy(operation['value'])
+            continue
+
+        tokens = [_unescape(token) for token in operation['path'].split('/')[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == '-' else int(last)
+            if operation['op'] == 'add':
+                parent.insert(index, copy.deepcopy(operation['value']))
+            elif operation['op'] == 'remove':
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(operation['value'])
+        elif operation['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(operation['value'])
+    return document
+
+
+class TopicState(object):
+    """
+    Last published state of a topic, with its version and the patches of the previous versions
+    """
+    __slots__ = ('version', 'state', 'history')
+
+    def __init__(self, version=0, state=None, history=None):
+        self.version = version
+        self.state = state
+        # list of (version, patch from the previous version)
+        self.history = history or []
+
+    def __getstate__(self):
+        return self.version, self.state, self.history
+
+    def __setstate__(self, values):
+        self.version, self.state, self.history = values
+
+
+class LocalSubscriptionBackend(object):
+    """
+    Topics and subscriptions kept in process memory: publishers and consumers must run in the same process
+    """
+
+    def __init__(self):
+        self._topics = {}
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def get_topic(self, topic):
+        return self._topics.get(topic)
+
+    def set_topic(self, topic, topic_state):
+        self._topics[topic] = topic_state
+
+    def add_subscription(self, channel_name, topic):
+        with self._lock:
+            self._subscriptions.setdefault(channel_name, set()).add(topic)
+
+    def remove_subscription(self, channel_name, topic):
+        with self._lock:
+            self._subscriptions.get(channel_name, set()).discard(topic)
+
+    def pop_subscriptions(self, channel_name):
+        with self._lock:
+            return self._subscriptions.pop(channel_name, set())
+
+    def clear(self):
+        with self._lock:
+            self._topics.clear()
+            self._subscriptions.clear()
+
+
+class DjangoSubscriptionBackend(object):
+    """
+    Topics and subscriptions stored in a cache of Django's cache framework, shared by the workers and publishers
+    using it. The states are read and written back without locking: the publishers of a topic must not run
+    concurrently.
+    """
+
+    def __init__(self, namespace, alias='default', timeout=None):
+        """
+        :param str namespace: prefix of the cache keys
+        :param str alias: Django cache alias
+        :param float timeout: number of seconds the topics are kept after their last publication, None for ever
+        """
+        self.namespace = namespace
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get_topic(self, topic):
+        return self.cache.get('jsonrpc:topic:%s:%s' % (self.namespace, topic))
+
+    def set_topic(self, topic, topic_state):
+        self.cache.set('jsonrpc:topic:%s:%s' % (self.namespace, topic), topic_state, self.timeout)
+
+    def _subscriptions_key(self, channel_name):
+        return 'jsonrpc:subscriptions:%s:%s' % (self.namespace, channel_name)
+
+    def add_subscription(self, channel_name, topic):
+        key = self._subscriptions_key(channel_name)
+        topics = self.cache.get(key, set())
+        topics.add(topic)
+        self.cache.set(key, topics, None)
+
+    def remove_subscription(self, channel_name, topic):
+        key = self._subscriptions_key(channel_name)
+        topics = self.cache.get(key, set())
+        topics.discard(topic)
+        self.cache.set(key, topics, None)
+
+    def pop_subscriptions(self, channel_name):
+        key = self._subscriptions_key(channel_name)
+        topics = self.cache.get(key, set())
+        self.cache.delete(key)
+        return topics
+
+    def clear(self):
+        pass
+
+
+class SubscriptionManager(object):
+    """
+    Manages the topics of a consumer class: subscriptions of the connections, versions and patches
+    """
+
+    def __init__(self, backend=None, alias='default', history=16, method='subscription.update', authorize=None,
+                 group_prefix=None):
+        """
+        :param backend: 'local' (default), 'django' to share the topics between processes, or a backend instance
+        :param str alias: Django cache alias, for the 'django' backend
+        :param int history: number of patches kept per topic, for the clients that missed updates
+        :param str method: method of the update notifications
+        :param authorize: function(topic, original_message) returning whether a connection can subscribe to a topic
+        :param str group_prefix: prefix of the names of the groups of the subscribers, derived from the path of the
+            consumer class by default
+        """
+        self.history = history
+        self.method = method
+        self.authorize = authorize
+        self.group_prefix = group_prefix
+        self.consumer_class = None
+        self._backend = backend
+        self._alias = alias
+        self._lock = threading.Lock()
+
+    def bind(self, consumer_class):
+        """
+        Bind the manager to the consumer class whose codec encodes the notifications
+        :param consumer_class: JsonRpcConsumer class
+        :return: self
+        """
+        self.consumer_class = consumer_class
+        namespace = make_namespace(None, consumer_class)
+        if self.group_prefix is None:
+            # the consumers publishing the same topics don't notify each other's subscribers. Group names are
+            # shorter than 100 characters, from a restricted set: the path is hashed
+            self.group_prefix = 'jsonrpc.%s.' % hashlib.sha1(namespace.encode('utf-8')).hexdigest()[:10]
+        if self._backend is None or self._backend == 'local':
+            self.backend = LocalSubscriptionBackend()
+        elif self._backend == 'django':
+            self.backend = DjangoSubscriptionBackend(namespace, self._alias)
+        else:
+            self.backend = self._backend
+        return self
+
+    @classmethod
+    def from_option(cls, option):
+        """
+        Build a manager from the argument of enable_subscriptions()
+        :param option: True, 'local', 'django', a dict of SubscriptionManager arguments or a SubscriptionManager
+        :return: SubscriptionManager
+        """
+        if isinstance(option, SubscriptionManager):
+            return option
+        if option is True or option is None:
+            return cls()
+        if isinstance(option, dict):
+            return cls(**option)
+        return cls(backend=option)
+
+    def group_name(self, topic):
+        return self.group_prefix + topic
+
+    def check_topic(self, topic, original_message=None):
+        """
+        :raise SubscriptionError: if the topic is invalid, or the connection can't subscribe to it
+        """
+        if not isinstance(topic, string_types) or not TOPIC_RE.match(topic):
+            raise SubscriptionError('Invalid topic: %r' % (topic, ))
+        if self.authorize is not None and not self.authorize(topic, original_message):
+            raise SubscriptionError('Subscription to %s is not allowed' % topic)
+
+    def subscribe(self, topic, original_message, version=None):
+        """
+        Subscribe a connection to a topic
+        :param str topic: topic
+        :param original_message: message of the connection
+        :param int version: version of the topic the client has, to only get the patches since then
+        :return: dict with the topic, its version, and its state or the patches since `version`
+        """
+        self.check_topic(topic, original_message)
+        Group(self.group_name(topic)).add(original_message.reply_channel)
+        self.backend.add_subscription(original_message.reply_channel.name, topic)
+        return self.snapshot(topic, version)
+
+    def unsubscribe(self, topic, original_message):
+        """
+        Unsubscribe a connection from a topic
+        :param str topic: topic
+        :param original_message: message of the connection
+        :return: None
+        """
+        self.check_topic(topic)
+        Group(self.group_name(topic)).discard(original_message.reply_channel)
+        self.backend.remove_subscription(original_message.reply_channel.name, topic)
+
+    def disconnect(self, reply_channel):
+        """
+        Unsubscribe a closed connection from all its topics
+        :param reply_channel: reply channel of the connection
+        :return: None
+        """
+        for topic in self.backend.pop_subscriptions(reply_channel.name):
+            Group(self.group_name(topic)).discard(reply_channel)
+
+    def snapshot(self, topic, version=None):
+        """
+        Returns the state of a topic, or the patches since a version
+        :param str topic: topic
+        :param int version: version the client has
+        :return: dict
+        """
+        topic_state = self.backend.get_topic(topic) or TopicState()
+        if version is not None and topic_state.history and \
+                topic_state.history[0][0] <= version + 1 and version <= topic_state.version:
+            patch = []
+            for patch_version, version_patch in topic_state.history:
+                if patch_version > version:
+                    patch.extend(version_patch)
+            return {'topic': topic, 'version': topic_state.version, 'patch': patch}
+        if version is not None and version == topic_state.version:
+            return {'topic': topic, 'version': topic_state.version, 'patch': []}
+        return {'topic': topic, 'version': topic_state.version, 'state': topic_state.state}
+
+    def publish(self, topic, state):
+        """
+        Publish the new state of a topic, notifying the subscribers with the patch from the previous state
+        :param str topic: topic
+        :param state: JSON value, copied
+        :return: int, new version of the topic
+        """
+        self.check_topic(topic)
+        # the state is copied, as publishers may update theirs in place
+        state = copy.deepcopy(state)
+        with self._lock:
+            topic_state = self.backend.get_topic(topic) or TopicState()
+            patch = make_patch(topic_state.state, state)
+            if not patch and topic_state.version:
+                return topic_state.version
+
+            version = topic_state.version + 1
+            history = (topic_state.history + [(version, patch)])[-self.history:] if self.history else []
+            self.backend.set_topic(topic, TopicState(version, state, history))
+
+        params = {'topic': topic, 'version': version}
+        if len(patch) == 1 and patch[0]['path'] == '':
+            params['state'] = state
+        else:
+            params['patch'] = patch
+        self.consumer_class.prepare_notification(self.method, params).send_to_group(self.group_name(topic))
+        return version
@@ -0,0 +1,131 @@
+"""
+Execution timeouts of the RPC methods, set with `rpc_method(timeout=...)` or the `call_timeout` of a consumer.
+
+Coroutine functions and calls waiting for the process pool are cancelled when their timeout expires. Threads can't
+be interrupted: synchronous methods are run in a thread the worker stops waiting for, and long-running ones can call
+`check_timeout()` between steps to stop once their call has been answered. A thread running a call that never
+returns is lost for the other calls, so a pool whose threads are all busy rejects the new calls with an ExecutorBusy
+error, rather than letting them time out before they even start.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+_local = threading.local()
+
+
+class CallTimeout(Exception):
+    """
+    Raised by check_timeout() when the timeout of the call being executed expired
+    """
+
+
+class ExecutorBusy(Exception):
+    """
+    Raised when a call can't be started because all the threads of its executor are busy
+    """
+
+
+class Deadline(object):
+    """
+    Deadline of a call running in a thread
+    """
+    __slots__ = ('timeout', 'expires', 'cancelled', 'started')
+
+    def __init__(self, timeout):
+        """
+        :param float timeout: number of seconds the call can run
+        """
+        self.timeout = timeout
+        self.expires = timer() + timeout
+        # set when the call has been answered with a timeout error
+        self.cancelled = False
+        # set when a thread starts running the call
+        self.started = False
+
+    def remaining(self):
+        """
+        Returns the number of seconds left to the call
+        :return: float
+        """
+        return max(0.0, self.expires - timer())
+
+    def expired(self):
+        return self.cancelled or timer() >= self.expires
+
+
+def call_with_deadline(deadline, func, *args):
+    """
+    Call a function with the deadline returned by current_deadline() in its thread
+    :param Deadline deadline: deadline of the call, or None
+    :param func: function
+    :return: result of the function
+    """
+    if deadline is not None:
+        deadline.started = True
+    _local.deadline = deadline
+    try:
+        return func(*args)
+    finally:
+        _local.deadline = None
+
+
+def current_deadline():
+    """
+    Returns the deadline of the call running in the current thread
+    :return: Deadline, None if the call has no timeout
+    """
+    return getattr(_local, 'deadline', None)
+
+
+def check_timeout():
+    """
+    Stop a synchronous RPC method whose timeout expired. A no-op for calls without a timeout.
+    :raise CallTimeout: if the timeout of the call expired
+    """
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        raise CallTimeout(deadline.timeout)
+
+
+class TimeoutExecutor(object):
+    """
+    Thread pool running the synchronous methods that have a timeout. It counts its busy threads, including the ones
+    still running calls that timed out, and rejects the calls it has no free thread for instead of queueing them.
+    """
+
+    def __init__(self, max_workers=4):
+        """
+        :param int max_workers: number of threads
+        """
+        self.max_workers = max_workers
+        self.busy = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run a function in a free thread
+        :param fn: function
+        :return: concurrent.futures.Future
+        :raise ExecutorBusy: if all the threads are busy
+        """
+        with self._lock:
+            if self.busy >= self.max_workers:
+                raise ExecutorBusy(self.max_workers)
+            self.busy += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        # the thread of a call is released when it returns, however long after its timeout
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future=None):
+        with self._lock:
+            self.busy -= 1
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
@@ -0,0 +1,208 @@
+"""
+Validation of the params of the RPC methods declared with `rpc_method(params_schema=...)` or `validate=True`.
+
+The schema of each param is compiled into a checker when the method is registered, so validating a call only runs
+the checks it needs. Schemas are Python types (`int`, `str`, `(int, float)`, ...) or a subset of JSON Schema:
+`type`, `enum`, `minimum`, `maximum`, `minLength`, `maxLength`, `minItems`, `maxItems`, `items`, `properties`,
+`required` and `additionalProperties`.
+"""
+from six import integer_types, string_types, text_type
+
+# Python types of the JSON Schema types
+JSON_TYPES = {
+    'string': string_types,
+    'integer': integer_types,
+    'number': integer_types + (float, ),
+    'boolean': (bool, ),
+    'null': (type(None), ),
+    'array': (list, ),
+    'object': (dict, ),
+}
+
+# JSON Schema types of the annotations, for the error messages
+_TYPE_NAMES = {int: 'integer', float: 'number', bool: 'boolean', text_type: 'string', str: 'string',
+               list: 'array', dict: 'object', type(None): 'null'}
+
+
+class InvalidParams(ValueError):
+    """
+    Raised by the validators for params that don't match the signature or the schema of the method
+    """
+
+
+def _type_checker(types, description):
+    # bool is a subclass of int, but not a JSON number
+    rejects_bool = bool not in types and any(t in integer_types for t in types)
+
+    def check(value, name):
+        if not isinstance(value, types) or (rejects_bool and isinstance(value, bool)):
+            raise InvalidParams('%s must be of type %s' % (name, description))
+    return check
+
+
+def _python_types(schema):
+    types = schema if isinstance(schema, tuple) else (schema, )
+    # float params accept integers, as JSON doesn't distinguish them
+    if float in types:
+        types += tuple(t for t in integer_types if t not in types)
+    if str in types or text_type in types:
+        types += string_types
+    return types
+
+
+def compile_schema(schema):
+    """
+    Compile the schema of a value
+    :param schema: Python type, tuple of types, or JSON Schema dict
+    :return: function check(value, name) raising InvalidParams
+    """
+    if isinstance(schema, (type, tuple)):
+        types = _python_types(schema)
+        description = ' or '.join(_TYPE_NAMES.get(t, t.__name__)
+                                  for t in (schema if isinstance(schema, tuple) else (schema, )))
+        return _type_checker(types, description)
+
+    checks = []
+    if 'type' in schema:
+        names = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        types = ()
+        for type_name in names:
+            types += JSON_TYPES[type_name]
+        checks.append(_type_checker(types, ' or '.join(names)))
+
+    if 'enum' in schema:
+        values = list(schema['enum'])
+
+        def check_enum(value, name):
+            if value not in values:
+                raise InvalidParams('%s must be one of %s' % (name, ', '.join(repr(v) for v in values)))
+        checks.append(check_enum)
+
+    numbers = integer_types + (float, )
+    if 'minimum' in schema:
+        minimum = schema['minimum']
+
+        def check_minimum(value, name):
+            if isinstance(value, numbers) and value < minimum:
+                raise InvalidParams('%s must be at least %s' % (name, minimum))
+        checks.append(check_minimum)
+
+    if 'maximum' in schema:
+        maximum = schema['maximum']
+
+        def check_maximum(value, name):
+            if isinstance(value, numbers) and value > maximum:
+                raise InvalidParams('%s must be at most %s' % (name, maximum))
+        checks.append(check_maximum)
+
+    for minimum_key, maximum_key, types, unit in (('minLength', 'maxLength', string_types, 'characters'),
+                                                  ('minItems', 'maxItems', (list, ), 'items')):
+        if minimum_key in schema or maximum_key in schema:
+            checks.append(_length_checker(schema.get(minimum_key), schema.get(maximum_key), types, unit))
+
+    if 'items' in schema:
+        check_item = compile_schema(schema['items'])
+
+        def check_items(value, name):
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    check_item(item, '%s[%d]' % (name, index))
+        checks.append(check_items)
+
+    if 'properties' in schema or 'required' in schema or 'additionalProperties' in schema:
+        checks.append(_object_checker(schema))
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value, name):
+        for check in checks:
+            check(value, name)
+    return check_all
+
+
+def _length_checker(minimum, maximum, types, unit):
+    def check(value, name):
+        if isinstance(value, types):
+            if minimum is not None and len(value) < minimum:
+                raise InvalidParams('%s must have at least %s %s' % (name, minimum, unit))
+            if maximum is not None and len(value) > maximum:
+                raise InvalidParams('%s must have at most %s %s' % (name, maximum, unit))
+    return check
+
+
+def _object_checker(schema):
+    properties = dict((key, compile_schema(value)) for key, value in schema.get('properties', {}).items())
+    required = tuple(schema.get('required', ()))
+    additional = schema.get('additionalProperties', True)
+    check_additional = compile_schema(additional) if isinstance(additional, (dict, type, tuple)) else None
+
+    def check(value, name):
+        if not isinstance(value, dict):
+            return
+        for key in required:
+            if key not in value:
+                raise InvalidParams('%s.%s is required' % (name, key))
+        for key, item in value.items():
+            item_name = '%s.%s' % (name, key)
+            check_property = properties.get(key)
+            if check_property is not None:
+                check_property(item, item_name)
+            elif check_additional is not None:
+                check_additional(item, item_name)
+            elif additional is False:
+                raise InvalidParams('%s is not allowed' % item_name)
+    return check
+
+
+def compile_params_validator(call_plan, params_schema=None, annotations=None):
+    """
+    Compile the validator of the params of an RPC function
+    :param channels_jsonrpc.jsonrpcconsumer.CallPlan call_plan: call plan of the function
+    :param dict params_schema: schema of each param, by name
+    :param dict annotations: annotations of the function, the ones that are classes are checked
+    :return: function validate(params) raising InvalidParams
+    :raise ValueError: if the schema names params the function doesn't take
+    """
+    schemas = {}
+    for name, annotation in (annotations or {}).items():
+        if name not in ('return', 'original_message') and isinstance(annotation, type):
+            schemas[name] = annotation
+    schemas.update(params_schema or {})
+
+    names = call_plan.positional + call_plan.keywords
+    unknown = [name for name in schemas if name not in names]
+    if unknown and not call_plan.varkw:
+        raise ValueError('params_schema names params the function does not take: %s' % ', '.join(sorted(unknown)))
+
+    checks = dict((name, compile_schema(schema)) for name, schema in schemas.items())
+    positional_checks = [(name, checks.get(name)) for name in call_plan.positional]
+    required = call_plan.required
+    required_positional = [name for name in required if name in call_plan.positional]
+    required_keywords = [name for name in required if name not in call_plan.positional]
+    max_arity = call_plan.max_arity
+    varkw = call_plan.varkw
+
+    def validate(params):
+        if isinstance(params, list):
+            if len(params) < len(required_positional):
+                raise InvalidParams('missing param %s' % required_positional[len(params)])
+            if required_keywords:
+                raise InvalidParams('missing param %s' % required_keywords[0])
+            if max_arity is not None and len(params) > max_arity:
+                raise InvalidParams('expected at most %d params, got %d' % (max_arity, len(params)))
+            for (name, check), value in zip(positional_checks, params):
+                if check is not None:
+                    check(value, name)
+            return
+
+        for name in required:
+            if name not in params:
+                raise InvalidParams('missing param %s' % name)
+        for name, value in params.items():
+            check = checks.get(name)
+            if check is not None:
+                check(value, name)
+            elif not varkw and name not in names:
+                raise InvalidParams('unexpected param %s' % name)
+    return validate
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from channels_jsonrpc import JsonRpcConsumerTest
+from channels import Channel
+from channels.tests import ChannelTestCase, HttpClient
+from .consumer import MyJsonRpcWebsocketConsumerTest, MyAsyncJsonRpcConsumerTest
+
+
+def process_id():
+    return os.getpid()
+
+
+class TestsAsyncConsumer(ChannelTestCase):
+
+    def receive(self, client):
+        MyAsyncJsonRpcConsumerTest.wait_pending(5)
+        return client.receive()
+
+    def test_coroutine_method(self):
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        async def async_ping(value, **kwargs):
+            await asyncio.sleep(0)
+            return [value, kwargs["original_message"].channel.name]
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"async_ping", "params":["test"]}',
+                                path='/async/')
+        self.assertEqual(self.receive(client), {u'jsonrpc': u'2.0', u'id': 1,
+                                                u'result': [u'test', u'websocket.receive']})
+
+    def test_sync_method(self):
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        def sync_ping():
+            return "pong"
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        async def async_error():
+            raise Exception("async_error")
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"sync_ping", "params":[]}', path='/async/')
+        self.assertEqual(self.receive(client)['result'], "pong")
+
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"async_error", "params":[]}', path='/async/')
+        self.assertEqual(self.receive(client)['error']['message'], "async_error")
+
+        client.send_and_consume(u'websocket.receive', text='{"id":1, "jsonrpc":', path='/async/')
+        self.assertEqual(self.receive(client)['error']['code'], JsonRpcConsumerTest.PARSE_ERROR)
+
+    def test_pipelined_requests_overlap(self):
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        async def async_sleep(value):
+            await asyncio.sleep(0.2)
+            return value
+
+        client = HttpClient()
+        start = time.time()
+        for i in range(5):
+            client.send_and_consume(u'websocket.receive',
+                                    text=json.dumps({"id": i, "jsonrpc": "2.0", "method": "async_sleep",
+                                                     "params": [i]}),
+                                    path='/async/')
+        MyAsyncJsonRpcConsumerTest.wait_pending(5)
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual(sorted(client.receive()['result'] for _i in range(5)), [0, 1, 2, 3, 4])
+
+    def test_batch_and_http(self):
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        async def async_echo(value):
+            return value
+
+        @MyAsyncJsonRpcConsumerTest.rpc_notification()
+        async def async_notif(value):
+            pass
+
+        client = HttpClient()
+        client.send_and_consume(u'http.request',
+                                {'method': 'POST',
+                                 'body': b'[{"id":1, "jsonrpc":"2.0", "method":"async_echo", "params":["a"]},'
+                                         b'{"jsonrpc":"2.0", "method":"async_notif", "params":["b"]},'
+                                         b'{"id":2, "jsonrpc":"2.0", "method":"async_echo", "params":["c"]}]'},
+                                path='/async/')
+        response = self.receive(client)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual([call['result'] for call in json.loads(response['content'].decode('utf-8'))], ['a', 'c'])
+
+    def test_coroutine_method_on_sync_consumer(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        async def async_ping2():
+            await asyncio.sleep(0)
+            return "pong"
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"async_ping2", "params":[]}')
+        self.assertEqual(client.receive()['result'], "pong")
+
+    def test_cached_coroutine_method(self):
+        calls = []
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method(cache=True)
+        async def async_cached(value):
+            calls.append(value)
+            return value
+
+        client = HttpClient()
+        for _id in (1, 2):
+            client.send_and_consume(u'websocket.receive',
+                                    text=json.dumps({"id": _id, "jsonrpc": "2.0", "method": "async_cached",
+                                                     "params": ["a"]}),
+                                    path='/async/')
+            self.assertEqual(self.receive(client), {u'jsonrpc': u'2.0', u'id': _id, u'result': u'a'})
+        self.assertEqual(calls, ["a"])
+
+    def test_http_streamed_batch(self):
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        async def async_streamed(value):
+            await asyncio.sleep(0)
+            return value
+
+        MyAsyncJsonRpcConsumerTest.http_streaming = True
+        try:
+            Channel('http.request.body?async').send({'content': b'"method":"async_streamed", "params":["b"]}]'})
+            client = HttpClient()
+            client.send_and_consume(u'http.request', {'method': 'POST', 'body_channel': 'http.request.body?async',
+                                                      'body': b'[{"id":1, "jsonrpc":"2.0", "method":"async_streamed",'
+                                                              b' "params":["a"]}, {"id":2, "jsonrpc":"2.0", '},
+                                    path='/async/')
+            MyAsyncJsonRpcConsumerTest.wait_pending(5)
+            response = client.receive(json=False)
+        finally:
+            MyAsyncJsonRpcConsumerTest.http_streaming = False
+        self.assertEqual(json.loads(response['content'].decode('utf-8')),
+                         [{u'jsonrpc': u'2.0', u'id': 1, u'result': u'a'},
+                          {u'jsonrpc': u'2.0', u'id': 2, u'result': u'b'}])
+
+    def test_streamed_result(self):
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method()
+        def async_rows(count):
+            for i in range(count):
+                yield i
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"async_rows", "params":[3]}', path='/async/')
+        self.assertEqual(self.receive(client)['params'], {u'id': 1, u'items': [0, 1, 2]})
+        self.assertEqual(client.receive(), {u'jsonrpc': u'2.0', u'id': 1, u'result': {u'count': 3}})
+
+    def test_process_method(self):
+        MyAsyncJsonRpcConsumerTest.rpc_method(executor='process')(process_id)
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"process_id", "params":[]}',
+                                path='/async/')
+        self.assertNotEqual(self.receive(client)['result'], os.getpid())
+
+        with self.assertRaises(ValueError):
+            @MyAsyncJsonRpcConsumerTest.rpc_method(executor='process')
+            async def async_process():
+                pass
+
+    def test_timeout(self):
+        cancelled = []
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method(timeout=0.05)
+        async def async_sleep(seconds):
+            try:
+                await asyncio.sleep(seconds)
+            except asyncio.CancelledError:
+                cancelled.append(seconds)
+                raise
+            return seconds
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"async_sleep", "params":[1]}',
+                                path='/async/')
+        self.assertEqual(self.receive(client)['error']['code'], JsonRpcConsumerTest.EXECUTION_TIMEOUT)
+        self.assertEqual(cancelled, [1])
+
+        # the synchronous consumer cancels coroutines too
+        MyJsonRpcWebsocketConsumerTest.rpc_method(timeout=0.05)(async_sleep)
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"async_sleep", "params":[2]}')
+        self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.EXECUTION_TIMEOUT)
+        self.assertEqual(cancelled, [1, 2])
+
+    def test_busy_threads(self):
+        release = threading.Event()
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method(timeout=0.1)
+        def async_hung():
+            release.wait(5)
+            return True
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method(timeout=0.2)
+        def async_fast():
+            return True
+
+        client = HttpClient()
+        try:
+            for i in range(MyAsyncJsonRpcConsumerTest.sync_max_workers or 4):
+                client.send_and_consume(u'websocket.receive', text=json.dumps(
+                    {"id": i, "jsonrpc": "2.0", "method": "async_hung", "params": []}), path='/async/')
+            client.send_and_consume(u'websocket.receive', text=json.dumps(
+                {"id": "fast", "jsonrpc": "2.0", "method": "async_fast", "params": []}), path='/async/')
+            MyAsyncJsonRpcConsumerTest.wait_pending(5)
+            errors = {}
+            while True:
+                response = client.receive()
+                if response is None:
+                    break
+                errors[response['id']] = response['error']['code']
+        finally:
+            release.set()
+
+        # the call waiting for a thread didn't time out
+        self.assertEqual(errors.pop('fast'), JsonRpcConsumerTest.SERVER_BUSY)
+        self.assertEqual(set(errors.values()), {JsonRpcConsumerTest.EXECUTION_TIMEOUT})
+
+    def test_coalesced_calls(self):
+        executions = []
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method(coalesce=True)
+        async def async_snapshot(dashboard):
+            executions.append(dashboard)
+            await asyncio.sleep(0.05)
+            return {'dashboard': dashboard}
+
+        client = HttpClient()
+        for i in range(5):
+            client.send_and_consume(u'websocket.receive', text=json.dumps(
+                {"id": i, "jsonrpc": "2.0", "method": "async_snapshot", "params": ["main"]}), path='/async/')
+        MyAsyncJsonRpcConsumerTest.wait_pending(5)
+        responses = sorted((client.receive() for _ in range(5)), key=lambda response: response['id'])
+        self.assertEqual(responses, [{u'jsonrpc': u'2.0', u'id': i, u'result': {u'dashboard': u'main'}}
+                                     for i in range(5)])
+        self.assertEqual(executions, ['main'])
+
+    def test_idempotent_calls(self):
+        executions = []
+
+        @MyAsyncJsonRpcConsumerTest.rpc_method(idempotent=True)
+        async def async_transfer(amount):
+            executions.append(amount)
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        client = HttpClient()
+        for i in range(3):
+            client.send_and_consume(u'websocket.receive', text=json.dumps(
+                {"id": i, "jsonrpc": "2.0", "method": "async_transfer", "params": [5], "idempotency_key": "t1"}),
+                path='/async/')
+        MyAsyncJsonRpcConsumerTest.wait_pending(5)
+        responses = sorted((client.receive() for _ in range(3)), key=lambda response: response['id'])
+        self.assertEqual(responses, [{u'jsonrpc': u'2.0', u'id': i, u'result': u'done'} for i in range(3)])
+        self.assertEqual(executions, [5])
@@ -1,3 +1,5 @@
+import sys
+
 from django.core.serializers.json import DjangoJSONEncoder
 
 from channels_jsonrpc import JsonRpcConsumerTest
@@ -69,3 +71,10 @@ def ping(fake_an_error, **kwargs):
 
 class DjangoJsonRpcWebsocketConsumerTest(JsonRpcConsumerTest):
     json_encoder_class = DjangoJSONEncoder
+
+
+if sys.version_info >= (3, 5):
+    from channels_jsonrpc import AsyncJsonRpcConsumer
+
+    class MyAsyncJsonRpcConsumerTest(AsyncJsonRpcConsumer):
+        pass
@@ -1,7 +1,17 @@
+import sys
+
+from channels_jsonrpc.metrics import metrics_route
+
 from .consumer import MyJsonRpcWebsocketConsumerTest, DjangoJsonRpcWebsocketConsumerTest
 
 
 channel_routing = [
+    metrics_route(path=r"^/metrics/$"),
     DjangoJsonRpcWebsocketConsumerTest.as_route(path=r"^/django/$"),
     MyJsonRpcWebsocketConsumerTest.as_route(path=r""),
 ]
+
+if sys.version_info >= (3, 5):
+    from .consumer import MyAsyncJsonRpcConsumerTest
+
+    channel_routing.insert(1, MyAsyncJsonRpcConsumerTest.as_route(path=r"^/async/$"))
@@ -1,8 +1,42 @@
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import warnings
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from decimal import Decimal
 from channels_jsonrpc import JsonRpcConsumerTest, JsonRpcException
-from channels.tests import ChannelTestCase, HttpClient
+from channels_jsonrpc.binarycodecs import BinaryCodec, cbor2, get_binary_codec, msgpack
+from channels_jsonrpc.coalescing import Coalescer
+from channels_jsonrpc.compression import GZIP_MAGIC, negotiate
+from channels_jsonrpc.idempotency import IdempotencyStore
+from channels_jsonrpc.jsonrpcconsumer import CallPlan
+from channels_jsonrpc.jsoncodecs import JsonCodec, codecs, get_codec, orjson
+from channels_jsonrpc.httpbody import JsonArraySplitter
+from channels_jsonrpc.metrics import MetricsRegistry
+from channels_jsonrpc.ratelimit import RateLimit
+from channels_jsonrpc.registry import registry
+from channels_jsonrpc.subscriptions import apply_patch
+from channels_jsonrpc.requestlog import RequestLog
+from channels_jsonrpc.timeouts import check_timeout
+from channels_jsonrpc.validation import InvalidParams, compile_schema
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import override_settings
+from django.utils.safestring import mark_safe
+from unittest import skipIf
+from channels import Channel
+from channels.tests import ChannelTestCase, HttpClient, apply_routes
 from .consumer import MyJsonRpcWebsocketConsumerTest, DjangoJsonRpcWebsocketConsumerTest
 
+if sys.version_info >= (3, 5):
+    from .async_tests import TestsAsyncConsumer
+
 
 class TestMyJsonRpcConsumer(JsonRpcConsumerTest):
     pass
@@ -48,6 +82,16 @@ class TestsJsonRPCWebsocketConsumer(ChannelTestCase):
                                                          JsonRpcConsumerTest.INVALID_REQUEST]})
 
         client.send_and_consume(u'websocket.receive', text='["value", "my_value"]')
+        self.assertEqual([response['error'] for response in client.receive()],
+                         [{u'code': JsonRpcConsumerTest.INVALID_REQUEST,
+                           u'message': JsonRpcConsumerTest.errors[JsonRpcConsumerTest.INVALID_REQUEST]}] * 2)
+
+        client.send_and_consume(u'websocket.receive', text='[]')
+        self.assertEqual(client.receive()['error'], {u'code': JsonRpcConsumerTest.INVALID_REQUEST,
+                                                     u'message': JsonRpcConsumerTest.errors[
+                                                         JsonRpcConsumerTest.INVALID_REQUEST]})
+
+        client.send_and_consume(u'websocket.receive', text='12')
         self.assertEqual(client.receive()['error'], {u'code': JsonRpcConsumerTest.INVALID_REQUEST,
                                                      u'message': JsonRpcConsumerTest.errors[
                                                          JsonRpcConsumerTest.INVALID_REQUEST]})
@@ -132,7 +176,7 @@ class TestsJsonRPCWebsocketConsumer(ChannelTestCase):
         self.assertEqual(msg['result'], "pong2")
 
     def test_parsing_with_good_request_wrong_params(self):
-        @JsonRpcConsumerTest.rpc_method()
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
         def ping2():
             return "pong2"
 
@@ -147,7 +191,7 @@ class TestsJsonRPCWebsocketConsumer(ChannelTestCase):
                        u'ping2() takes 0 positional arguments but 1 was given'])     # python 3
 
     def test_parsing_with_good_request_ainvalid_paramas(self):
-        @JsonRpcConsumerTest.rpc_method()
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
         def ping2(test):
             return "pong2"
 
@@ -470,6 +514,58 @@ class TestsJsonRPCWebsocketConsumer(ChannelTestCase):
         msg = client.receive()
         self.assertEqual(msg, None)
 
+    def test_call_plan(self):
+
+        def method(a, b, c=3, **kwargs):
+            pass
+
+        plan = CallPlan(method)
+        self.assertTrue(plan.takes_original_message)
+        self.assertEqual(plan.positional, ('a', 'b', 'c'))
+        self.assertEqual(plan.min_arity, 2)
+        self.assertEqual(plan.max_arity, 3)
+
+        def method2(*args):
+            pass
+
+        plan = CallPlan(method2)
+        self.assertFalse(plan.takes_original_message)
+        self.assertEqual(plan.min_arity, 0)
+        self.assertEqual(plan.max_arity, None)
+
+        # only **kwargs gets original_message, as before the call plans
+        def method3(a, **options):
+            return options
+
+        plan = CallPlan(method3)
+        self.assertFalse(plan.takes_original_message)
+        self.assertEqual(plan([1], None), {})
+
+    def test_original_message_as_named_param(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def ping_named_message(value, original_message):
+            return [value, original_message.channel.name]
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"ping_named_message", "params":["test"]}')
+        msg = client.receive()
+        self.assertEqual(msg['result'], ["test", "websocket.receive"])
+
+    def test_original_message_before_other_params(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def ping_message_first(original_message, value, other=None):
+            return [original_message.channel.name, value, other]
+
+        client = HttpClient()
+        for params, result in (([5], ["websocket.receive", 5, None]), ([5, 6], ["websocket.receive", 5, 6]),
+                               ({"value": 5}, ["websocket.receive", 5, None])):
+            client.send_and_consume(u'websocket.receive', text=json.dumps(
+                {"id": 1, "jsonrpc": "2.0", "method": "ping_message_first", "params": params}))
+            self.assertEqual(client.receive()['result'], result)
+
 
 class TestsNotifications(ChannelTestCase):
 
@@ -571,6 +667,58 @@ class TestsNotifications(ChannelTestCase):
         self.assertEqual(msg['method'], "notification.notif")
         self.assertEqual(msg['params'], {"payload": 1234})
 
+    def test_bulk_notifications(self):
+        from channels import Group
+
+        client = HttpClient()
+        client2 = HttpClient()
+        client3 = HttpClient()
+        Group("bulk_group1").add(client.reply_channel)
+        Group("bulk_group2").add(client2.reply_channel)
+
+        encode = MyJsonRpcWebsocketConsumerTest._encode
+        encoded = []
+
+        def counting_encode(data):
+            encoded.append(data)
+            return encode(data)
+
+        MyJsonRpcWebsocketConsumerTest._encode = staticmethod(counting_encode)
+        try:
+            MyJsonRpcWebsocketConsumerTest.notify_groups(["bulk_group1", "bulk_group2"], "notification.bulk",
+                                                         {"payload": 1})
+            MyJsonRpcWebsocketConsumerTest.notify_channels([client.reply_channel, client3.reply_channel],
+                                                           "notification.bulk", {"payload": 2})
+        finally:
+            del MyJsonRpcWebsocketConsumerTest._encode
+        self.assertEqual(len(encoded), 2)
+
+        for _client in (client, client2):
+            msg = _client.receive()
+            self.assertEqual(msg['method'], "notification.bulk")
+            self.assertEqual(msg['params'], {"payload": 1})
+        for _client in (client, client3):
+            msg = _client.receive()
+            self.assertEqual(msg['params'], {"payload": 2})
+        self.assertEqual(client.receive(), None)
+        self.assertEqual(client2.receive(), None)
+
+    def test_prepared_notification(self):
+        from channels import Group
+
+        client = HttpClient()
+        Group("prepared_group").add(client.reply_channel)
+
+        notification = MyJsonRpcWebsocketConsumerTest.prepare_notification("notification.prepared", [1, 2])
+        for _i in range(3):
+            notification.send_to_group("prepared_group")
+        notification.send_to_channel(client.reply_channel)
+
+        for _i in range(4):
+            msg = client.receive()
+            self.assertEqual(msg, {u'jsonrpc': u'2.0', u'method': u'notification.prepared', u'params': [1, 2]})
+        self.assertEqual(client.receive(), None)
+
     def test_inbound_notifications(self):
 
         @MyJsonRpcWebsocketConsumerTest.rpc_notification()
@@ -620,3 +768,1995 @@ class TestsNotifications(ChannelTestCase):
                                 text='{"jsonrpc":"2.0", "method":"dwqwdq", "params":[]}')
         msg = client.receive()
         self.assertEqual(msg, None)
+
+
+def http_request(client, body, method='POST', path='/', headers=None):
+    """
+    Send an HTTP request through the channel layer and return the response message
+    """
+    content = {'method': method, 'body': body}
+    if headers is not None:
+        content['headers'] = headers
+    client.send_and_consume(u'http.request', content, path=path)
+    return client.receive(json=False)
+
+
+class TestsBatch(ChannelTestCase):
+
+    def test_batch(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def batch_sum(a, b):
+            return a + b
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_notification()
+        def batch_notif(value):
+            pass
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='[{"id":1, "jsonrpc":"2.0", "method":"batch_sum", "params":[1, 2]},'
+                                     '{"jsonrpc":"2.0", "method":"batch_notif", "params":[1]},'
+                                     '{"id":2, "jsonrpc":"2.0", "method":"unknown_method", "params":[]},'
+                                     '1,'
+                                     '{"id":3, "jsonrpc":"2.0", "method":"batch_sum", "params":{"a": 3, "b": 4}}]')
+        responses = client.receive()
+        self.assertEqual(len(responses), 4)
+        self.assertEqual(responses[0], {u'jsonrpc': u'2.0', u'id': 1, u'result': 3})
+        self.assertEqual(responses[1]['error']['code'], JsonRpcConsumerTest.METHOD_NOT_FOUND)
+        self.assertEqual(responses[2]['error']['code'], JsonRpcConsumerTest.INVALID_REQUEST)
+        self.assertEqual(responses[3], {u'jsonrpc': u'2.0', u'id': 3, u'result': 7})
+        self.assertEqual(client.receive(), None)
+
+    def test_batch_of_notifications(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_notification()
+        def batch_notif(value):
+            pass
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='[{"jsonrpc":"2.0", "method":"batch_notif", "params":[1]},'
+                                     '{"jsonrpc":"2.0", "method":"batch_notif", "params":[2]}]')
+        self.assertEqual(client.receive(), None)
+
+    def test_http_batch(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def batch_echo(value):
+            return value
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_notification()
+        def batch_notif(value):
+            pass
+
+        client = HttpClient()
+        response = http_request(client, b'[{"id":1, "jsonrpc":"2.0", "method":"batch_echo", "params":["a"]},'
+                                        b'{"jsonrpc":"2.0", "method":"batch_notif", "params":[1]}]')
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(json.loads(response['content'].decode('utf-8')),
+                         [{u'jsonrpc': u'2.0', u'id': 1, u'result': u'a'}])
+
+        response = http_request(client, b'[{"jsonrpc":"2.0", "method":"batch_notif", "params":[1]}]')
+        self.assertEqual(response['status'], 204)
+        self.assertEqual(response['content'], b'')
+
+    def test_concurrent_batch(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def batch_sleep(value):
+            time.sleep(0.2)
+            return value
+
+        MyJsonRpcWebsocketConsumerTest.batch_max_workers = 4
+        try:
+            client = HttpClient()
+            start = time.time()
+            client.send_and_consume(u'websocket.receive',
+                                    text=json.dumps([{"id": i, "jsonrpc": "2.0", "method": "batch_sleep", "params": [i]}
+                                                     for i in range(4)]))
+            elapsed = time.time() - start
+        finally:
+            MyJsonRpcWebsocketConsumerTest.batch_max_workers = None
+
+        self.assertEqual([response['result'] for response in client.receive()], [0, 1, 2, 3])
+        self.assertLess(elapsed, 0.6)
+
+
+class TestsJsonCodecs(ChannelTestCase):
+
+    def test_fallback_codec(self):
+        with self.assertLogs('channels_jsonrpc.jsoncodecs', 'WARNING'):
+            codec = get_codec('not_a_codec')
+        self.assertEqual(type(codec), JsonCodec)
+        self.assertEqual(codec.loads(codec.dumps({"a": [1]})), {"a": [1]})
+
+    def test_default_codec(self):
+        self.assertEqual(type(MyJsonRpcWebsocketConsumerTest._get_codec()), JsonCodec)
+
+    @skipIf(orjson is None, "orjson is not installed")
+    def test_encoder_class_honoured(self):
+        some_date = datetime.utcnow()
+        codec = get_codec('orjson', DjangoJSONEncoder)
+        self.assertEqual(codec.loads(codec.dumps_bytes({'date': some_date})),
+                         {'date': DjangoJSONEncoder().default(some_date)})
+
+    def test_output_parity(self):
+        values = {
+            'ordered': OrderedDict([('b', 1), ('a', 2)]),
+            'safe': mark_safe(u'<b>\xe9</b>'),
+            'date': datetime(2017, 1, 2, 3, 4, 5, 123456),
+            'decimal': Decimal('1.10'),
+            'int_keys': {1: 2},
+        }
+        expected = json.loads(json.dumps(values, cls=DjangoJSONEncoder))
+        for name, codec_class in codecs.items():
+            if not codec_class.is_available():
+                continue
+            codec = codec_class(DjangoJSONEncoder)
+            decoded = json.loads(codec.dumps(values))
+            if name == 'ujson':
+                # encoded natively, see UjsonCodec
+                self.assertEqual(decoded.pop('decimal'), 1.1)
+                decoded['decimal'] = expected['decimal']
+            self.assertEqual(decoded, expected, name)
+            self.assertEqual(json.loads(codec.dumps_bytes(values).decode('utf-8')), json.loads(codec.dumps(values)))
+
+    def test_auto_codec(self):
+        self.assertNotEqual(get_codec('auto').name, 'ujson')
+
+    @skipIf(orjson is None, "orjson is not installed")
+    def test_codec_setting(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def codec_echo(value):
+            return value
+
+        with override_settings(CHANNELS_JSONRPC_CODEC='orjson'):
+            self.assertEqual(MyJsonRpcWebsocketConsumerTest._get_codec().name, 'orjson')
+
+            client = HttpClient()
+            client.send_and_consume(u'websocket.receive',
+                                    text='{"id":1, "jsonrpc":"2.0", "method":"codec_echo", "params":[{"a": 1}]}')
+            self.assertEqual(client.receive()['result'], {"a": 1})
+
+            response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"codec_echo", "params":["\xc3\xa9"]}')
+            self.assertEqual(json.loads(response['content'].decode('utf-8'))['result'], u'\xe9')
+
+            response = http_request(client, b'{"id":1, "jsonrpc":')
+            self.assertEqual(json.loads(response['content'].decode('utf-8'))['error']['code'],
+                             JsonRpcConsumerTest.PARSE_ERROR)
+
+        self.assertEqual(MyJsonRpcWebsocketConsumerTest._get_codec().name, 'json')
+
+
+class TestsCors(ChannelTestCase):
+
+    def headers(self, response):
+        return dict((name.decode('latin1').lower(), value.decode('latin1')) for name, value in response['headers'])
+
+    def test_cors_headers(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def cors_ping():
+            return "pong"
+
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"cors_ping", "params":[]}'
+        client = HttpClient()
+        for _i in range(2):
+            response = http_request(client, body, headers={'origin': b'http://allowed.example.com'})
+            self.assertEqual(response['status'], 200)
+            self.assertEqual(self.headers(response)['access-control-allow-origin'], 'http://allowed.example.com')
+
+        response = http_request(client, body, headers={'origin': b'http://other.example.com'})
+        self.assertEqual(response['status'], 200)
+        self.assertNotIn('access-control-allow-origin', self.headers(response))
+
+        response = http_request(client, body)
+        self.assertNotIn('access-control-allow-origin', self.headers(response))
+
+    def test_preflight(self):
+        client = HttpClient()
+        response = http_request(client, b'', method='OPTIONS',
+                                headers={'origin': b'http://allowed.example.com',
+                                         'access-control-request-method': b'POST'})
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['content'], b'')
+        headers = self.headers(response)
+        self.assertEqual(headers['access-control-allow-origin'], 'http://allowed.example.com')
+        self.assertIn('POST', headers['access-control-allow-methods'])
+
+    def test_changed_settings(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def cors_settings_ping():
+            return "pong"
+
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"cors_settings_ping", "params":[]}'
+        client = HttpClient()
+        response = http_request(client, body, headers={'origin': b'http://other.example.com'})
+        self.assertNotIn('access-control-allow-origin', self.headers(response))
+
+        with override_settings(CORS_ORIGIN_ALLOW_ALL=True, CORS_EXPOSE_HEADERS=('x-test', )):
+            response = http_request(client, body, headers={'origin': b'http://other.example.com'})
+            headers = self.headers(response)
+            self.assertEqual(headers['access-control-allow-origin'], '*')
+            self.assertEqual(headers['access-control-expose-headers'], 'x-test')
+
+        response = http_request(client, body, headers={'origin': b'http://other.example.com'})
+        self.assertNotIn('access-control-allow-origin', self.headers(response))
+        self.assertNotIn('access-control-expose-headers', self.headers(response))
+
+
+class TestsResultCache(ChannelTestCase):
+
+    def call(self, client, method, params, path='/'):
+        client.send_and_consume(u'websocket.receive',
+                                text=json.dumps({"id": 1, "jsonrpc": "2.0", "method": method, "params": params}),
+                                path=path)
+        return client.receive()['result']
+
+    def test_cached_method(self):
+        calls = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True)
+        def cached_lookup(key, other=None):
+            calls.append(key)
+            return [key, len(calls)]
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, "cached_lookup", ["a"]), ["a", 1])
+        self.assertEqual(self.call(client, "cached_lookup", ["a"]), ["a", 1])
+        self.assertEqual(self.call(client, "cached_lookup", {"key": "a", "other": 1}), ["a", 2])
+        self.assertEqual(self.call(client, "cached_lookup", {"other": 1, "key": "a"}), ["a", 2])
+        self.assertEqual(MyJsonRpcWebsocketConsumerTest.get_result_cache("cached_lookup").stats(),
+                         {'hits': 2, 'misses': 2})
+
+        MyJsonRpcWebsocketConsumerTest.invalidate_cache("cached_lookup", ["a"])
+        self.assertEqual(self.call(client, "cached_lookup", ["a"]), ["a", 3])
+        self.assertEqual(self.call(client, "cached_lookup", {"key": "a", "other": 1}), ["a", 2])
+
+        MyJsonRpcWebsocketConsumerTest.invalidate_cache("cached_lookup")
+        self.assertEqual(self.call(client, "cached_lookup", {"key": "a", "other": 1}), ["a", 4])
+
+    def test_ttl_and_lru(self):
+        calls = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache={'ttl': 0.1, 'maxsize': 2})
+        def cached_ttl(key):
+            calls.append(key)
+            return len(calls)
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, "cached_ttl", ["a"]), 1)
+        self.assertEqual(self.call(client, "cached_ttl", ["b"]), 2)
+        self.assertEqual(self.call(client, "cached_ttl", ["a"]), 1)
+        # "b" is the least recently used
+        self.assertEqual(self.call(client, "cached_ttl", ["c"]), 3)
+        self.assertEqual(self.call(client, "cached_ttl", ["a"]), 1)
+        self.assertEqual(self.call(client, "cached_ttl", ["b"]), 4)
+
+        time.sleep(0.15)
+        self.assertEqual(self.call(client, "cached_ttl", ["b"]), 5)
+
+    def test_per_user_cache(self):
+        calls = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache={'per_user': True})
+        def cached_per_user():
+            calls.append(1)
+            return len(calls)
+
+        client = HttpClient()
+        client2 = HttpClient()
+        self.assertEqual(self.call(client, "cached_per_user", []), 1)
+        self.assertEqual(self.call(client2, "cached_per_user", []), 2)
+        self.assertEqual(self.call(client, "cached_per_user", []), 1)
+
+    def test_functions_taking_original_message(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True, coalesce=True)
+        def cached_reply_channel(original_message):
+            return original_message.reply_channel.name
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache={'per_user': False}, coalesce={'per_user': False})
+        def cached_shared(original_message):
+            return original_message.reply_channel.name
+
+        # the results of functions taking original_message are scoped to the user (or connection) by default
+        client = HttpClient()
+        client2 = HttpClient()
+        self.assertEqual(self.call(client, "cached_reply_channel", []), client.reply_channel)
+        self.assertEqual(self.call(client2, "cached_reply_channel", []), client2.reply_channel)
+        self.assertEqual(self.call(client, "cached_shared", []), client.reply_channel)
+        self.assertEqual(self.call(client2, "cached_shared", []), client.reply_channel)
+
+        methods = registry.get_methods(MyJsonRpcWebsocketConsumerTest)
+        self.assertEqual([methods[name].options['coalesce'].per_user
+                          for name in ('cached_reply_channel', 'cached_shared')], [True, False])
+
+    def test_django_cache_backend(self):
+        calls = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache={'backend': 'django', 'ttl': 60})
+        def cached_django(key):
+            calls.append(key)
+            return len(calls)
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, "cached_django", ["a"]), 1)
+        self.assertEqual(self.call(client, "cached_django", ["a"]), 1)
+        self.assertEqual(self.call(client, "cached_django", ["b"]), 2)
+
+        MyJsonRpcWebsocketConsumerTest.invalidate_cache("cached_django")
+        self.assertEqual(self.call(client, "cached_django", ["a"]), 3)
+        self.assertEqual(self.call(client, "cached_django", ["b"]), 4)
+
+        # a method with the same name on another consumer has its own entries
+        @DjangoJsonRpcWebsocketConsumerTest.rpc_method('cached_django', cache={'backend': 'django', 'ttl': 60})
+        def other_cached_django(key):
+            return 'other'
+
+        self.assertEqual(self.call(client, "cached_django", ["a"], path='/django/'), 'other')
+        DjangoJsonRpcWebsocketConsumerTest.invalidate_cache("cached_django")
+        self.assertEqual(self.call(client, "cached_django", ["a"]), 3)
+        self.assertEqual(MyJsonRpcWebsocketConsumerTest.get_result_cache("cached_django").backend.namespace,
+                         'django_example.consumer.MyJsonRpcWebsocketConsumerTest:cached_django')
+
+    def test_encoded_response_cached(self):
+        calls = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True)
+        def cached_rows(count):
+            calls.append(count)
+            return [{"row": i} for i in range(count)]
+
+        client = HttpClient()
+        for _id in (1, "two", None):
+            client.send_and_consume(u'websocket.receive',
+                                    text=json.dumps({"id": _id, "jsonrpc": "2.0", "method": "cached_rows",
+                                                     "params": [3]}))
+            msg = client.receive()
+            if _id is None:
+                # no id: notification of an unknown notification
+                self.assertEqual(msg, None)
+            else:
+                self.assertEqual(msg, {u'jsonrpc': u'2.0', u'id': _id,
+                                       u'result': [{u'row': 0}, {u'row': 1}, {u'row': 2}]})
+        self.assertEqual(calls, [3])
+
+        client.send_and_consume(u'websocket.receive',
+                                text='[{"id":1, "jsonrpc":"2.0", "method":"cached_rows", "params":[1]},'
+                                     '{"id":2, "jsonrpc":"2.0", "method":"unknown_method", "params":[]}]')
+        responses = client.receive()
+        self.assertEqual(responses[0], {u'jsonrpc': u'2.0', u'id': 1, u'result': [{u'row': 0}]})
+        self.assertEqual(responses[1]['error']['code'], JsonRpcConsumerTest.METHOD_NOT_FOUND)
+
+    def test_http_etag(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True)
+        def cached_http(value):
+            return value
+
+        client = HttpClient()
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"cached_http", "params":["a"]}'
+        response = http_request(client, body)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(json.loads(response['content'].decode('utf-8')),
+                         {u'jsonrpc': u'2.0', u'id': 1, u'result': u'a'})
+        etag = dict(response['headers'])[b'ETag']
+
+        response = http_request(client, body, headers={'if-none-match': etag})
+        self.assertEqual(response['status'], 304)
+        self.assertEqual(response['content'], b'')
+
+        response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"cached_http", "params":["b"]}',
+                                headers={'if-none-match': etag})
+        self.assertEqual(response['status'], 200)
+        self.assertNotEqual(dict(response['headers'])[b'ETag'], etag)
+
+
+class TestsMetrics(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsMetrics, self).setUp()
+        self.registry = MetricsRegistry()
+        MyJsonRpcWebsocketConsumerTest.metrics = self.registry
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.metrics = None
+        super(TestsMetrics, self).tearDown()
+
+    def test_method_metrics(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def measured(value):
+            if value is None:
+                raise Exception("no value")
+            return value
+
+        client = HttpClient()
+        for value in ("a", "b", None):
+            client.send_and_consume(u'websocket.receive',
+                                    text=json.dumps({"id": 1, "jsonrpc": "2.0", "method": "measured",
+                                                     "params": [value]}))
+            client.receive()
+        client.send_and_consume(u'websocket.receive',
+                                text='[{"id":1, "jsonrpc":"2.0", "method":"measured", "params":["c"]},'
+                                     '{"id":2, "jsonrpc":"2.0", "method":"no_such_method", "params":[]}]')
+        client.receive()
+        client.send_and_consume(u'websocket.receive', text='{"id": 1')
+        client.receive()
+
+        # methods that aren't strings are unknown
+        for method in ([1], {"a": 1}, 1):
+            client.send_and_consume(u'websocket.receive',
+                                    text=json.dumps({"id": 1, "jsonrpc": "2.0", "method": method}))
+            self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.INVALID_REQUEST)
+
+        metrics = MyJsonRpcWebsocketConsumerTest.get_metrics()
+        self.assertEqual(sorted(metrics.methods), ['(batch)', '(unknown)', 'measured'])
+        measured_metrics = metrics.methods['measured']
+        self.assertEqual(measured_metrics.calls, 4)
+        self.assertEqual(measured_metrics.errors[JsonRpcConsumerTest.GENERIC_APPLICATION_ERROR], 1)
+        self.assertEqual(measured_metrics.dispatch.count, 4)
+        self.assertEqual(measured_metrics.parse.count, 3)
+        self.assertEqual(measured_metrics.encode.count, 3)
+        self.assertEqual(metrics.batch.parse.count, 1)
+        self.assertEqual(metrics.batch.response_size.count, 1)
+        self.assertEqual(metrics.unknown.errors[JsonRpcConsumerTest.METHOD_NOT_FOUND], 1)
+        self.assertEqual(metrics.unknown.errors[JsonRpcConsumerTest.PARSE_ERROR], 1)
+
+    def test_prometheus_export(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def measured_http(value):
+            return value
+
+        client = HttpClient()
+        response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"measured_http", "params":["a"]}')
+
+        text = self.registry.render_prometheus()
+        labels = 'consumer="django_example.consumer.MyJsonRpcWebsocketConsumerTest",method="measured_http"'
+        self.assertIn('jsonrpc_calls_total{%s} 1\n' % labels, text)
+        self.assertIn('jsonrpc_phase_seconds_bucket{%s,phase="dispatch",le="+Inf"} 1\n' % labels, text)
+        self.assertIn('jsonrpc_request_bytes_count{%s} 1\n' % labels, text)
+        self.assertIn('jsonrpc_response_bytes_sum{%s} %s\n' % (labels, len(response['content'])), text)
+
+    def test_metrics_route(self):
+        MyJsonRpcWebsocketConsumerTest.metrics = True
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"ping", "params":[false]}')
+        client.receive()
+
+        response = http_request(client, b'', method='GET', path='/metrics/')
+        self.assertEqual(response['status'], 200)
+        self.assertIn(b'jsonrpc_calls_total{consumer="django_example.consumer.MyJsonRpcWebsocketConsumerTest",'
+                      b'method="ping"}', response['content'])
+
+
+class TestsHttpBody(ChannelTestCase):
+    body_channel_ids = itertools.count()
+
+    def setUp(self):
+        super(TestsHttpBody, self).setUp()
+        MyJsonRpcWebsocketConsumerTest.http_streaming = True
+        MyJsonRpcWebsocketConsumerTest.http_max_body_size = 1024
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.http_streaming = False
+        MyJsonRpcWebsocketConsumerTest.http_max_body_size = None
+        super(TestsHttpBody, self).tearDown()
+
+    def chunked_request(self, client, chunks, headers=None):
+        """
+        Send an HTTP request whose body is received on a body channel
+        """
+        body_channel = 'http.request.body?%s' % next(self.body_channel_ids)
+        for i, chunk in enumerate(chunks[1:]):
+            Channel(body_channel).send({'content': chunk, 'more_content': i < len(chunks) - 2})
+        content = {'method': 'POST', 'body': chunks[0], 'body_channel': body_channel}
+        if headers is not None:
+            content['headers'] = headers
+        client.send_and_consume(u'http.request', content, path='/')
+        return client.receive(json=False)
+
+    def test_splitter(self):
+        values = [{u"a": u'x,]}"\\'}, [1, {u"b": [2]}], u'"\u00e9t\u00e9"\\', 3, None, u"\\"]
+        document = u'  [ %s ]  ' % u' ,'.join(json.dumps(value, ensure_ascii=False) for value in values)
+        document = document.encode('utf-8')
+        splitter = JsonArraySplitter()
+        elements = []
+        for i in range(len(document)):
+            elements.extend(splitter.feed(document[i:i + 1]))
+        splitter.close()
+        self.assertEqual([json.loads(element) for element in elements], values)
+
+        for invalid in (b'{"a": 1}', b'[1,, 2]', b'[1, 2,]', b'[1] 2', b'[1, 2'):
+            splitter = JsonArraySplitter()
+            with self.assertRaises(ValueError):
+                splitter.feed(invalid)
+                splitter.close()
+
+    def test_streamed_batch(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def streamed_echo(value):
+            return value
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_notification()
+        def streamed_notification(value):
+            pass
+
+        client = HttpClient()
+        response = self.chunked_request(client, [b'[{"id":1, "jsonrpc":"2.0", "method":"streamed_echo", "par',
+                                                 b'ams":["a,]"]}, {"jsonrpc":"2.0", "method":"streamed_notif',
+                                                 b'ication", "params":[1]}, 1,',
+                                                 b'{"id":2, "jsonrpc":"2.0", "method":"streamed_echo", '
+                                                 b'"params":[[1, 2]]}]'])
+        self.assertEqual(response['status'], 200)
+        responses = json.loads(response['content'].decode('utf-8'))
+        self.assertEqual(responses[0], {u'jsonrpc': u'2.0', u'id': 1, u'result': u'a,]'})
+        self.assertEqual(responses[1]['error']['code'], JsonRpcConsumerTest.INVALID_REQUEST)
+        self.assertEqual(responses[2], {u'jsonrpc': u'2.0', u'id': 2, u'result': [1, 2]})
+
+        response = self.chunked_request(client, [b' {"id":1, "jsonrpc":"2.0", ', b'"method":"streamed_echo", '
+                                                                              b'"params":["b"]}'])
+        self.assertEqual(json.loads(response['content'].decode('utf-8')),
+                         {u'jsonrpc': u'2.0', u'id': 1, u'result': u'b'})
+
+        response = self.chunked_request(client, [b'[{"id":1, "jsonrpc":"2.0", "method":"streamed_echo", ',
+                                                 b'"params":["a"]}, {"id": 2'])
+        self.assertEqual(response['status'], 500)
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['error']['code'],
+                         JsonRpcConsumerTest.PARSE_ERROR)
+
+    def test_whitespace_body(self):
+        client = HttpClient()
+        responses = [http_request(client, b'   '), http_request(client, b''),
+                     self.chunked_request(client, [b' ', b'\n\t', b' '])]
+        # answered as without streaming
+        self.assertEqual([json.loads(response['content'].decode('utf-8'))['error']['code'] for response in responses],
+                         [JsonRpcConsumerTest.PARSE_ERROR, JsonRpcConsumerTest.INVALID_REQUEST,
+                          JsonRpcConsumerTest.PARSE_ERROR])
+
+    def test_max_body_size(self):
+        client = HttpClient()
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"ping", "params":[false]}'
+
+        response = self.chunked_request(client, [body], headers={'content-length': b'4096'})
+        self.assertEqual(response['status'], 413)
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['error']['code'],
+                         JsonRpcConsumerTest.REQUEST_TOO_LARGE)
+
+        response = self.chunked_request(client, [b'[' + body + b',', body + b',' + b' ' * 1024, body + b']'])
+        self.assertEqual(response['status'], 413)
+
+        MyJsonRpcWebsocketConsumerTest.http_streaming = False
+        response = self.chunked_request(client, [body[:10], body[10:]])
+        self.assertEqual(response['status'], 200)
+        response = self.chunked_request(client, [body, b' ' * 1024])
+        self.assertEqual(response['status'], 413)
+
+
+class TestsStreamedResults(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsStreamedResults, self).setUp()
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def rows(count, fail=False):
+            for i in range(count):
+                yield {"row": i}
+            if fail:
+                raise Exception("no more rows")
+
+    def test_websocket(self):
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"rows", "params":[250]}')
+        items = []
+        for size in (100, 100, 50):
+            msg = client.receive()
+            self.assertEqual(msg['method'], 'rpc.stream')
+            self.assertEqual(msg['params']['id'], 1)
+            self.assertEqual(len(msg['params']['items']), size)
+            items.extend(msg['params']['items'])
+        self.assertEqual(items, [{u'row': i} for i in range(250)])
+        self.assertEqual(client.receive(), {u'jsonrpc': u'2.0', u'id': 1, u'result': {u'count': 250}})
+        self.assertEqual(client.receive(), None)
+
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":2, "jsonrpc":"2.0", "method":"rows", "params":[10, true]}')
+        self.assertEqual(len(client.receive()['params']['items']), 10)
+        msg = client.receive()
+        self.assertEqual(msg['id'], 2)
+        self.assertEqual(msg['error']['message'], "no more rows")
+
+    def test_http(self):
+        client = HttpClient()
+        for params, expected in (
+                ([3], {u'jsonrpc': u'2.0', u'id': 1, u'result': [{u'row': 0}, {u'row': 1}, {u'row': 2}]}),
+                ([0], {u'jsonrpc': u'2.0', u'id': 1, u'result': []})):
+            body = json.dumps({"id": 1, "jsonrpc": "2.0", "method": "rows", "params": params}).encode('utf-8')
+            response = http_request(client, body)
+            self.assertEqual(response['status'], 200)
+            content = response['content']
+            while response.get('more_content'):
+                response = client.receive(json=False)
+                content += response.get('content', b'')
+            self.assertEqual(json.loads(content.decode('utf-8')), expected)
+
+        # failing before the response is started: a clean error
+        response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"rows", "params":[2, true]}')
+        self.assertEqual(response['status'], 500)
+        response = json.loads(response['content'].decode('utf-8'))
+        self.assertNotIn('result', response)
+        self.assertEqual(response['error']['message'], "no more rows")
+
+        # failing once started: the response is cut, without a result
+        with self.assertLogs('channels_jsonrpc.jsonrpcconsumer', 'ERROR'):
+            response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"rows", "params":[150, true]}')
+            self.assertEqual(response['status'], 200)
+            content = response['content']
+            while response.get('more_content'):
+                response = client.receive(json=False)
+                content += response.get('content', b'')
+        with self.assertRaises(ValueError):
+            json.loads(content.decode('utf-8'))
+
+    def test_batch(self):
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='[{"id":1, "jsonrpc":"2.0", "method":"rows", "params":[2]},'
+                                     '{"id":2, "jsonrpc":"2.0", "method":"rows", "params":[1, true]}]')
+        responses = client.receive()
+        self.assertEqual(responses[0], {u'jsonrpc': u'2.0', u'id': 1, u'result': [{u'row': 0}, {u'row': 1}]})
+        self.assertEqual(responses[1]['error']['message'], "no more rows")
+
+
+class TestsRateLimit(ChannelTestCase):
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.rate_limit = None
+        super(TestsRateLimit, self).tearDown()
+
+    def test_token_bucket(self):
+        rate_limit = RateLimit('2/s').bind('test')
+        self.assertEqual(rate_limit.capacity, 2)
+        backend = rate_limit.backend
+        self.assertEqual(backend.consume('a', 2, 2), 0)
+        self.assertEqual(backend.consume('a', 2, 2), 0)
+        self.assertGreater(backend.consume('a', 2, 2), 0)
+        self.assertEqual(backend.consume('b', 2, 2), 0)
+        time.sleep(0.55)
+        self.assertEqual(backend.consume('a', 2, 2), 0)
+
+        self.assertEqual(RateLimit('60/m', burst=5).rate, 1)
+        self.assertEqual(RateLimit('60/m', burst=5).capacity, 5)
+        self.assertEqual(RateLimit(0.5).capacity, 1)
+
+    def test_method_rate(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(rate={'rate': '2/m', 'key': 'channel'})
+        def limited():
+            return True
+
+        client = HttpClient()
+        for _ in range(2):
+            client.send_and_consume(u'websocket.receive',
+                                    text='{"id":1, "jsonrpc":"2.0", "method":"limited", "params":[]}')
+            self.assertEqual(client.receive()['result'], True)
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"limited", "params":[]}')
+        msg = client.receive()
+        self.assertEqual(msg['id'], 1)
+        self.assertEqual(msg['error']['code'], JsonRpcConsumerTest.RATE_LIMITED)
+        self.assertGreater(msg['error']['data']['retry_after'], 0)
+
+        # the buckets are per reply channel
+        other_client = HttpClient()
+        other_client.send_and_consume(u'websocket.receive',
+                                      text='{"id":1, "jsonrpc":"2.0", "method":"limited", "params":[]}')
+        self.assertEqual(other_client.receive()['result'], True)
+
+    def test_http_clients(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(rate='1/m')
+        def http_limited():
+            return True
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(rate={'rate': '1/m', 'key': 'user', 'backend': 'django'})
+        def http_limited_per_user():
+            return True
+
+        client = HttpClient()
+        for method in ('http_limited', 'http_limited_per_user'):
+            statuses = []
+            for i, address in enumerate(('10.0.0.1', '10.0.0.1', '10.0.0.2')):
+                # each HTTP request has its own reply channel: anonymous clients are counted by their address
+                reply_channel = 'http.response.%s%s' % (method, i)
+                body = json.dumps({"id": 1, "jsonrpc": "2.0", "method": method, "params": []}).encode('utf-8')
+                client.send_and_consume(u'http.request', {'method': 'POST', 'body': body, 'client': [address, 5000],
+                                                          'reply_channel': reply_channel}, path='/')
+                statuses.append(self.get_next_message(reply_channel, require=True)['status'])
+            self.assertEqual(statuses, [200, 429, 200])
+
+        # the buckets of the methods with the same name on other consumers are separate
+        rate_limit = registry.get_methods(MyJsonRpcWebsocketConsumerTest)['http_limited_per_user'].options['rate']
+        self.assertEqual(rate_limit.backend.namespace,
+                         'django_example.consumer.MyJsonRpcWebsocketConsumerTest:http_limited_per_user')
+
+    def test_websocket_clients(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(rate={'rate': '1/m', 'key': 'ip'})
+        def ws_limited_per_ip():
+            return True
+
+        results = []
+        for address in ('10.0.0.1', '10.0.0.1', '10.0.0.2'):
+            # the frames don't carry the address: it is kept from the connection message
+            client = HttpClient()
+            client.send_and_consume(u'websocket.connect', {'client': [address, 5000]})
+            client.receive()
+            client.send_and_consume(u'websocket.receive',
+                                    text='{"id":1, "jsonrpc":"2.0", "method":"ws_limited_per_ip", "params":[]}')
+            response = client.receive()
+            results.append(response['error']['code'] if 'error' in response else response['result'])
+        self.assertEqual(results, [True, JsonRpcConsumerTest.RATE_LIMITED, True])
+
+        # consumers without channel session can't count WebSocket clients by address
+        class SessionlessConsumer(JsonRpcConsumerTest):
+            pass
+
+        with self.assertRaises(ValueError):
+            SessionlessConsumer.rpc_method(rate={'rate': '1/m', 'key': 'ip'})(ws_limited_per_ip)
+        SessionlessConsumer.rpc_method(rate={'rate': '1/m', 'key': 'ip'}, websocket=False)(ws_limited_per_ip)
+
+    def test_consumer_rate(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def admitted():
+            return True
+
+        MyJsonRpcWebsocketConsumerTest.rate_limit = {'rate': '1/m', 'key': 'ip'}
+        client = HttpClient()
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"admitted", "params":[]}'
+        self.assertEqual(http_request(client, body)['status'], 200)
+
+        response = http_request(client, body)
+        self.assertEqual(response['status'], 429)
+        self.assertEqual(dict(response['headers'])[b'Retry-After'], b'60')
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['error']['code'],
+                         JsonRpcConsumerTest.RATE_LIMITED)
+
+        # frames are rejected before being parsed
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive', text='{"id": 1')
+        self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.PARSE_ERROR)
+        client.send_and_consume(u'websocket.receive', text='{"id": 1')
+        self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.RATE_LIMITED)
+
+
+class TestsMethodRegistry(ChannelTestCase):
+
+    def test_inheritance(self):
+
+        class BaseConsumer(JsonRpcConsumerTest):
+            pass
+
+        class ChildConsumer(BaseConsumer):
+            pass
+
+        @BaseConsumer.rpc_method()
+        def shared():
+            return 'base'
+
+        @BaseConsumer.rpc_method(http=False)
+        def overridden():
+            return 'base'
+
+        @ChildConsumer.rpc_method('overridden')
+        def child_overridden():
+            return 'child'
+
+        self.assertEqual(sorted(ChildConsumer.get_rpc_methods()), ['overridden', 'shared'])
+        self.assertEqual(sorted(BaseConsumer.get_rpc_methods()), ['overridden', 'shared'])
+
+        table = registry.get_table(ChildConsumer, 'websocket')
+        self.assertEqual(table.methods['shared'].func(), 'base')
+        self.assertEqual(table.methods['overridden'].func(), 'child')
+        self.assertNotIn('overridden', registry.get_table(BaseConsumer, 'http').methods)
+        # the tables are built once, and frozen
+        self.assertIs(registry.get_table(ChildConsumer, 'websocket'), table)
+        if sys.version_info >= (3, 3):
+            with self.assertRaises(TypeError):
+                table.methods['added'] = shared
+
+        # methods registered afterwards are dispatched
+        @BaseConsumer.rpc_notification()
+        def added():
+            return None
+
+        self.assertIsNot(registry.get_table(ChildConsumer, 'websocket'), table)
+        self.assertIn('added', registry.get_table(ChildConsumer, 'websocket').notifications)
+        self.assertEqual(ChildConsumer.get_rpc_notifications(), ['added'])
+
+    def test_dispatch(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def registered_late(value):
+            return value
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"registered_late", "params":[3]}')
+        self.assertEqual(client.receive()['result'], 3)
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method('registered_late', websocket=False)
+        def registered_late_http(value):
+            return value
+
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"registered_late", "params":[3]}')
+        self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.METHOD_NOT_FOUND)
+
+    def test_options_per_class(self):
+
+        class WebsocketOnlyConsumer(JsonRpcConsumerTest):
+            pass
+
+        class OtherConsumer(JsonRpcConsumerTest):
+            pass
+
+        def shared_function():
+            return True
+
+        # the options of the first registration are not overwritten by the second one
+        WebsocketOnlyConsumer.rpc_method('shared_function', http=False)(shared_function)
+        OtherConsumer.rpc_method('shared_function')(shared_function)
+        self.assertNotIn('shared_function', registry.get_table(WebsocketOnlyConsumer, 'http').methods)
+        self.assertIn('shared_function', registry.get_table(OtherConsumer, 'http').methods)
+        self.assertFalse(hasattr(shared_function, 'options'))
+
+    def test_available_rpc_methods(self):
+
+        class DeprecatedConsumer(JsonRpcConsumerTest):
+            pass
+
+        @DeprecatedConsumer.rpc_method()
+        def listed():
+            return True
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(DeprecatedConsumer.available_rpc_methods, {id(DeprecatedConsumer): {'listed': listed}})
+            self.assertEqual(DeprecatedConsumer.available_rpc_notifications, {id(DeprecatedConsumer): {}})
+        self.assertEqual([w.category for w in caught], [DeprecationWarning, DeprecationWarning])
+
+
+def process_id():
+    return os.getpid()
+
+
+def process_sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def process_with_message(value, original_message):
+    return value
+
+
+def process_with_kwargs(value, **kwargs):
+    return value
+
+
+class TestsProcessPool(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsProcessPool, self).setUp()
+        MyJsonRpcWebsocketConsumerTest.process_executor = ProcessPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.process_executor.shutdown(wait=False)
+        MyJsonRpcWebsocketConsumerTest.process_executor = None
+        MyJsonRpcWebsocketConsumerTest.process_timeout = None
+        super(TestsProcessPool, self).tearDown()
+
+    def test_process_method(self):
+        MyJsonRpcWebsocketConsumerTest.rpc_method(executor='process')(process_id)
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"process_id", "params":[]}')
+        pid = client.receive()['result']
+        self.assertNotEqual(pid, os.getpid())
+
+        response = http_request(client, b'{"id":2, "jsonrpc":"2.0", "method":"process_id", "params":{}}')
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['result'], pid)
+
+    def test_timeout(self):
+        MyJsonRpcWebsocketConsumerTest.rpc_method(executor='process')(process_sleep)
+        MyJsonRpcWebsocketConsumerTest.process_timeout = 0.1
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"process_sleep", "params":[0.5]}')
+        msg = client.receive()
+        self.assertEqual(msg['id'], 1)
+        self.assertEqual(msg['error']['code'], JsonRpcConsumerTest.EXECUTION_TIMEOUT)
+        self.assertEqual(msg['error']['data'], {'timeout': 0.1})
+
+        response = http_request(client, b'{"id":2, "jsonrpc":"2.0", "method":"process_sleep", "params":[0.5]}')
+        self.assertEqual(response['status'], 504)
+
+    def test_invalid_executor(self):
+        with self.assertRaises(ValueError):
+            MyJsonRpcWebsocketConsumerTest.rpc_method(executor='thread')(process_id)
+
+    def test_original_message(self):
+        # the message can't be sent to the pool processes
+        for function in (process_with_message, process_with_kwargs):
+            with self.assertRaises(ValueError):
+                MyJsonRpcWebsocketConsumerTest.rpc_method(executor='process')(function)
+            with self.assertRaises(ValueError):
+                MyJsonRpcWebsocketConsumerTest.rpc_notification(executor='process')(function)
+        self.assertNotIn('process_with_message', MyJsonRpcWebsocketConsumerTest.get_rpc_methods())
+
+
+class TestsTimeouts(ChannelTestCase):
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.call_timeout = None
+        MyJsonRpcWebsocketConsumerTest.metrics = None
+        super(TestsTimeouts, self).tearDown()
+
+    def test_method_timeout(self):
+        steps = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(timeout=0.1)
+        def slow_steps():
+            for step in range(50):
+                check_timeout()
+                steps.append(step)
+                time.sleep(0.02)
+            return len(steps)
+
+        MyJsonRpcWebsocketConsumerTest.metrics = MetricsRegistry()
+        client = HttpClient()
+        start = time.time()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"slow_steps", "params":[]}')
+        msg = client.receive()
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(msg['id'], 1)
+        self.assertEqual(msg['error']['code'], JsonRpcConsumerTest.EXECUTION_TIMEOUT)
+        self.assertEqual(msg['error']['data'], {'timeout': 0.1})
+        self.assertEqual(MyJsonRpcWebsocketConsumerTest.get_metrics().methods['slow_steps'].timeouts, 1)
+        self.assertIn('jsonrpc_timeouts_total', MyJsonRpcWebsocketConsumerTest.metrics.render_prometheus())
+
+        # the method stopped at its next check
+        time.sleep(0.1)
+        count = len(steps)
+        time.sleep(0.1)
+        self.assertEqual(len(steps), count)
+        self.assertLess(count, 50)
+
+        response = http_request(client, b'{"id":2, "jsonrpc":"2.0", "method":"slow_steps", "params":[]}')
+        self.assertEqual(response['status'], 504)
+
+    def test_default_timeout(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def sleeping(seconds, **kwargs):
+            time.sleep(seconds)
+            return kwargs['original_message'].channel.name
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(timeout=1)
+        def sleeping_longer(seconds):
+            time.sleep(seconds)
+            return seconds
+
+        MyJsonRpcWebsocketConsumerTest.call_timeout = 0.05
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"sleeping", "params":[0]}')
+        self.assertEqual(client.receive()['result'], 'websocket.receive')
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"sleeping", "params":[0.2]}')
+        self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.EXECUTION_TIMEOUT)
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"sleeping_longer", "params":[0.1]}')
+        self.assertEqual(client.receive()['result'], 0.1)
+
+    def test_busy_threads(self):
+        release = threading.Event()
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(timeout=0.1)
+        def hung():
+            release.wait(5)
+            return True
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(timeout=0.5)
+        def fast():
+            return True
+
+        executor = MyJsonRpcWebsocketConsumerTest._get_timeout_executor()
+        client = HttpClient()
+        try:
+            # the timed out calls keep their threads
+            for _i in range(executor.max_workers):
+                client.send_and_consume(u'websocket.receive',
+                                        text='{"id":1, "jsonrpc":"2.0", "method":"hung", "params":[]}')
+                self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.EXECUTION_TIMEOUT)
+
+            # a call that can't start doesn't time out
+            start = time.time()
+            client.send_and_consume(u'websocket.receive',
+                                    text='{"id":2, "jsonrpc":"2.0", "method":"fast", "params":[]}')
+            self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.SERVER_BUSY)
+            self.assertLess(time.time() - start, 0.5)
+            response = http_request(client, b'{"id":3, "jsonrpc":"2.0", "method":"fast", "params":[]}')
+            self.assertEqual(response['status'], 503)
+        finally:
+            release.set()
+
+        for _i in range(50):
+            if not executor.busy:
+                break
+            time.sleep(0.01)
+        client.send_and_consume(u'websocket.receive', text='{"id":4, "jsonrpc":"2.0", "method":"fast", "params":[]}')
+        self.assertEqual(client.receive()['result'], True)
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self, level=logging.DEBUG):
+        super(RecordingHandler, self).__init__(level)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.format(record)
+
+
+class TestsRequestLog(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsRequestLog, self).setUp()
+        self.logger = logging.getLogger('channels_jsonrpc.jsonrpcconsumer')
+        self.level = self.logger.level
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+        MyJsonRpcWebsocketConsumerTest.log_sample = 1
+        super(TestsRequestLog, self).tearDown()
+
+    def test_sampling(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def logged(value):
+            return value * 2
+
+        MyJsonRpcWebsocketConsumerTest.log_sample = 3
+        client = HttpClient()
+        with override_settings(DEBUG=True):
+            for value in range(6):
+                client.send_and_consume(u'websocket.receive',
+                                        text=json.dumps({"id": value, "jsonrpc": "2.0", "method": "logged",
+                                                         "params": [value]}))
+                self.assertEqual(client.receive()['result'], value * 2)
+
+        records = [record for record in self.handler.records if getattr(record, 'rpc_method', None) == 'logged']
+        self.assertEqual([record.rpc_id for record in records], [0, 3])
+        self.assertEqual(records[1].getMessage(), 'Executed logged([3]): 6')
+
+    def test_cached_and_failed_calls(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True)
+        def logged_cached(value):
+            if value < 0:
+                raise ValueError('negative')
+            return {'value': value}
+
+        client = HttpClient()
+        with override_settings(DEBUG=True):
+            for value in (1, 1, -1):
+                client.send_and_consume(u'websocket.receive',
+                                        text=json.dumps({"id": value, "jsonrpc": "2.0", "method": "logged_cached",
+                                                         "params": [value]}))
+                client.receive()
+
+        # the cached result is logged as the executed one
+        records = [record for record in self.handler.records
+                   if getattr(record, 'rpc_method', None) == 'logged_cached']
+        self.assertEqual([json.loads(str(record.rpc_result)) for record in records[:2]],
+                         [{'value': 1}, {'value': 1}])
+        self.assertEqual(json.loads(str(records[2].rpc_params)), [-1])
+        self.assertEqual(json.loads(str(records[2].rpc_error))['code'], JsonRpcConsumerTest.GENERIC_APPLICATION_ERROR)
+        self.assertTrue(records[2].getMessage().startswith('Failed logged_cached([-1]): '))
+
+    def test_disabled(self):
+        with override_settings(DEBUG=False):
+            self.assertFalse(MyJsonRpcWebsocketConsumerTest._get_request_log().enabled)
+        with override_settings(DEBUG=True):
+            self.assertTrue(MyJsonRpcWebsocketConsumerTest._get_request_log().enabled)
+            self.logger.setLevel(logging.INFO)
+            # the level is captured when the log is set up
+            self.assertTrue(MyJsonRpcWebsocketConsumerTest._get_request_log().enabled)
+
+    def test_lazy_payloads(self):
+        encoded = []
+
+        def encode(value):
+            encoded.append(value)
+            return json.dumps(value)
+
+        self.handler.setLevel(logging.INFO)
+        request_log = RequestLog(self.logger, True, encode=encode)
+        request_log.call({'method': 'lazy', 'id': 1}, [1], 2)
+        self.assertEqual(encoded, [])
+
+        self.handler.setLevel(logging.DEBUG)
+        request_log.call({'method': 'lazy', 'id': 1}, [1], 2)
+        self.assertEqual(encoded, [[1], 2])
+
+
+class TestsParamsValidation(ChannelTestCase):
+
+    def call(self, client, method, params):
+        client.send_and_consume(u'websocket.receive',
+                                text=json.dumps({"id": 1, "jsonrpc": "2.0", "method": method, "params": params}))
+        return client.receive()
+
+    def test_params_schema(self):
+        calls = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(params_schema={
+            'name': {'type': 'string', 'minLength': 1},
+            'count': int,
+            'tags': {'type': 'array', 'items': {'enum': ['a', 'b']}},
+        })
+        def validated(name, count=1, tags=None):
+            calls.append(name)
+            return name * count
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, 'validated', ['x', 2])['result'], 'xx')
+        self.assertEqual(self.call(client, 'validated', {'name': 'y', 'tags': ['a']})['result'], 'y')
+
+        for params, message in (([], 'missing param name'),
+                                (['x', 1, None, 4], 'expected at most 3 params, got 4'),
+                                ([''], 'name must have at least 1 characters'),
+                                (['x', '2'], 'count must be of type integer'),
+                                (['x', True], 'count must be of type integer'),
+                                ({'name': 'x', 'tags': ['c']}, "tags[0] must be one of 'a', 'b'"),
+                                ({'name': 'x', 'size': 3}, 'unexpected param size')):
+            msg = self.call(client, 'validated', params)
+            self.assertEqual(msg['error']['code'], JsonRpcConsumerTest.INVALID_PARAMS)
+            self.assertEqual(msg['error']['data'], message)
+        # the function isn't called with invalid params
+        self.assertEqual(calls, ['x', 'y'])
+
+        with self.assertRaises(ValueError):
+            MyJsonRpcWebsocketConsumerTest.rpc_method(params_schema={'size': int})(validated)
+
+    @skipIf(sys.version_info < (3, 0), "annotations are Python 3 only")
+    def test_annotations(self):
+
+        def annotated(value, ratio=1.0, **kwargs):
+            return value * ratio
+        annotated.__annotations__ = {'value': int, 'ratio': float, 'return': float}
+        MyJsonRpcWebsocketConsumerTest.rpc_method(validate=True)(annotated)
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, 'annotated', [2, 2])['result'], 4)
+        self.assertEqual(self.call(client, 'annotated', {'value': 2, 'other': None})['result'], 2)
+        self.assertEqual(self.call(client, 'annotated', ['2'])['error']['data'], 'value must be of type integer')
+
+    def test_compile_schema(self):
+        check = compile_schema({'type': 'object', 'required': ['id'], 'additionalProperties': False,
+                                'properties': {'id': {'type': 'integer', 'minimum': 1},
+                                               'ratio': {'type': ['number', 'null'], 'maximum': 1}}})
+        check({'id': 1, 'ratio': 0.5}, 'item')
+        check({'id': 1, 'ratio': None}, 'item')
+        for value, message in (([], 'item must be of type object'),
+                               ({}, 'item.id is required'),
+                               ({'id': 0}, 'item.id must be at least 1'),
+                               ({'id': 1, 'ratio': 2}, 'item.ratio must be at most 1'),
+                               ({'id': 1, 'size': 2}, 'item.size is not allowed')):
+            with self.assertRaises(InvalidParams) as context:
+                check(value, 'item')
+            self.assertEqual(str(context.exception), message)
+
+
+@skipIf(msgpack is None, "msgpack is not installed")
+class TestsBinaryFrames(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsBinaryFrames, self).setUp()
+        MyJsonRpcWebsocketConsumerTest.binary_codec = 'msgpack'
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.binary_codec = None
+        super(TestsBinaryFrames, self).tearDown()
+
+    def call(self, client, data):
+        client.send_and_consume(u'websocket.receive', {'bytes': msgpack.packb(data)})
+        return msgpack.unpackb(client.receive(json=False)['bytes'], raw=False)
+
+    def test_msgpack(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def scaled(values, factor):
+            return [value * factor for value in values]
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, {"id": 1, "jsonrpc": "2.0", "method": "scaled",
+                                            "params": [[1, 2.5], 2]}),
+                         {"id": 1, "jsonrpc": "2.0", "result": [2, 5.0]})
+        self.assertEqual(self.call(client, [{"id": 1, "jsonrpc": "2.0", "method": "scaled", "params": [[1], 3]},
+                                            {"jsonrpc": "2.0", "method": "scaled", "params": [[1], 3]}]),
+                         [{"id": 1, "jsonrpc": "2.0", "result": [3]}])
+
+        # text frames are still answered in JSON
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":2, "jsonrpc":"2.0", "method":"scaled", "params":[[1], 1]}')
+        self.assertEqual(client.receive()['result'], [1])
+
+        client.send_and_consume(u'websocket.receive', {'bytes': b'\xc1'})
+        msg = msgpack.unpackb(client.receive(json=False)['bytes'], raw=False)
+        self.assertEqual(msg['error']['code'], JsonRpcConsumerTest.PARSE_ERROR)
+
+    def test_cached_and_streamed_results(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True)
+        def binary_cached(value):
+            return {'value': value}
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def binary_streamed(count):
+            return iter(range(count))
+
+        client = HttpClient()
+        for _ in range(2):
+            self.assertEqual(self.call(client, {"id": 1, "jsonrpc": "2.0", "method": "binary_cached",
+                                                "params": [1]})['result'], {'value': 1})
+
+        client.send_and_consume(u'websocket.receive',
+                                {'bytes': msgpack.packb({"id": 2, "jsonrpc": "2.0", "method": "binary_streamed",
+                                                         "params": [3]})})
+        frames = [msgpack.unpackb(client.receive(json=False)['bytes'], raw=False) for _ in range(2)]
+        self.assertEqual(frames[0]['params'], {'id': 2, 'items': [0, 1, 2]})
+        self.assertEqual(frames[1]['result'], {'count': 3})
+
+    def test_binary_notification(self):
+        client = HttpClient()
+        MyJsonRpcWebsocketConsumerTest.prepare_notification('update', [1.5], binary=True) \
+            .send_to_channel(client.reply_channel)
+        self.assertEqual(msgpack.unpackb(client.receive(json=False)['bytes'], raw=False),
+                         {'jsonrpc': '2.0', 'method': 'update', 'params': [1.5]})
+
+    def test_without_codec(self):
+        MyJsonRpcWebsocketConsumerTest.binary_codec = None
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive', {'bytes': b'\x81\xa2id\x01'})
+        self.assertEqual(client.receive()['error']['code'], JsonRpcConsumerTest.INVALID_REQUEST)
+
+    def test_codec_class(self):
+
+        class IncompleteCodec(BinaryCodec):
+
+            def loads(self, data):
+                return json.loads(bytes(data).decode('utf-8'))
+
+        # dumps() isn't implemented
+        with self.assertRaises(TypeError):
+            get_binary_codec(IncompleteCodec)
+
+        class JsonBytesCodec(IncompleteCodec):
+
+            def dumps(self, obj):
+                return json.dumps(obj).encode('utf-8')
+
+        self.assertEqual(get_binary_codec(JsonBytesCodec).dumps([1]), b'[1]')
+
+    @skipIf(cbor2 is None, "cbor2 is not installed")
+    def test_cbor(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def cbor_echo(value):
+            return value
+
+        MyJsonRpcWebsocketConsumerTest.binary_codec = 'cbor'
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                {'bytes': cbor2.dumps({"id": 1, "jsonrpc": "2.0", "method": "cbor_echo",
+                                                       "params": [[1, 2]]})})
+        self.assertEqual(cbor2.loads(client.receive(json=False)['bytes'])['result'], [1, 2])
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class TestsCompression(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsCompression, self).setUp()
+        MyJsonRpcWebsocketConsumerTest.http_compression = True
+        MyJsonRpcWebsocketConsumerTest.compression_min_size = 100
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.http_compression = None
+        MyJsonRpcWebsocketConsumerTest.compression_min_size = 1024
+        MyJsonRpcWebsocketConsumerTest.websocket_compression_min_size = None
+        MyJsonRpcWebsocketConsumerTest.metrics = None
+        super(TestsCompression, self).tearDown()
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip, deflate', ('zstd', 'br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('br;q=0.5, gzip;q=0.8', ('br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('*', ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate('gzip;q=0, identity', ('gzip', )), None)
+        self.assertEqual(negotiate('', ('gzip', )), None)
+
+    def test_http(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def compressed_rows(count):
+            return [{'row': i} for i in range(count)]
+
+        client = HttpClient()
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"compressed_rows", "params":[50]}'
+        response = http_request(client, body, headers={'accept-encoding': b'gzip, deflate'})
+        headers = dict(response['headers'])
+        self.assertEqual(headers[b'Content-Encoding'], b'gzip')
+        self.assertEqual(headers[b'Vary'], b'Accept-Encoding')
+        self.assertEqual(int(headers[b'Content-Length']), len(response['content']))
+        self.assertEqual(json.loads(gunzip(response['content']).decode('utf-8'))['result'][49], {'row': 49})
+
+        # not accepted by the client
+        response = http_request(client, body)
+        self.assertNotIn(b'Content-Encoding', dict(response['headers']))
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['result'][49], {'row': 49})
+
+        # below the threshold
+        response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"compressed_rows", "params":[1]}',
+                                headers={'accept-encoding': b'gzip'})
+        self.assertNotIn(b'Content-Encoding', dict(response['headers']))
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['result'], [{'row': 0}])
+
+    def test_http_etag(self):
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(cache=True)
+        def compressed_cached(value):
+            return value * 20
+
+        client = HttpClient()
+        body = b'{"id":1, "jsonrpc":"2.0", "method":"compressed_cached", "params":["abcdef"]}'
+        response = http_request(client, body, headers={'accept-encoding': b'gzip'})
+        etag = dict(response['headers'])[b'ETag']
+        self.assertTrue(etag.startswith(b'W/'))
+
+        response = http_request(client, body, headers={'accept-encoding': b'gzip', 'if-none-match': etag})
+        self.assertEqual(response['status'], 304)
+
+    def test_websocket(self):
+        MyJsonRpcWebsocketConsumerTest.websocket_compression_min_size = 100
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method()
+        def compressed_text(length):
+            return 'x' * length
+
+        client = HttpClient()
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":1, "jsonrpc":"2.0", "method":"compressed_text", "params":[500]}')
+        data = client.receive(json=False)['bytes']
+        self.assertTrue(data.startswith(GZIP_MAGIC))
+        self.assertEqual(json.loads(gunzip(data).decode('utf-8'))['result'], 'x' * 500)
+
+        client.send_and_consume(u'websocket.receive',
+                                text='{"id":2, "jsonrpc":"2.0", "method":"compressed_text", "params":[5]}')
+        self.assertEqual(client.receive()['result'], 'xxxxx')
+
+    def test_group_notification(self):
+        from channels import Group
+
+        MyJsonRpcWebsocketConsumerTest.websocket_compression_min_size = 100
+        metrics = MyJsonRpcWebsocketConsumerTest.metrics = MetricsRegistry()
+        clients = [HttpClient(), HttpClient()]
+        for client in clients:
+            Group("compressed_group").add(client.reply_channel)
+
+        MyJsonRpcWebsocketConsumerTest.notify_group("compressed_group", "update", {"values": list(range(100))})
+        for client in clients:
+            msg = json.loads(gunzip(client.receive(json=False)['bytes']).decode('utf-8'))
+            self.assertEqual(msg['params']['values'][99], 99)
+
+        # compressed once for both clients
+        compression = MyJsonRpcWebsocketConsumerTest.get_metrics().compressions['gzip']
+        self.assertEqual(compression.duration.count, 1)
+        self.assertLess(compression.output_bytes, compression.input_bytes)
+        self.assertIn('jsonrpc_compression_output_bytes_total{', metrics.render_prometheus())
+
+
+class TestsCoalescing(ChannelTestCase):
+
+    def run_concurrently(self, target, count):
+        threads = [threading.Thread(target=target, args=(i, )) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+    def test_coalescer(self):
+        coalescer = Coalescer().bind('snapshot')
+        started = threading.Event()
+        release = threading.Event()
+        results = {}
+
+        def snapshot():
+            started.set()
+            release.wait(5)
+            return {'rows': [1, 2]}
+
+        def call(i):
+            if i:
+                started.wait(5)
+            results[i] = coalescer.call(coalescer.make_key([1]), snapshot)
+
+        def release_when_waiting(_i):
+            while coalescer.coalesced < 4:
+                time.sleep(0.001)
+            release.set()
+
+        self.run_concurrently(lambda i: call(i) if i < 5 else release_when_waiting(i), 6)
+        self.assertEqual(results, dict((i, {'rows': [1, 2]}) for i in range(5)))
+        self.assertEqual(coalescer.stats(), {'executions': 1, 'coalesced': 4})
+
+        # nothing is kept once the execution is over
+        coalescer.call(coalescer.make_key([1]), snapshot)
+        self.assertEqual(coalescer.stats(), {'executions': 2, 'coalesced': 4})
+
+    def test_consumer(self):
+        executions = []
+        started = threading.Event()
+
+        # on a consumer without sessions, which sqlite can't save from concurrent threads
+        @DjangoJsonRpcWebsocketConsumerTest.rpc_method(coalesce=True)
+        def get_snapshot(dashboard):
+            executions.append(dashboard)
+            started.set()
+            time.sleep(0.1)
+            if dashboard == 'missing':
+                raise JsonRpcException(1, JsonRpcConsumerTest.INVALID_PARAMS)
+            return {'dashboard': dashboard}
+
+        def call(i):
+            if i:
+                started.wait(5)
+            client = HttpClient()
+            client.send_and_consume(u'websocket.receive', text=json.dumps(
+                {"id": i + 1, "jsonrpc": "2.0", "method": "get_snapshot", "params": [dashboard]}), path='/django/')
+            responses[i] = client.receive()
+
+        for dashboard in ('main', 'missing'):
+            del executions[:]
+            started.clear()
+            responses = {}
+            self.run_concurrently(call, 3)
+            self.assertEqual(executions, [dashboard])
+            for i in range(3):
+                # each caller gets its own id
+                self.assertEqual(responses[i]['id'], i + 1)
+            if dashboard == 'main':
+                self.assertEqual(responses[2]['result'], {'dashboard': 'main'})
+            else:
+                self.assertEqual(responses[2]['error']['code'], JsonRpcConsumerTest.INVALID_PARAMS)
+
+    def test_django_backend(self):
+        # one coalescer per worker
+        workers = [Coalescer(backend='django', poll_interval=0.001).bind('shared_snapshot') for _ in range(3)]
+        started = threading.Event()
+        executions = []
+        results = {}
+
+        def snapshot():
+            executions.append(1)
+            started.set()
+            time.sleep(0.05)
+            return [1, 2, 3]
+
+        def call(i):
+            if i:
+                started.wait(5)
+            results[i] = workers[i].call(workers[i].make_key({'id': 1}), snapshot)
+
+        self.run_concurrently(call, 3)
+        self.assertEqual(results, {0: [1, 2, 3], 1: [1, 2, 3], 2: [1, 2, 3]})
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(sum(worker.coalesced for worker in workers), 2)
+
+        # the methods with the same name on other consumers are not coalesced with these calls
+        for consumer_class in (MyJsonRpcWebsocketConsumerTest, DjangoJsonRpcWebsocketConsumerTest):
+            consumer_class.rpc_method('shared_snapshot', coalesce='django')(snapshot)
+        self.assertEqual(
+            [registry.get_methods(consumer_class)['shared_snapshot'].options['coalesce'].backend.namespace
+             for consumer_class in (MyJsonRpcWebsocketConsumerTest, DjangoJsonRpcWebsocketConsumerTest)],
+            ['django_example.consumer.MyJsonRpcWebsocketConsumerTest:shared_snapshot',
+             'django_example.consumer.DjangoJsonRpcWebsocketConsumerTest:shared_snapshot'])
+
+    def test_django_backend_failure(self):
+        workers = [Coalescer(backend='django', poll_interval=0.001).bind('failing_snapshot') for _ in range(2)]
+        started = threading.Event()
+        executions = []
+        results = {}
+
+        def snapshot():
+            executions.append(1)
+            started.set()
+            time.sleep(0.05)
+            if len(executions) == 1:
+                raise ValueError('failed')
+            return 'ok'
+
+        def call(i):
+            if i:
+                started.wait(5)
+            try:
+                results[i] = workers[i].call(workers[i].make_key([]), snapshot)
+            except ValueError as e:
+                results[i] = str(e)
+
+        self.run_concurrently(call, 2)
+        # the waiting worker executes the call itself
+        self.assertEqual(results, {0: 'failed', 1: 'ok'})
+
+
+class SubscriptionsConsumerTest(JsonRpcConsumerTest):
+    pass
+
+
+class TestsSubscriptions(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsSubscriptions, self).setUp()
+        self.manager = SubscriptionsConsumerTest.enable_subscriptions(
+            {'history': 2, 'authorize': lambda topic, message: not topic.startswith('private.')})
+        self.routes = apply_routes([SubscriptionsConsumerTest.as_route(path=r"")])
+        self.routes.enter()
+
+    def tearDown(self):
+        self.routes.exit()
+        SubscriptionsConsumerTest.clean()
+        SubscriptionsConsumerTest.subscriptions = None
+        super(TestsSubscriptions, self).tearDown()
+
+    def call(self, client, method, params):
+        client.send_and_consume(u'websocket.receive', text=json.dumps(
+            {"id": 1, "jsonrpc": "2.0", "method": method, "params": params}))
+        return client.receive()
+
+    def test_updates(self):
+        client = HttpClient()
+        self.assertEqual(self.call(client, 'subscribe', ['prices'])['result'],
+                         {'topic': 'prices', 'version': 0, 'state': None})
+
+        self.assertEqual(SubscriptionsConsumerTest.publish('prices', {'EUR': 1.08, 'USD': 1}), 1)
+        update = client.receive()
+        self.assertEqual(update['method'], 'subscription.update')
+        self.assertEqual(update['params'], {'topic': 'prices', 'version': 1, 'state': {'EUR': 1.08, 'USD': 1}})
+        state = update['params']['state']
+
+        prices = {'EUR': 1.09, 'USD': 1, 'GBP': 0.79}
+        SubscriptionsConsumerTest.publish('prices', prices)
+        update = client.receive()
+        self.assertEqual(update['params']['version'], 2)
+        self.assertEqual(update['params']['patch'], [{'op': 'replace', 'path': '/EUR', 'value': 1.09},
+                                                     {'op': 'add', 'path': '/GBP', 'value': 0.79}])
+        self.assertEqual(apply_patch(state, update['params']['patch']), prices)
+
+        # the published state is copied
+        prices['EUR'] = 1.1
+        SubscriptionsConsumerTest.publish('prices', prices)
+        self.assertEqual(client.receive()['params']['patch'], [{'op': 'replace', 'path': '/EUR', 'value': 1.1}])
+
+        # publishing the same state again notifies nothing
+        self.assertEqual(SubscriptionsConsumerTest.publish('prices', prices), 3)
+        self.assertEqual(client.receive(), None)
+
+    def test_resync(self):
+        client = HttpClient()
+        self.call(client, 'subscribe', ['scores'])
+        for version in range(1, 5):
+            SubscriptionsConsumerTest.publish('scores', {'home': version, 'away': 0})
+            client.receive()
+
+        # the patches since the version of the client are in the history
+        result = self.call(client, 'subscribe', ['scores', 3])['result']
+        self.assertEqual(result, {'topic': 'scores', 'version': 4,
+                                  'patch': [{'op': 'replace', 'path': '/home', 'value': 4}]})
+        result = self.call(client, 'subscribe', {'topic': 'scores', 'version': 4})['result']
+        self.assertEqual(result, {'topic': 'scores', 'version': 4, 'patch': []})
+
+        # too far behind
+        result = self.call(client, 'subscribe', ['scores', 1])['result']
+        self.assertEqual(result, {'topic': 'scores', 'version': 4, 'state': {'home': 4, 'away': 0}})
+
+        # versions are numbers of versions
+        for version in ('3', 3.5, True, -1, [3]):
+            response = self.call(client, 'subscribe', ['scores', version])
+            self.assertEqual(response['error']['code'], JsonRpcConsumerTest.INVALID_PARAMS)
+        self.assertIn('state', self.call(client, 'subscribe', {'topic': 'scores', 'version': None})['result'])
+
+    def test_unsubscribe_and_disconnect(self):
+        client = HttpClient()
+        client2 = HttpClient()
+        for topic in ('news', 'weather'):
+            self.call(client, 'subscribe', [topic])
+        self.call(client2, 'subscribe', ['news'])
+
+        self.assertEqual(self.call(client, 'unsubscribe', ['weather'])['result'], True)
+        SubscriptionsConsumerTest.publish('weather', 'sunny')
+        self.assertEqual(client.receive(), None)
+
+        client.send_and_consume(u'websocket.disconnect', {'code': 1000})
+        self.assertEqual(self.manager.backend.pop_subscriptions(client.reply_channel), set())
+        SubscriptionsConsumerTest.publish('news', ['headline'])
+        self.assertEqual(client.receive(), None)
+        self.assertEqual(client2.receive()['params']['state'], ['headline'])
+
+    def test_invalid_topics(self):
+        client = HttpClient()
+        for topic in ('private.accounts', 'spaces are invalid', 12):
+            response = self.call(client, 'subscribe', [topic])
+            self.assertEqual(response['error']['code'], JsonRpcConsumerTest.GENERIC_APPLICATION_ERROR)
+
+        # subscriptions are WebSocket only
+        response = http_request(client, b'{"id":1, "jsonrpc":"2.0", "method":"subscribe", "params":["news"]}')
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['error']['code'],
+                         JsonRpcConsumerTest.METHOD_NOT_FOUND)
+
+    def test_consumers_with_the_same_name(self):
+
+        class SubscriptionsConsumerTest(JsonRpcConsumerTest):
+            pass
+
+        other_manager = SubscriptionsConsumerTest.enable_subscriptions('django')
+        self.assertEqual(other_manager.backend.namespace,
+                         'django_example.tests.TestsSubscriptions.test_consumers_with_the_same_name.<locals>.'
+                         'SubscriptionsConsumerTest')
+        self.assertNotEqual(other_manager.group_prefix, self.manager.group_prefix)
+
+        client = HttpClient()
+        self.call(client, 'subscribe', ['prices'])
+        # the topic of the other consumer is another topic
+        self.assertEqual(SubscriptionsConsumerTest.publish('prices', {'EUR': 1}), 1)
+        self.assertEqual(client.receive(), None)
+        self.assertEqual(globals()['SubscriptionsConsumerTest'].publish('prices', {'EUR': 2}), 1)
+        self.assertEqual(client.receive()['params']['state'], {'EUR': 2})
+
+
+class TestsNotificationBuffer(ChannelTestCase):
+
+    def tearDown(self):
+        MyJsonRpcWebsocketConsumerTest.notification_buffer = None
+        super(TestsNotificationBuffer, self).tearDown()
+
+    def test_window(self):
+        from channels import Group
+
+        MyJsonRpcWebsocketConsumerTest.notification_buffer = 0.01
+        client = HttpClient()
+        Group("buffered_group").add(client.reply_channel)
+        for i in range(3):
+            MyJsonRpcWebsocketConsumerTest.notify_group("buffered_group", "tick", [i])
+        self.assertEqual(client.receive(), None)
+
+        time.sleep(0.1)
+        self.assertEqual(client.receive(), [{u'jsonrpc': u'2.0', u'method': u'tick', u'params': [i]}
+                                            for i in range(3)])
+
+        # a single notification isn't wrapped in a batch
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "tick", [3])
+        time.sleep(0.1)
+        self.assertEqual(client.receive(), {u'jsonrpc': u'2.0', u'method': u'tick', u'params': [3]})
+
+    def test_max_items_and_collapse(self):
+        MyJsonRpcWebsocketConsumerTest.notification_buffer = {'window': 60, 'max_items': 4}
+        client = HttpClient()
+        for price in (1, 2, 3):
+            MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "price", {"EUR": price}, key="EUR")
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "price", {"USD": 1}, key="USD")
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "trade", [1])
+        # superseded notifications don't count
+        self.assertEqual(client.receive(), None)
+
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "trade", [2])
+        self.assertEqual([(msg['method'], msg['params']) for msg in client.receive()],
+                         [('price', {'EUR': 3}), ('price', {'USD': 1}), ('trade', [1]), ('trade', [2])])
+
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "trade", [3])
+        MyJsonRpcWebsocketConsumerTest.flush_notifications()
+        self.assertEqual(client.receive()['params'], [3])
+        stats = MyJsonRpcWebsocketConsumerTest._get_notification_buffer().stats()
+        self.assertEqual(stats, {'notifications': 7, 'collapsed': 2, 'messages': 2})
+
+    def test_notify_groups(self):
+        from channels import Group
+
+        MyJsonRpcWebsocketConsumerTest.notification_buffer = 60
+        clients = [HttpClient() for _ in range(3)]
+        for i, client in enumerate(clients):
+            Group("buffered_group_%s" % i).add(client.reply_channel)
+        codec = MyJsonRpcWebsocketConsumerTest._get_codec()
+        dumps = codec.dumps
+        encoded = []
+        codec.dumps = lambda obj: encoded.append(obj) or dumps(obj)
+        try:
+            MyJsonRpcWebsocketConsumerTest.notify_groups(["buffered_group_%s" % i for i in range(3)], "tick", [1])
+            MyJsonRpcWebsocketConsumerTest.notify_groups(["buffered_group_0"], "tick", [2])
+            MyJsonRpcWebsocketConsumerTest.flush_notifications()
+        finally:
+            del codec.dumps
+
+        # each notification is encoded once, and the batch is assembled from the encoded notifications
+        self.assertEqual(len(encoded), 2)
+        self.assertEqual([msg['params'] for msg in clients[0].receive()], [[1], [2]])
+        for client in clients[1:]:
+            self.assertEqual(client.receive()['params'], [1])
+
+    def test_stale_deadlines(self):
+        MyJsonRpcWebsocketConsumerTest.notification_buffer = 0.2
+        client = HttpClient()
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "tick", [1])
+        MyJsonRpcWebsocketConsumerTest.flush_notifications()
+        self.assertEqual(client.receive()['params'], [1])
+
+        # the batch created after the flush waits for its own window, not the one of the flushed batch
+        time.sleep(0.1)
+        MyJsonRpcWebsocketConsumerTest.notify_channel(client.reply_channel, "tick", [2])
+        time.sleep(0.15)
+        self.assertEqual(client.receive(), None)
+        time.sleep(0.2)
+        self.assertEqual(client.receive()['params'], [2])
+
+
+class TestsIdempotency(ChannelTestCase):
+
+    def call(self, client, request):
+        client.send_and_consume(u'websocket.receive', text=json.dumps(dict(request, jsonrpc="2.0")))
+        return client.receive()
+
+    def test_replay(self):
+        orders = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(idempotent=True)
+        def create_order(item):
+            orders.append(item)
+            return len(orders)
+
+        client = HttpClient()
+        request = {"id": "a1", "method": "create_order", "params": ["book"]}
+        self.assertEqual(self.call(client, request), {u'jsonrpc': u'2.0', u'id': u'a1', u'result': 1})
+        self.assertEqual(self.call(client, request), {u'jsonrpc': u'2.0', u'id': u'a1', u'result': 1})
+        self.assertEqual(orders, ['book'])
+
+        # a reused id with other params is a new call
+        self.assertEqual(self.call(client, dict(request, params=["pen"]))['result'], 2)
+
+        # explicit keys, whatever the id
+        request = {"method": "create_order", "params": ["cup"], "idempotency_key": "k1"}
+        self.assertEqual(self.call(client, dict(request, id=1))['result'], 3)
+        self.assertEqual(self.call(client, dict(request, id=2)), {u'jsonrpc': u'2.0', u'id': 2, u'result': 3})
+
+        # a retry with an explicit key is replayed on a new connection
+        self.assertEqual(self.call(HttpClient(), dict(request, id=3)), {u'jsonrpc': u'2.0', u'id': 3, u'result': 3})
+        # keys derived from the id are scoped to the connection, as clients reuse ids
+        self.assertEqual(self.call(HttpClient(), {"id": "a1", "method": "create_order", "params": ["book"]})['result'],
+                         4)
+        self.assertEqual(orders, ['book', 'pen', 'cup', 'book'])
+        idempotency = registry.get_methods(MyJsonRpcWebsocketConsumerTest)['create_order'].options['idempotency']
+        self.assertEqual(idempotency.stats(), {'replays': 3, 'coalesced': 0})
+
+    def test_keys(self):
+
+        class User(object):
+            def __init__(self, pk):
+                self.pk = pk
+
+        class Message(object):
+            def __init__(self, user, reply_channel):
+                self.user = user
+                self.reply_channel = Channel(reply_channel)
+
+        store = IdempotencyStore().bind('keys')
+        request = {"id": 1, "params": [], "idempotency_key": "8c2d"}
+        # explicit keys are scoped to the authenticated user only
+        self.assertEqual(store.make_key(request, Message(None, 'daphne.response.a')),
+                         store.make_key(request, Message(None, 'daphne.response.b')))
+        self.assertNotEqual(store.make_key(request, Message(User(1), 'daphne.response.a')),
+                            store.make_key(request, Message(User(2), 'daphne.response.a')))
+        del request['idempotency_key']
+        self.assertNotEqual(store.make_key(request, Message(None, 'daphne.response.a')),
+                            store.make_key(request, Message(None, 'daphne.response.b')))
+        self.assertIsNone(IdempotencyStore(derived_ttl=0).bind('keys').make_key(request))
+
+    def test_derived_keys_expire(self):
+        store = IdempotencyStore(derived_ttl=0.05).bind('expiring')
+        executions = []
+
+        def execute():
+            executions.append(1)
+            return '"done"'
+
+        derived_key = store.make_key({"id": 1, "params": []})
+        explicit_key = store.make_key({"id": 1, "params": [], "idempotency_key": "e41a"})
+        for key in (derived_key, explicit_key, derived_key, explicit_key):
+            store.call(key, execute)
+        self.assertEqual(len(executions), 2)
+
+        time.sleep(0.1)
+        for key in (derived_key, explicit_key):
+            store.call(key, execute)
+        self.assertEqual(len(executions), 3)
+
+    def test_namespace(self):
+        for consumer_class in (MyJsonRpcWebsocketConsumerTest, DjangoJsonRpcWebsocketConsumerTest):
+            consumer_class.rpc_method('refund', idempotent={'backend': 'django'})(lambda amount: amount)
+        self.assertEqual(
+            [registry.get_methods(consumer_class)['refund'].options['idempotency'].backend.namespace
+             for consumer_class in (MyJsonRpcWebsocketConsumerTest, DjangoJsonRpcWebsocketConsumerTest)],
+            ['idempotency:django_example.consumer.MyJsonRpcWebsocketConsumerTest:refund',
+             'idempotency:django_example.consumer.DjangoJsonRpcWebsocketConsumerTest:refund'])
+
+    def test_errors_are_not_stored(self):
+        attempts = []
+
+        @MyJsonRpcWebsocketConsumerTest.rpc_method(idempotent={'ttl': 60, 'per_user': False})
+        def charge(amount):
+            attempts.append(amount)
+            if len(attempts) == 1:
+                raise ValueError('gateway unavailable')
+            return 'charged'
+
+        request = {"id": 1, "method": "charge", "params": [10], "idempotency_key": "6f1c"}
+        self.assertEqual(self.call(HttpClient(), request)['error']['code'],
+                         JsonRpcConsumerTest.GENERIC_APPLICATION_ERROR)
+        self.assertEqual(self.call(HttpClient(), request)['result'], 'charged')
+        # replayed on another connection
+        self.assertEqual(self.call(HttpClient(), dict(request, id=2)), {u'jsonrpc': u'2.0', u'id': 2,
+                                                                         u'result': u'charged'})
+        self.assertEqual(attempts, [10, 10])
+
+    def test_in_flight_duplicates(self):
+        store = IdempotencyStore(per_user=False).bind('transfer')
+        started = threading.Event()
+        executions = []
+        results = {}
+
+        def transfer():
+            executions.append(1)
+            started.set()
+            time.sleep(0.1)
+            return '"done"'
+
+        def call(i):
+            if i:
+                started.wait(5)
+            results[i] = store.call('key:"t1"', transfer)
+
+        threads = [threading.Thread(target=call, args=(i, )) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(executions, [1])
+        self.assertEqual(results, {0: '"done"', 1: '"done"', 2: '"done"'})
+        self.assertEqual(store.call('key:"t1"', transfer), '"done"')
+        self.assertEqual(store.stats(), {'replays': 1, 'coalesced': 2})
+
+
+class BillingConsumerTest(JsonRpcConsumerTest):
+    pass
+
+
+class UsersConsumerTest(JsonRpcConsumerTest):
+    pass
+
+
+class MultiplexerConsumerTest(JsonRpcConsumerTest):
+    mounts = {'billing': BillingConsumerTest, 'users': UsersConsumerTest}
+
+
+class TestsMultiplexer(ChannelTestCase):
+
+    def setUp(self):
+        super(TestsMultiplexer, self).setUp()
+        self.routes = apply_routes([MultiplexerConsumerTest.as_route(path=r"")])
+        self.routes.enter()
+
+        @BillingConsumerTest.rpc_method()
+        def charge(amount):
+            return 'charged %s' % amount
+
+        @UsersConsumerTest.rpc_method('get', http=False)
+        def get_user(pk):
+            return {'pk': pk}
+
+        @MultiplexerConsumerTest.rpc_method()
+        def ping():
+            return 'pong'
+
+    def tearDown(self):
+        self.routes.exit()
+        for consumer_class in (BillingConsumerTest, UsersConsumerTest, MultiplexerConsumerTest):
+            consumer_class.clean()
+        MultiplexerConsumerTest.mounts = {'billing': BillingConsumerTest, 'users': UsersConsumerTest}
+        super(TestsMultiplexer, self).tearDown()
+
+    def call(self, client, method, params, _id=1):
+        client.send_and_consume(u'websocket.receive', text=json.dumps(
+            {"id": _id, "jsonrpc": "2.0", "method": method, "params": params}))
+        return client.receive()
+
+    def test_dispatch(self):
+        client = HttpClient()
+        self.assertEqual(self.call(client, 'billing.charge', [10])['result'], 'charged 10')
+        self.assertEqual(self.call(client, 'users.get', [3])['result'], {'pk': 3})
+        self.assertEqual(self.call(client, 'ping', [])['result'], 'pong')
+        for method in ('charge', 'billing.get', 'shop.charge', 'billing.'):
+            self.assertEqual(self.call(client, method, [1])['error']['code'], JsonRpcConsumerTest.METHOD_NOT_FOUND)
+        self.assertEqual(sorted(MultiplexerConsumerTest.get_rpc_methods()), ['billing.charge', 'ping', 'users.get'])
+
+        # a batch spanning the mounted classes
+        client.send_and_consume(u'websocket.receive', text=json.dumps([
+            {"id": 1, "jsonrpc": "2.0", "method": "billing.charge", "params": [5]},
+            {"id": 2, "jsonrpc": "2.0", "method": "users.get", "params": {"pk": 7}}]))
+        self.assertEqual(client.receive(), [{u'jsonrpc': u'2.0', u'id': 1, u'result': u'charged 5'},
+                                            {u'jsonrpc': u'2.0', u'id': 2, u'result': {u'pk': 7}}])
+
+    def test_http(self):
+        client = HttpClient()
+        response = http_request(client, json.dumps(
+            {"id": 1, "jsonrpc": "2.0", "method": "billing.charge", "params": [10]}).encode('utf-8'))
+        self.assertEqual(json.loads(response['content'].decode('utf-8'))['result'], 'charged 10')
+        # the transports of the mounted methods are kept
+        response = http_request(client, json.dumps(
+            {"id": 1, "jsonrpc": "2.0", "method": "users.get", "params": [3]}).encode('utf-8'))
+        self.assertEqual(response['status'], 404)
+
+    def test_mount(self):
+        @UsersConsumerTest.rpc_method()
+        def rename(pk, name):
+            return name
+
+        client = HttpClient()
+        self.assertEqual(self.call(client, 'users.rename', [1, 'bob'])['result'], 'bob')
+
+        MultiplexerConsumerTest.mount('accounts', UsersConsumerTest)
+        self.assertEqual(self.call(client, 'accounts.rename', [1, 'al'])['result'], 'al')
+        self.assertEqual(self.call(client, 'users.rename', [1, 'bob'])['result'], 'bob')
+        self.assertIsNone(BillingConsumerTest.mounts)
+
+        with self.assertRaises(ValueError):
+            MultiplexerConsumerTest.mount('_private', BillingConsumerTest)
+        with self.assertRaises(ValueError):
+            BillingConsumerTest.mount('api', MultiplexerConsumerTest)
+
+    def test_subscriptions_of_mounted_classes(self):
+        manager = UsersConsumerTest.enable_subscriptions()
+        try:
+            client = HttpClient()
+            self.assertEqual(self.call(client, 'users.subscribe', ['presence'])['result']['version'], 0)
+            client.send_and_consume(u'websocket.disconnect')
+            self.assertEqual(manager.backend.pop_subscriptions(client.reply_channel), set())
+        finally:
+            UsersConsumerTest.subscriptions = None
@@ -12,7 +12,7 @@ setup(
     version='1.2.0',
     packages=find_packages(),
     install_requires=[
-          'channels', 'django-cors-headers'
+          'channels', 'django-cors-headers', 'futures; python_version < "3"'
       ],
     include_package_data=True,
     license='MIT License',